@@ -1,6 +1,5 @@
 import logging
 from contextlib import asynccontextmanager
-import httpx
 from fastapi import FastAPI, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
@@ -8,13 +7,30 @@ from fastapi.exceptions import RequestValidationError
 from config import settings
 from model import *
 from mongo import *
+from mongo import quota
+from mongo import counter
+from mongo import outbox
+from mongo import rejudge
+from mongo import retention
+from mongo.utils import is_testing
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.http_client = httpx.Client(timeout=httpx.Timeout(5.0, read=30.0))
+    workers = []
+    if not is_testing():
+        workers = [
+            quota.SubmitterFlusher(),
+            retention.OutputSweeper(),
+            outbox.OutboxConsumer(),
+            counter.CounterReconciler(),
+            rejudge.RejudgeResumer(),
+        ]
+        for worker in workers:
+            worker.start()
     yield
-    app.state.http_client.close()
+    for worker in workers:
+        worker.stop()
 
 
 def create_app() -> FastAPI:
@@ -59,6 +75,7 @@ def create_app() -> FastAPI:
     app.include_router(health_router, prefix='/health')
     app.include_router(user_router, prefix='/user')
     app.include_router(user_options_router, prefix='/user')
+    app.include_router(dispatch_router, prefix='/dispatch')
 
     _seed_db()
 
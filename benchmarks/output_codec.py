@@ -0,0 +1,109 @@
+'''
+Compare the codecs for stored judge outputs (`settings.OUTPUT_CODEC`) by
+compression ratio, write throughput and read latency.
+
+    python -m benchmarks.output_codec [--rounds N]
+
+Outputs are generated to look like what the sandbox sends back: numeric
+answers, formatted lines, a compile error and a runaway print loop. Only the
+CPU side is measured, upload and download time to MinIO scale with the
+compressed size, which is the ratio column.
+'''
+import argparse
+import io
+import random
+import statistics
+import time
+from zipfile import ZipFile
+
+from mongo.submission import OUTPUT_CODECS, zip_output
+
+CODECS = [
+    ('stored', None),
+    ('deflate', 1),
+    ('deflate', None),
+    ('deflate', 9),
+    ('bzip2', None),
+    ('lzma', None),
+]
+
+
+def numbers(rng: random.Random, n: int) -> str:
+    return '\n'.join(str(rng.randint(-10**9, 10**9)) for _ in range(n)) + '\n'
+
+
+def formatted(rng: random.Random, n: int) -> str:
+    return ''.join(f'Case #{i + 1}: {rng.randint(0, 10**6)} '
+                   f'{rng.choice(["YES", "NO"])}\n' for i in range(n))
+
+
+def compile_error(rng: random.Random, n: int) -> str:
+    lines = []
+    for i in range(n):
+        line = rng.randint(1, 200)
+        lines.append(
+            f'main.c:{line}:5: error: \'x{i}\' undeclared (first use in this '
+            f'function)\n    {line} |     x{i} = 0;\n      |     ^~\n')
+    return ''.join(lines)
+
+
+def runaway(rng: random.Random, n: int) -> str:
+    return 'debug: i = 0, j = 0\n' * n
+
+
+def samples(seed: int = 0):
+    '''
+    (name, stdout, stderr) of typical outputs, from tiny to a few MB
+    '''
+    rng = random.Random(seed)
+    yield 'numbers-100', numbers(rng, 100), ''
+    yield 'numbers-200k', numbers(rng, 200000), ''
+    yield 'formatted-50k', formatted(rng, 50000), ''
+    yield 'compile-error', '', compile_error(rng, 50)
+    yield 'runaway-print', runaway(rng, 200000), ''
+
+
+def bench(codec: str, level, cases, rounds: int):
+    raw = sum(len(o.encode()) + len(e.encode()) for _, o, e in cases)
+    stored, writes, reads = 0, [], []
+    for _ in range(rounds):
+        blobs = []
+        begin = time.perf_counter()
+        for _, stdout, stderr in cases:
+            blobs.append(zip_output(stdout, stderr, codec, level))
+        writes.append(time.perf_counter() - begin)
+        stored = sum(map(len, blobs))
+        for blob in blobs:
+            begin = time.perf_counter()
+            with ZipFile(io.BytesIO(blob)) as zf:
+                zf.read('stdout')
+                zf.read('stderr')
+            reads.append(time.perf_counter() - begin)
+    return {
+        'ratio': stored / raw,
+        'write_mb_s': raw / statistics.median(writes) / 2**20,
+        'read_ms': statistics.median(reads) * 1000,
+        'read_p95_ms': sorted(reads)[int(len(reads) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    cases = list(samples())
+    raw = sum(len(o.encode()) + len(e.encode()) for _, o, e in cases)
+    print(f'{len(cases)} outputs, {raw / 2**20:.1f} MiB in total, '
+          f'{args.rounds} rounds\n')
+    print(f'{"codec":<12}{"ratio":>8}{"write MiB/s":>14}'
+          f'{"read ms":>10}{"read p95 ms":>14}')
+    for codec, level in CODECS:
+        assert codec in OUTPUT_CODECS
+        r = bench(codec, level, cases, args.rounds)
+        name = codec if level is None else f'{codec}-{level}'
+        print(f'{name:<12}{r["ratio"]:>8.3f}{r["write_mb_s"]:>14.1f}'
+              f'{r["read_ms"]:>10.2f}{r["read_p95_ms"]:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
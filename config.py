@@ -1,5 +1,5 @@
 import tempfile
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -25,6 +25,20 @@ class Settings(BaseSettings):
     MINIO_BUCKET: str = 'normal-oj-testing'
     MINIO_REGION: Optional[str] = None
 
+    # how judge outputs are compressed in their zip, one of 'stored',
+    # 'deflate', 'bzip2' or 'lzma'. Each zip member records its own method,
+    # so changing this never breaks reading older outputs. Compare them with
+    # `python -m benchmarks.output_codec`
+    OUTPUT_CODEC: Literal['stored', 'deflate', 'bzip2', 'lzma'] = 'deflate'
+    # None for the codec's default level. Deflate at level 1 keeps most of
+    # the ratio of the default level at about five times the speed
+    OUTPUT_COMPRESSLEVEL: Optional[int] = 1
+
+    # judge outputs are dropped after this many days, and for submissions
+    # beyond each user's latest N of a problem. None keeps them
+    OUTPUT_RETENTION_DAYS: Optional[int] = None
+    OUTPUT_KEEP_LATEST: Optional[int] = None
+
     REDIS_HOST: Optional[str] = None
     REDIS_PORT: Optional[int] = None
 
@@ -1,6 +1,8 @@
 """Redis-based pull dispatch module (spec §11).
 
-This slice ships only the runner-identity foundation (redis_keys, params,
-runner registration / token verification / GC). It has no callers yet —
-the HTTP layer and job lifecycle land in later slices.
+- ``runner``: runner identity (registration, token verification, heartbeat, GC)
+- ``job``: job lifecycle (enqueue → lease → renew → complete / recover)
+
+Runners talk to it over the HTTP layer in ``model.dispatch``; submissions are
+only ever enqueued, never pushed to a sandbox from a web request.
 """
@@ -0,0 +1,469 @@
+"""Job lifecycle: enqueue, lease, renew, complete, recover (spec §9, §10).
+
+A job is one judge attempt of one submission. Its full state lives in the
+``job:{jb_id}`` HASH; its position lives in exactly one of the pending LISTs
+of its priority lane (FIFO: LPUSH on enqueue, RPOP on lease) or
+``jobs:leased`` (SET).
+
+Lanes are served by weighted round robin (``params.LANE_WEIGHTS``): a shared
+turn counter picks the lane to try first, and an empty lane hands its turn
+to the others in priority order, so no lane starves and no lease is wasted.
+
+Invariants:
+- INV3: enqueue/cancel for one submission are serialized by the per-submission
+  lock, so two concurrent rejudges can never both believe they are current.
+- INV4: ``submission:{id}:current_job`` names the only job whose result may be
+  accepted. Enqueueing again supersedes the previous job: a superseded job that
+  is still pending is dropped lazily when it reaches the head of the queue, and
+  a superseded job that is leased fails its next renewal and its completion.
+
+Every state transition that races with another actor (lease vs. enqueue,
+complete vs. recover) is a WATCH/MULTI transaction on the job hash, so the
+loser observes a WatchError and simply retries or backs off. No Lua is needed,
+which keeps fakeredis usable in tests.
+"""
+
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from redis.exceptions import WatchError
+from ulid import ULID
+
+from . import params
+from . import redis_keys
+from . import runner
+
+JOB_ID_PREFIX = 'jb_'
+
+PENDING = 'pending'
+LEASED = 'leased'
+
+EXAM = 'exam'
+NORMAL = 'normal'
+BACKGROUND = 'background'
+LANES = tuple(params.LANE_WEIGHTS)
+
+# A lease attempt retries this many times when a concurrent enqueue/lease
+# touched the queue between its WATCH and EXEC.
+_LEASE_RETRIES = 16
+
+
+def _schedule(weights: Dict[str, int]) -> List[str]:
+    '''Smooth weighted round robin, e.g. {a: 2, b: 1} -> [a, b, a].'''
+    current = dict.fromkeys(weights, 0)
+    total = sum(weights.values())
+    order = []
+    for _ in range(total):
+        for lane, weight in weights.items():
+            current[lane] += weight
+        lane = max(current, key=current.get)
+        current[lane] -= total
+        order.append(lane)
+    return order
+
+
+_SCHEDULE = _schedule(params.LANE_WEIGHTS)
+
+
+class JobLockTimeout(Exception):
+    '''
+    when the per-submission job lock can not be acquired in time
+    '''
+
+
+@dataclass(frozen=True)
+class Lease:
+    job_id: str
+    submission_id: str
+    attempt: int
+    expires_at: float
+    lane: str = NORMAL
+
+
+@dataclass
+class Recovery:
+    # jobs whose lease expired and went back to the queue
+    requeued: List[str] = field(default_factory=list)
+    # submissions whose job exhausted MAX_ATTEMPTS and was dropped
+    exhausted: List[str] = field(default_factory=list)
+
+
+def _now() -> float:
+    return time.time()
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _decode_hash(raw: Dict) -> Dict[str, str]:
+    return {_decode(k): _decode(v) for k, v in raw.items()}
+
+
+def _acquire_lock(client, submission_id: str) -> str:
+    key = redis_keys.submission_job_lock(submission_id)
+    token = secrets.token_hex(8)
+    deadline = _now() + params.JOB_LOCK_WAIT_SEC
+    while not client.set(key, token, nx=True, ex=params.JOB_LOCK_TTL_SEC):
+        if _now() >= deadline:
+            raise JobLockTimeout(f'job lock of submission {submission_id}')
+        time.sleep(0.01)
+    return token
+
+
+def _release_lock(client, submission_id: str, token: str) -> None:
+    # Compare-and-delete: never release a lock that expired and was re-taken.
+    key = redis_keys.submission_job_lock(submission_id)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            if _decode(pipe.get(key)) != token:
+                pipe.unwatch()
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.execute()
+        except WatchError:
+            pass
+
+
+def _drop(pipe, job_id: str, submission_id: Optional[str]) -> None:
+    '''Queue the commands removing a job everywhere except ``jobs:pending``.'''
+    pipe.delete(redis_keys.job(job_id))
+    pipe.srem(redis_keys.JOBS_LEASED, job_id)
+    if submission_id is not None:
+        pipe.delete(redis_keys.submission_current_job(submission_id))
+
+
+def enqueue(submission_id: str, lane: str = NORMAL) -> str:
+    """Create a pending job for ``submission_id``, superseding any current one.
+
+    Returns the new job id. The call costs one lock round trip plus one
+    MULTI/EXEC; it never waits for a runner.
+    """
+    if lane not in LANES:
+        raise ValueError(f'unknown lane {lane!r}')
+    client = runner._redis()
+    job_id = JOB_ID_PREFIX + str(ULID())
+    token = _acquire_lock(client, submission_id)
+    try:
+        pointer = redis_keys.submission_current_job(submission_id)
+        previous = _decode(client.get(pointer))
+        pipe = client.pipeline()
+        if previous is not None:
+            _drop(pipe, previous, None)
+        pipe.hset(
+            redis_keys.job(job_id),
+            mapping={
+                'submission_id': submission_id,
+                'state': PENDING,
+                'lane': lane,
+                'attempts': 0,
+                'enqueued_at': repr(_now()),
+            },
+        )
+        pipe.set(pointer, job_id)
+        pipe.lpush(redis_keys.jobs_pending(lane), job_id)
+        pipe.execute()
+    finally:
+        _release_lock(client, submission_id, token)
+    return job_id
+
+
+def cancel(submission_id: str) -> Optional[str]:
+    """Drop the current job of ``submission_id`` (e.g. the submission is gone).
+
+    Returns the cancelled job id, or None if there was none.
+    """
+    client = runner._redis()
+    token = _acquire_lock(client, submission_id)
+    try:
+        pointer = redis_keys.submission_current_job(submission_id)
+        job_id = _decode(client.get(pointer))
+        if job_id is None:
+            return None
+        pipe = client.pipeline()
+        _drop(pipe, job_id, submission_id)
+        pipe.execute()
+    finally:
+        _release_lock(client, submission_id, token)
+    return job_id
+
+
+def current_job(submission_id: str) -> Optional[str]:
+    return _decode(runner._redis().get(
+        redis_keys.submission_current_job(submission_id)))
+
+
+def lease(runner_id: str) -> Optional[Lease]:
+    """Hand a pending job to ``runner_id``, or None if every lane is empty.
+
+    The lane whose turn it is goes first; the others follow in priority
+    order, so a lease only comes back empty when there is no work at all.
+    """
+    client = runner._redis()
+    first = _SCHEDULE[(client.incr(redis_keys.DISPATCH_LANE_TURN) - 1) %
+                      len(_SCHEDULE)]
+    for lane in (first, *(lane for lane in LANES if lane != first)):
+        if (result := _lease_from(client, runner_id, lane)) is not None:
+            return result
+    return None
+
+
+def _lease_from(client, runner_id: str, lane: str) -> Optional[Lease]:
+    """Hand the oldest pending job of ``lane`` to ``runner_id``.
+
+    The queue head is peeked, then popped and marked leased in a single
+    transaction guarded by WATCH on the queue and the job, so a crash can
+    never leave a popped job that is neither pending nor leased. Superseded
+    or cancelled jobs found at the head are discarded on the way.
+    """
+    pending = redis_keys.jobs_pending(lane)
+    for _ in range(_LEASE_RETRIES):
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(pending)
+                job_id = _decode(pipe.lindex(pending, -1))
+                if job_id is None:
+                    pipe.unwatch()
+                    return None
+                job_key = redis_keys.job(job_id)
+                pipe.watch(job_key)
+                job = _decode_hash(pipe.hgetall(job_key))
+                submission_id = job.get('submission_id')
+                current = None
+                if submission_id is not None:
+                    current = _decode(
+                        pipe.get(
+                            redis_keys.submission_current_job(submission_id)))
+                pipe.multi()
+                pipe.rpop(pending)
+                if current != job_id or job.get('state') != PENDING:
+                    # stale entry, drop it and look at the next one
+                    pipe.execute()
+                    continue
+                now = _now()
+                expires_at = now + params.LEASE_TTL_SEC
+                attempt = int(job.get('attempts', 0)) + 1
+                pipe.hset(
+                    job_key,
+                    mapping={
+                        'state': LEASED,
+                        'runner_id': runner_id,
+                        'attempts': attempt,
+                        'leased_at': repr(now),
+                        'lease_expires_at': repr(expires_at),
+                    },
+                )
+                pipe.sadd(redis_keys.JOBS_LEASED, job_id)
+                pipe.execute()
+            except WatchError:
+                continue
+        return Lease(
+            job_id=job_id,
+            submission_id=submission_id,
+            attempt=attempt,
+            expires_at=expires_at,
+            lane=lane,
+        )
+    return None
+
+
+def renew(runner_id: str, job_ids: Iterable[str]) -> List[str]:
+    """Extend the leases ``runner_id`` holds; return the ids it has lost.
+
+    A job is lost once it was recovered, superseded, cancelled or completed;
+    the runner should abort it, since its result would be rejected anyway.
+    """
+    job_ids = [j for j in job_ids if isinstance(j, str)]
+    client = runner._redis()
+    expires_at = repr(_now() + params.LEASE_TTL_SEC)
+    lost = []
+    for job_id in job_ids:
+        job_key = redis_keys.job(job_id)
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(job_key)
+                state, holder = map(_decode,
+                                    pipe.hmget(job_key, 'state', 'runner_id'))
+                if state != LEASED or holder != runner_id:
+                    pipe.unwatch()
+                    lost.append(job_id)
+                    continue
+                pipe.multi()
+                pipe.hset(job_key, 'lease_expires_at', expires_at)
+                pipe.execute()
+            except WatchError:
+                # completed, recovered or cancelled meanwhile
+                lost.append(job_id)
+    return lost
+
+
+def held(runner_id: str, job_id: str) -> Optional[str]:
+    """Return the submission id if ``runner_id`` holds a current lease on
+    ``job_id``, or None. The job is left as it is, so its result can be
+    stored before it is retired by ``complete``.
+    """
+    client = runner._redis()
+    job_key = redis_keys.job(job_id)
+    submission_id, state, holder = map(
+        _decode,
+        client.hmget(job_key, 'submission_id', 'state', 'runner_id'),
+    )
+    if submission_id is None or state != LEASED or holder != runner_id:
+        return None
+    if current_job(submission_id) != job_id:
+        return None
+    return submission_id
+
+
+def complete(runner_id: str, job_id: str) -> Optional[str]:
+    """Accept the result of ``job_id`` from ``runner_id`` and retire the job.
+
+    Returns the submission id whose result should be stored, or None if the
+    runner no longer holds a current lease on this job (INV4), in which case
+    the result must be discarded.
+    """
+    client = runner._redis()
+    job_key = redis_keys.job(job_id)
+    submission_id = _decode(client.hget(job_key, 'submission_id'))
+    if submission_id is None:
+        return None
+    pointer = redis_keys.submission_current_job(submission_id)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(job_key, pointer)
+            state, holder = map(_decode,
+                                pipe.hmget(job_key, 'state', 'runner_id'))
+            if (state != LEASED or holder != runner_id
+                    or _decode(pipe.get(pointer)) != job_id):
+                pipe.unwatch()
+                return None
+            pipe.multi()
+            _drop(pipe, job_id, submission_id)
+            pipe.execute()
+        except WatchError:
+            return None
+    return submission_id
+
+
+def _requeue(pipe, job_id: str, lane: str) -> None:
+    """Queue the commands putting a leased job back to the head of its lane."""
+    job_key = redis_keys.job(job_id)
+    pipe.hset(job_key, 'state', PENDING)
+    pipe.hdel(job_key, 'runner_id', 'leased_at', 'lease_expires_at')
+    pipe.srem(redis_keys.JOBS_LEASED, job_id)
+    # RPUSH puts the retry at the head of its lane
+    pipe.rpush(redis_keys.jobs_pending(lane), job_id)
+
+
+def release(runner_id: str, job_id: str) -> Recovery:
+    """Give a held job back when its result could not be stored.
+
+    The job is retried like an expired lease, and dropped once it exhausted
+    MAX_ATTEMPTS, in which case its submission id is reported as exhausted.
+    """
+    result = Recovery()
+    client = runner._redis()
+    job_key = redis_keys.job(job_id)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(job_key)
+            job = _decode_hash(pipe.hgetall(job_key))
+            if job.get('state') != LEASED or \
+                    job.get('runner_id') != runner_id:
+                pipe.unwatch()
+                return result
+            submission_id = job['submission_id']
+            pointer = redis_keys.submission_current_job(submission_id)
+            pipe.watch(pointer)
+            is_current = _decode(pipe.get(pointer)) == job_id
+            pipe.multi()
+            if not is_current or \
+                    int(job.get('attempts', 0)) >= params.MAX_ATTEMPTS:
+                _drop(pipe, job_id, submission_id if is_current else None)
+                pipe.execute()
+                if is_current:
+                    result.exhausted.append(submission_id)
+                return result
+            _requeue(pipe, job_id, job.get('lane', NORMAL))
+            pipe.execute()
+            result.requeued.append(job_id)
+        except WatchError:
+            # recovered, superseded or cancelled meanwhile
+            pass
+    return result
+
+
+def recover(now: Optional[float] = None, force: bool = False) -> Recovery:
+    """Requeue expired leases, dropping jobs that exhausted MAX_ATTEMPTS.
+
+    Callers invoke this lazily (e.g. from every lease poll); the
+    ``dispatch:last_recovery`` gate makes it run at most once per
+    ORPHAN_SCAN_INTERVAL_SEC across all web workers unless ``force`` is set.
+    Exhausted submission ids are returned so the caller can mark them as
+    judge errors.
+    """
+    if now is None:
+        now = _now()
+    result = Recovery()
+    client = runner._redis()
+    if not force and not client.set(
+            redis_keys.DISPATCH_LAST_RECOVERY,
+            repr(now),
+            nx=True,
+            ex=params.ORPHAN_SCAN_INTERVAL_SEC,
+    ):
+        return result
+
+    for job_id in map(_decode, client.smembers(redis_keys.JOBS_LEASED)):
+        job_key = redis_keys.job(job_id)
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(job_key)
+                job = _decode_hash(pipe.hgetall(job_key))
+                if not job:
+                    # hash already gone, the set member is a corpse
+                    pipe.multi()
+                    pipe.srem(redis_keys.JOBS_LEASED, job_id)
+                    pipe.execute()
+                    continue
+                if float(job.get('lease_expires_at', 0)) >= now:
+                    pipe.unwatch()
+                    continue
+                submission_id = job['submission_id']
+                pointer = redis_keys.submission_current_job(submission_id)
+                pipe.watch(pointer)
+                is_current = _decode(pipe.get(pointer)) == job_id
+                pipe.multi()
+                if int(job.get('attempts', 0)) >= params.MAX_ATTEMPTS:
+                    _drop(pipe, job_id, submission_id if is_current else None)
+                    pipe.execute()
+                    if is_current:
+                        result.exhausted.append(submission_id)
+                    continue
+                _requeue(pipe, job_id, job.get('lane', NORMAL))
+                pipe.execute()
+                result.requeued.append(job_id)
+            except WatchError:
+                # renewed or completed meanwhile, leave it alone
+                continue
+    return result
+
+
+def queue_lengths() -> Dict[str, int]:
+    """Pending entries per lane, stale ones included until leasing skips them."""
+    pipe = runner._redis().pipeline(transaction=False)
+    for lane in LANES:
+        pipe.llen(redis_keys.jobs_pending(lane))
+    return dict(zip(LANES, pipe.execute()))
+
+
+def queue_length() -> int:
+    return sum(queue_lengths().values())
+
+
+def leased_count() -> int:
+    return runner._redis().scard(redis_keys.JOBS_LEASED)
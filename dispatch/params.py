@@ -12,3 +12,9 @@ MAX_ATTEMPTS = 3
 IDENTITY_TTL_SEC = 7 * 24 * 60 * 60  # 7 days
 PRESIGNED_URL_TTL_SEC = 60 * 60  # 1 hour
 MAX_CONCURRENT_JOBS = 8  # advertised to runners in the register response (§7.1)
+JOB_LOCK_TTL_SEC = 5  # per-submission job lock (INV3), held for one transaction
+JOB_LOCK_WAIT_SEC = 2  # how long enqueue/cancel wait for a busy lock
+# Priority lanes, highest first, and their share of leases under contention.
+# An empty lane gives its turn to the next one, so weights only matter when
+# several lanes have work.
+LANE_WEIGHTS = {'exam': 6, 'normal': 3, 'background': 1}
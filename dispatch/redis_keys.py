@@ -1,7 +1,6 @@
 """Centralized Redis key naming for the pull-dispatch namespace (spec §8).
 
-Pure constants and functions — no I/O. Job-related keys are defined now even
-though this slice does not use them, so the whole §8 schema lives in one place.
+Pure constants and functions — no I/O. The whole §8 schema lives in one place.
 """
 
 # --- identity (soft state; ADR-0004) ------------------------------------
@@ -9,9 +8,10 @@ though this slice does not use them, so the whole §8 schema lives in one place.
 RUNNERS_REGISTERED = 'runners:registered'
 
 # --- job queue ----------------------------------------------------------
-JOBS_PENDING = 'jobs:pending'  # LIST of pending jb_id
+JOBS_PENDING = 'jobs:pending'  # LIST of pending jb_id of the normal lane
 JOBS_LEASED = 'jobs:leased'  # SET of leased jb_id
 DISPATCH_LAST_RECOVERY = 'dispatch:last_recovery'  # STRING time gate (SET NX EX)
+DISPATCH_LANE_TURN = 'dispatch:lane_turn'  # STRING counter for fair dequeue
 
 
 def runner_meta(runner_id: str) -> str:
@@ -34,6 +34,17 @@ def job(job_id: str) -> str:
     return f'job:{job_id}'
 
 
+def jobs_pending(lane: str) -> str:
+    """LIST of pending jb_id in one priority lane.
+
+    The normal lane keeps the original key, so jobs enqueued before lanes
+    existed are still leased.
+    """
+    if lane == 'normal':
+        return JOBS_PENDING
+    return f'{JOBS_PENDING}:{lane}'
+
+
 def submission_current_job(submission_id: str) -> str:
     """STRING currency pointer (INV4)."""
     return f'submission:{submission_id}:current_job'
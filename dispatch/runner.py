@@ -39,11 +39,6 @@ from . import redis_keys
 RUNNER_ID_PREFIX = 'rn_'
 RUNNER_TOKEN_PREFIX = 'rk_'
 
-# One shared RedisCache instance. In production every RedisCache() shares the
-# pooled real Redis, but under fakeredis each instance gets an isolated dataset;
-# caching one instance keeps register/verify/list coherent in both worlds.
-_cache: Optional[RedisCache] = None
-
 
 @dataclass(frozen=True)
 class Registration:
@@ -52,10 +47,7 @@ class Registration:
 
 
 def _redis():
-    global _cache
-    if _cache is None:
-        _cache = RedisCache()
-    return _cache.client
+    return RedisCache().client
 
 
 def _now() -> float:
@@ -169,6 +161,22 @@ def verify_token(runner_id: Optional[str], token: Optional[str]) -> bool:
         hashlib.sha256(token_bytes).hexdigest().encode())
 
 
+def heartbeat(runner_id: str) -> None:
+    """Record that ``runner_id`` is alive and renew its identity TTLs (spec §7.2).
+
+    Callers must verify the token first; a renewal therefore never resurrects
+    an identity whose token_hash already evaporated (see ``_gc``).
+    """
+    now = _now()
+    ttl = params.IDENTITY_TTL_SEC
+    pipe = _redis().pipeline(transaction=False)
+    pipe.zadd(redis_keys.RUNNERS_REGISTERED, {runner_id: now}, xx=True)
+    pipe.expire(redis_keys.runner_meta(runner_id), ttl)
+    pipe.expire(redis_keys.runner_token_hash(runner_id), ttl)
+    pipe.set(redis_keys.runner_alive(runner_id), '1', ex=params.LEASE_TTL_SEC)
+    pipe.execute()
+
+
 def list_runners() -> List[Dict]:
     """Return identity-layer facts for all registered identities (spec §7.6 subset).
 
@@ -8,6 +8,8 @@ import (
 	"log"
 	"net/http"
 	"net/http/cookiejar"
+	"net/url"
+	"strconv"
 	"sync"
 )
 
@@ -17,6 +19,7 @@ type APIResponse struct {
 		Submissions []struct {
 			SubmissionID string `json:"submissionId"`
 		} `json:"submissions"`
+		NextCursor *string `json:"nextCursor"`
 	} `json:"data"`
 }
 
@@ -64,35 +67,48 @@ func loginUser(username, password string) (*http.Client, error) {
 	return client, nil
 }
 
-// fetchSubmissionIDs retrieves submission IDs from the API using the provided http.Client
-func fetchSubmissionIDs(offset, count int, client *http.Client) ([]string, error) {
-	url := fmt.Sprintf("%s/submission?count=%d&offset=%d", baseApiUrl, count, offset)
+// fetchSubmissionIDs retrieves submission IDs from the API using the provided http.Client.
+// The first page starts at offset, the following ones continue from the cursor
+// returned with the previous page, which costs the same however deep it is.
+func fetchSubmissionIDs(offset, count int, cursor string, client *http.Client) ([]string, string, error) {
+	params := url.Values{}
+	params.Set("count", strconv.Itoa(count))
+	if cursor != "" {
+		params.Set("cursor", cursor)
+	} else {
+		params.Set("offset", strconv.Itoa(offset))
+	}
+	url := fmt.Sprintf("%s/submission?%s", baseApiUrl, params.Encode())
 
 	req, err := http.NewRequest("GET", url, nil)
 	if err != nil {
-		return nil, fmt.Errorf("failed to create request: %w", err)
+		return nil, "", fmt.Errorf("failed to create request: %w", err)
 	}
 
 	resp, err := client.Do(req)
 	if err != nil {
-		return nil, fmt.Errorf("failed to fetch submissions: %w", err)
+		return nil, "", fmt.Errorf("failed to fetch submissions: %w", err)
 	}
 	defer resp.Body.Close()
 
 	if resp.StatusCode != http.StatusOK {
-		return nil, fmt.Errorf("failed to fetch submissions: status code %d", resp.StatusCode)
+		return nil, "", fmt.Errorf("failed to fetch submissions: status code %d", resp.StatusCode)
 	}
 
 	var apiResp APIResponse
 	if err := json.NewDecoder(resp.Body).Decode(&apiResp); err != nil {
-		return nil, fmt.Errorf("failed to decode submission response: %w", err)
+		return nil, "", fmt.Errorf("failed to decode submission response: %w", err)
 	}
 
 	var ids []string
 	for _, sub := range apiResp.Data.Submissions {
 		ids = append(ids, sub.SubmissionID)
 	}
-	return ids, nil
+	nextCursor := ""
+	if apiResp.Data.NextCursor != nil {
+		nextCursor = *apiResp.Data.NextCursor
+	}
+	return ids, nextCursor, nil
 }
 
 // migrateSubmissionCode sends a POST request to migrate the code for a given submission ID using the provided http.Client
@@ -188,13 +204,14 @@ func main() {
 		defer close(submissionIDChan) // Close channel when producer is done
 		const chunk = 100
 		fetchOffset := *offset
+		cursor := ""
 		for fetchOffset < *offset+*count {
 			fetchCount := chunk
 			if fetchOffset+chunk > *offset+*count {
 				fetchCount = *offset + *count - fetchOffset
 			}
 			log.Printf("Fetching submission IDs with offset: %d, count: %d", fetchOffset, fetchCount)
-			submissionIDs, err := fetchSubmissionIDs(fetchOffset, fetchCount, httpClient)
+			submissionIDs, nextCursor, err := fetchSubmissionIDs(fetchOffset, fetchCount, cursor, httpClient)
 			if err != nil {
 				log.Printf("Error fetching submission IDs: %v. Producer stopping.", err)
 				return
@@ -209,6 +226,10 @@ func main() {
 				submissionIDChan <- id
 			}
 			fetchOffset += chunk
+			if nextCursor == "" {
+				break
+			}
+			cursor = nextCursor
 		}
 		log.Println("Producer finished sending all submission IDs.")
 	}()
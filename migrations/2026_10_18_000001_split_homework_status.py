@@ -0,0 +1,51 @@
+import pymongo
+
+from . import MONGO_HOST, DATABASE
+
+
+def main():
+    client = pymongo.MongoClient(MONGO_HOST)
+    db = client[DATABASE]
+    homeworks = db['homework']
+    statuses = db['homework_problem_status']
+    for homework in homeworks.find(
+        {'studentStatus': {
+            '$exists': True
+        }},
+        {'studentStatus': 1},
+    ):
+        requests = []
+        for username, problems in homework['studentStatus'].items():
+            for pid, stat in problems.items():
+                key = {
+                    'homework': homework['_id'],
+                    'user': username,
+                    'problemId': int(pid),
+                }
+                doc = {
+                    **key,
+                    'score': stat.get('score', 0),
+                    'submissionIds':
+                    [*map(str, stat.get('submissionIds', []))],
+                }
+                if stat.get('problemStatus') is not None:
+                    doc['problemStatus'] = stat['problemStatus']
+                if 'rawScore' in stat:
+                    doc['rawScore'] = stat['rawScore']
+                requests.append(pymongo.ReplaceOne(key, doc, upsert=True))
+        if requests:
+            statuses.bulk_write(requests)
+        homeworks.update_one(
+            {'_id': homework['_id']},
+            {
+                '$set': {
+                    'students': [*homework['studentStatus']]
+                },
+                '$unset': {
+                    'studentStatus': 1
+                },
+            },
+        )
+
+
+main()
@@ -0,0 +1,19 @@
+import pymongo
+
+from . import MONGO_HOST, DATABASE
+
+
+def main():
+    '''
+    drop the compound index leading with `_id`, no query could use it. The
+    indexes declared on `Submission` now are built when the app starts.
+    '''
+    client = pymongo.MongoClient(MONGO_HOST)
+    submissions = client[DATABASE]['submission']
+    for name, info in submissions.index_information().items():
+        key = info['key']
+        if len(key) > 1 and key[0][0] == '_id':
+            submissions.drop_index(name)
+
+
+main()
@@ -0,0 +1,18 @@
+import pymongo
+
+from . import MONGO_HOST, DATABASE
+
+
+def main():
+    '''
+    build the indexes on the minio paths of submissions, which
+    `mongo.retention` looks up for every batch of objects it sweeps. they
+    are built here, ahead of the app, since the collection may be large.
+    '''
+    client = pymongo.MongoClient(MONGO_HOST)
+    submissions = client[DATABASE]['submission']
+    submissions.create_index('tasks.cases.outputMinioPath')
+    submissions.create_index('codeMinioPath')
+
+
+main()
@@ -0,0 +1,65 @@
+import pymongo
+
+from . import MONGO_HOST, DATABASE
+
+
+def main():
+    '''
+    seed the submission counters from the existing submissions, problem
+    statistics and list totals are read from them only
+    '''
+    client = pymongo.MongoClient(MONGO_HOST)
+    db = client[DATABASE]
+    statuses, users = {}, {}
+    for row in db['submission'].aggregate([{
+            '$group': {
+                '_id': {
+                    'problem': '$problem',
+                    'user': '$user',
+                    'status': '$status',
+                },
+                'count': {
+                    '$sum': 1
+                },
+            },
+    }]):
+        _id, n = row['_id'], row['count']
+        key = (_id['problem'], _id['status'])
+        statuses[key] = statuses.get(key, 0) + n
+        count, ac_count = users.get((_id['problem'], _id['user']), (0, 0))
+        users[_id['problem'], _id['user']] = (
+            count + n,
+            ac_count + (n if _id['status'] == 0 else 0),
+        )
+    requests = [
+        pymongo.UpdateOne(
+            {
+                'problemId': problem_id,
+                'status': status,
+            },
+            {'$set': {
+                'count': count
+            }},
+            upsert=True,
+        ) for (problem_id, status), count in statuses.items()
+    ]
+    if requests:
+        db['submission_count'].bulk_write(requests)
+    requests = [
+        pymongo.UpdateOne(
+            {
+                'problemId': problem_id,
+                'user': user,
+            },
+            {'$set': {
+                'count': count,
+                'acCount': ac_count,
+            }},
+            upsert=True,
+        ) for (problem_id, user), (count, ac_count) in users.items()
+    ]
+    if requests:
+        db['user_submission_count'].bulk_write(requests)
+
+
+main()
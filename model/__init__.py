@@ -11,6 +11,7 @@ from . import post
 from . import copycat
 from . import health
 from . import user
+from . import dispatch
 
 from .auth import *
 from .profile import *
@@ -25,6 +26,7 @@ from .post import *
 from .copycat import *
 from .health import *
 from .user import *
+from .dispatch import *
 
 __all__ = [
     *auth.__all__,
@@ -40,4 +42,5 @@ __all__ = [
     *copycat.__all__,
     *health.__all__,
     *user.__all__,
+    *dispatch.__all__,
 ]
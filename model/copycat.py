@@ -38,22 +38,20 @@ def get_report_task(user, problem_id, student_dict: Dict):
         count=-1,
         status=0,
         problem=problem_id,
+        fields=('user', 'language', 'code', 'code_minio_path'),
     )
 
     last_cc_submission = {}
     last_python_submission = {}
-    for submission in submissions:
-        s = Submission(submission.id)
+    for s in submissions:
         if s.user.username in student_dict:
             if s.language in [0, 1
                               ] and s.user.username not in last_cc_submission:
-                last_cc_submission[
-                    submission.user.username] = s.main_code_path()
+                last_cc_submission[s.user.username] = s.main_code_path()
             elif s.language in [
                     2
             ] and s.user.username not in last_python_submission:
-                last_python_submission[
-                    submission.user.username] = s.main_code_path()
+                last_python_submission[s.user.username] = s.main_code_path()
 
     moss_userid = 97089070
     logger = logging.getLogger(__name__)
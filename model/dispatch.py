@@ -0,0 +1,144 @@
+import json
+from datetime import timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Header
+from mongo import *
+from dispatch import job, params, runner
+from .utils import *
+from .auth import identity_verify
+from .schemas import (
+    RegisterRunnerBody,
+    RunnerHeartbeatBody,
+    CompleteJobBody,
+)
+
+__all__ = ['dispatch_router']
+
+dispatch_router = APIRouter()
+
+
+def runner_required(
+        authorization: Optional[str] = Header(default=None),
+        x_runner_id: Optional[str] = Header(default=None),
+) -> str:
+    '''Authenticate a runner by `X-Runner-Id` and `Authorization: Bearer rk_...`.
+
+    Raises:
+        - 401 Invalid Runner Credential
+    '''
+    token = None
+    if authorization is not None and authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+    if not runner.verify_token(x_runner_id, token):
+        raise NOJException('Invalid Runner Credential', 401)
+    return x_runner_id
+
+
+def _job_payload(lease: job.Lease, submission: Submission):
+    expires = timedelta(seconds=params.PRESIGNED_URL_TTL_SEC)
+    problem = Problem(submission.problem)
+    return {
+        'jobId': lease.job_id,
+        'submissionId': lease.submission_id,
+        'attempt': lease.attempt,
+        'lane': lease.lane,
+        'leaseExpiresAt': lease.expires_at,
+        'problemId': submission.problem_id,
+        'language': submission.language,
+        'codeUrl': submission.presigned_code_url(expires),
+        'testdataUrl': problem.presigned_test_case_url(expires),
+        'tasks':
+        [json.loads(task.to_json()) for task in problem.test_case.tasks],
+    }
+
+
+@dispatch_router.post('/runners')
+def register_runner(body: RegisterRunnerBody, ip: str = Depends(get_ip)):
+    if not runner.verify_registration_token(body.registration_token):
+        return HTTPError('Invalid Registration Token', 401)
+    registration = runner.register(body.name, ip)
+    return HTTPResponse(
+        'runner registered.',
+        status_code=201,
+        data={
+            'runnerId': registration.runner_id,
+            'token': registration.token,
+            'heartbeatInterval': params.HEARTBEAT_INTERVAL_SEC,
+            'pollInterval': params.POLL_INTERVAL_SEC,
+            'maxConcurrentJobs': params.MAX_CONCURRENT_JOBS,
+        },
+    )
+
+
+@dispatch_router.post('/runners/heartbeat')
+def runner_heartbeat(
+        body: RunnerHeartbeatBody,
+        runner_id: str = Depends(runner_required),
+):
+    runner.heartbeat(runner_id)
+    lost = job.renew(runner_id, body.job_ids)
+    return HTTPResponse(data={'lostJobIds': lost})
+
+
+@dispatch_router.post('/jobs/lease')
+def lease_job(runner_id: str = Depends(runner_required)):
+    # recover expired leases lazily, at most once per scan interval
+    for submission_id in job.recover().exhausted:
+        submission = Submission(submission_id)
+        if submission:
+            submission.logger.warning(
+                f'{submission} exhausted {params.MAX_ATTEMPTS} attempts')
+            submission.mark_judge_error()
+    while (lease := job.lease(runner_id)) is not None:
+        submission = Submission(lease.submission_id)
+        if submission:
+            return HTTPResponse(data=_job_payload(lease, submission))
+        # the submission was deleted after its job had been enqueued
+        job.complete(runner_id, lease.job_id)
+    return HTTPResponse('no pending job.', data=None)
+
+
+def _release(runner_id: str, job_id: str):
+    for submission_id in job.release(runner_id, job_id).exhausted:
+        submission = Submission(submission_id)
+        if submission:
+            submission.logger.warning(
+                f'{submission} exhausted {params.MAX_ATTEMPTS} attempts')
+            submission.mark_judge_error()
+
+
+@dispatch_router.put('/jobs/{job_id}/complete')
+def complete_job(
+        job_id: str,
+        body: CompleteJobBody,
+        runner_id: str = Depends(runner_required),
+):
+    submission_id = job.held(runner_id, job_id)
+    if submission_id is None:
+        return HTTPError(f'job [{job_id}] is not held by this runner', 409)
+    submission = Submission(submission_id)
+    if not submission:
+        job.complete(runner_id, job_id)
+        return HTTPError(f'{submission} not found', 404)
+    # the job is retired only once the result is stored, otherwise it is
+    # judged again
+    try:
+        submission.process_result(body.tasks)
+    except (ValidationError, KeyError) as e:
+        _release(runner_id, job_id)
+        return HTTPError(f'invalid data!\n{type(e).__name__}: {e}', 400)
+    except Exception:
+        _release(runner_id, job_id)
+        raise
+    job.complete(runner_id, job_id)
+    return HTTPResponse(f'{submission} result recieved.')
+
+
+@dispatch_router.get('/queue')
+def get_queue_status(user=identity_verify(0)):
+    return HTTPResponse(
+        data={
+            'pending': job.queue_lengths(),
+            'leased': job.leased_count(),
+            'weights': params.LANE_WEIGHTS,
+        })
@@ -39,7 +39,7 @@ def create_homework(body: CreateHomeworkBody, user=Depends(login_required)):
 @homework_router.get('/{homework_id}')
 def get_homework(homework_id: str, user=Depends(login_required)):
     try:
-        homework = Homework.get_by_id(homework_id)
+        homework = Homework(Homework.get_by_id(homework_id))
         ret = {
             'name':
             homework.homework_name,
@@ -52,7 +52,7 @@ def get_homework(homework_id: str, user=Depends(login_required)):
             'markdown':
             homework.markdown,
             'studentStatus': (homework.student_status if user.role < 2 else
-                              homework.student_status.get(user.username)),
+                              homework.get_student_status(user.username)),
             'penalty':
             homework.penalty if hasattr(homework, 'penalty') else None,
         }
@@ -104,7 +104,7 @@ def get_homework_list(course_name: str, user=Depends(login_required)):
     try:
         homeworks = Homework.get_homeworks(course_name=course_name)
         data = []
-        for homework in homeworks:
+        for homework in map(Homework, homeworks):
             new = {
                 'name': homework.homework_name,
                 'start': int(homework.duration.start.timestamp()),
@@ -116,7 +116,7 @@ def get_homework_list(course_name: str, user=Depends(login_required)):
             if user.role < 2:
                 new['studentStatus'] = homework.student_status
             else:
-                new['studentStatus'] = homework.student_status.get(
+                new['studentStatus'] = homework.get_student_status(
                     user.username)
             data.append(new)
     except DoesNotExist:
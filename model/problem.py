@@ -374,12 +374,10 @@ def problem_stats(
         'problem': problem.id,
         'status': 0
     }
-    ret['top10RunTime'] = [
-        s.to_dict() for s in Submission.filter(**params, sort_by='runTime')
-    ]
-    ret['top10MemoryUsage'] = [
-        s.to_dict() for s in Submission.filter(**params, sort_by='memoryUsage')
-    ]
+    ret['top10RunTime'] = Submission.to_dicts(
+        Submission.filter(**params, sort_by='runTime'))
+    ret['top10MemoryUsage'] = Submission.to_dicts(
+        Submission.filter(**params, sort_by='memoryUsage'))
     return HTTPResponse('Success.', data=ret)
 
 
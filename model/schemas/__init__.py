@@ -23,9 +23,14 @@ from .announcement import (
 from .submission import (
     CreateSubmissionBody,
     GetSubmissionListQuery,
-    OnSubmissionCompleteBody,
     GradeSubmissionBody,
     UpdateConfigBody,
+    CreateRejudgeJobBody,
+)
+from .dispatch import (
+    RegisterRunnerBody,
+    RunnerHeartbeatBody,
+    CompleteJobBody,
 )
 from .homework import CreateHomeworkBody, UpdateHomeworkBody, PatchIpFiltersBody
 from .course import (
@@ -0,0 +1,15 @@
+from typing import Any, List, Optional
+from .base import BaseSchema
+
+
+class RegisterRunnerBody(BaseSchema):
+    name: str
+    registration_token: Optional[Any] = None
+
+
+class RunnerHeartbeatBody(BaseSchema):
+    job_ids: List[Any] = []
+
+
+class CompleteJobBody(BaseSchema):
+    tasks: List[Any]
@@ -18,11 +18,8 @@ class GetSubmissionListQuery(BaseSchema):
     before: Optional[str] = None
     after: Optional[str] = None
     ip_addr: Optional[str] = None
-
-
-class OnSubmissionCompleteBody(BaseSchema):
-    tasks: List[Any]
-    token: str
+    cursor: Optional[str] = None
+    count_mode: Optional[str] = None
 
 
 class GradeSubmissionBody(BaseSchema):
@@ -32,3 +29,13 @@ class GradeSubmissionBody(BaseSchema):
 class UpdateConfigBody(BaseSchema):
     rate_limit: int
     sandbox_instances: List[Any]
+
+
+class CreateRejudgeJobBody(BaseSchema):
+    problem_id: Optional[int] = None
+    homework_id: Optional[str] = None
+    status: Optional[int] = None
+    language_type: Optional[List[int]] = None
+    before: Optional[int] = None
+    after: Optional[int] = None
+    rate: Optional[float] = None
@@ -4,25 +4,28 @@ import random
 import secrets
 import json
 import httpx
-from typing import Optional
-from fastapi import APIRouter, Depends, UploadFile, File
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Request, UploadFile, File
 from fastapi.responses import StreamingResponse, Response
-from datetime import datetime, timedelta
+from datetime import datetime
 from mongo import *
 from mongo import engine
+from mongo import sandbox
+from mongo import quota
 from mongo.utils import (
     RedisCache,
     drop_none,
     is_testing,
 )
+from dispatch.job import JobLockTimeout
 from .utils import *
 from .auth import identity_verify, login_required
 from .schemas import (
     CreateSubmissionBody,
     GetSubmissionListQuery,
-    OnSubmissionCompleteBody,
     GradeSubmissionBody,
     UpdateConfigBody,
+    CreateRejudgeJobBody,
 )
 
 __all__ = ['submission_router']
@@ -54,15 +57,10 @@ def update_config(
     except engine.ValidationError as e:
         return HTTPError('wrong Sandbox schema', 400, data=e.to_dict())
     if not is_testing():
-        resps = []
-        for sb in sandbox_instances:
-            try:
-                resp = httpx.get(f'{sb.url}/status', timeout=5.0)
-            except httpx.RequestError as e:
-                resps.append((sb.name, e))
-                continue
-            if not resp.is_success:
-                resps.append((sb.name, resp))
+        resps = [(sb.name, resp) for sb, resp in zip(
+            sandbox_instances,
+            sandbox.probe_all(sandbox_instances),
+        ) if not isinstance(resp, httpx.Response) or not resp.is_success]
         if len(resps) != 0:
             return HTTPError(
                 'some error occurred when check sandbox status',
@@ -86,6 +84,76 @@ def update_config(
     return HTTPResponse('success.')
 
 
+# /rejudge-jobs must be defined before /{submission_id} as well
+@submission_router.post('/rejudge-jobs')
+def create_rejudge_job(
+        body: CreateRejudgeJobBody,
+        user: User = Depends(login_required),
+):
+    '''
+    rejudge every judged submission of a problem or a homework in the
+    background, optionally narrowed by status, language and period
+    '''
+    if (body.problem_id is None) == (body.homework_id is None):
+        return HTTPError('exactly one of problemId and homeworkId is required',
+                         400)
+    if body.rate is not None and body.rate <= 0:
+        return HTTPError('rate must be positive', 400)
+    if body.problem_id is not None:
+        problem = Problem(body.problem_id)
+        if not problem:
+            return HTTPError(f'{problem} not found', 404)
+        if not problem.permission(user, Problem.Permission.MANAGE):
+            return HTTPError('forbidden.', 403)
+        problem_ids = [body.problem_id]
+        before, after = body.before, body.after
+    else:
+        try:
+            homework = Homework.get_by_id(body.homework_id)
+        except (engine.DoesNotExist, engine.ValidationError):
+            return HTTPError('homework not found', 404)
+        course = Course(engine.Course.objects.get(id=homework.course_id))
+        if not course.permission(user, Course.Permission.GRADE):
+            return HTTPError('forbidden.', 403)
+        problem_ids = homework.problem_ids
+        # only submissions made during the homework
+        before = min(x
+                     for x in (body.before, homework.duration.end.timestamp())
+                     if x is not None)
+        after = max(x
+                    for x in (body.after, homework.duration.start.timestamp())
+                    if x is not None)
+    scope = body.model_dump(by_alias=True, exclude_none=True)
+    submission_ids = RejudgeJob.query(
+        problem_ids,
+        status=body.status,
+        language_type=body.language_type,
+        before=None if before is None else datetime.fromtimestamp(before),
+        after=None if after is None else datetime.fromtimestamp(after),
+    )
+    job = RejudgeJob.create(
+        submission_ids,
+        requester=user.username,
+        scope=scope,
+        rate=body.rate,
+    )
+    job.start()
+    info = job.info()
+    return HTTPResponse(
+        f'rejudge {info["total"]} submissions.',
+        status_code=202,
+        data=info,
+    )
+
+
+@submission_router.get('/rejudge-jobs/{job_id}')
+def get_rejudge_job(job_id: str, user: User = Depends(login_required)):
+    info = RejudgeJob(job_id).info()
+    if info is None or (user.role != 0 and info['requester'] != user.username):
+        return HTTPError('rejudge job not found', 404)
+    return HTTPResponse(data=info)
+
+
 @submission_router.post('')
 def create_submission(
         body: CreateSubmissionBody,
@@ -95,26 +163,18 @@ def create_submission(
     language_type = body.language_type
     problem_id = body.problem_id
     now = datetime.now()
-    delta = timedelta.total_seconds(now - user.last_submit)
-    if delta <= Submission.config().rate_limit:
-        wait_for = Submission.config().rate_limit - delta
-        return HTTPError(
-            'Submit too fast!\n'
-            f'Please wait for {wait_for:.2f} seconds to submit.',
-            429,
-            data={'waitFor': wait_for},
-        )
     if problem_id is None:
         return HTTPError('problemId is required!', 400)
-    problem = Problem(problem_id)
-    if not problem:
+    # every check below reads from these, no more queries until the insert
+    admission = Admission.load(problem_id)
+    if admission is None:
         return HTTPError('Unexisted problem id.', 404)
-    if not problem.permission(user, Problem.Permission.VIEW):
+    problem = admission.problem
+    if not admission.can_view(user):
         return HTTPError('problem permission denied!', 403)
-    for homework in problem.obj.homeworks:
-        if now < homework.duration.start:
-            return HTTPError('this homework hasn\'t start.', 403)
-    if not problem.is_valid_ip(ip):
+    if not admission.started(now):
+        return HTTPError('this homework hasn\'t start.', 403)
+    if not admission.is_valid_ip(ip, now):
         return HTTPError('Invalid IP address.', 403)
     if language_type is None:
         if problem.problem_type != 2:
@@ -136,31 +196,53 @@ def create_submission(
                 'got': language_type
             },
         )
-    if problem.obj.quota != -1:
-        no_grade_permission = not any(
-            c.permission(user=user, req=Course.Permission.GRADE)
-            for c in map(Course, problem.courses))
-        run_out_of_quota = problem.submit_count(user) >= problem.quota
-        if no_grade_permission and run_out_of_quota:
-            return HTTPError('you have used all your quotas', 403)
-    user.problem_submission[str(problem_id)] = problem.submit_count(user) + 1
-    user.save()
+    problem_quota = problem.obj.quota
+    if problem_quota != -1 and admission.can_grade(user):
+        problem_quota = -1
+    try:
+        submit_count = quota.admit(
+            user,
+            problem_id,
+            rate_limit=Submission.config().rate_limit,
+            quota=problem_quota,
+        )
+    except quota.RateLimited as e:
+        return HTTPError(
+            'Submit too fast!\n'
+            f'Please wait for {e.wait_for:.2f} seconds to submit.',
+            429,
+            data={'waitFor': e.wait_for},
+        )
+    except quota.QuotaExceeded:
+        return HTTPError('you have used all your quotas', 403)
     try:
         submission = Submission.add(
-            problem_id=problem_id,
-            username=user.username,
+            problem_id=problem,
+            username=user,
             lang=language_type,
             timestamp=now,
             ip_addr=ip,
         )
     except ValidationError:
+        quota.refund(user, problem_id)
         return HTTPError('invalid data!', 400)
     except engine.DoesNotExist as e:
+        quota.refund(user, problem_id)
         return HTTPError(str(e), 404)
     except TestCaseNotFound as e:
+        quota.refund(user, problem_id)
         return HTTPError(str(e), 403)
-    user.update(last_submit=now, push__submissions=submission.obj)
-    submission.problem.update(inc__submitter=1)
+    # mongo keeps a copy of today's counts, in case redis loses them
+    if user.last_submit.date() == now.date():
+        counts = {f'set__problem_submission__{problem_id}': submit_count}
+    else:
+        counts = {'problem_submission': {str(problem_id): submit_count}}
+    user.update(
+        last_submit=now,
+        push__submissions=submission.obj,
+        **counts,
+    )
+    quota.add_submitter(problem_id)
     return HTTPResponse(
         'submission recieved.\nplease send source code with given submission id later.',
         data={'submissionId': submission.id},
@@ -182,6 +264,8 @@ def get_submission_list(
     after = query.after
     language_type = query.language_type
     ip_addr = query.ip_addr
+    cursor = query.cursor
+    count_mode = query.count_mode
 
     def parse_int(val, name):
         if val is None:
@@ -204,69 +288,67 @@ def get_submission_list(
         except ValueError:
             raise ValueError(f'can not convert {name} to timestamp')
 
-    cache_key = '_'.join(
-        map(str, (
-            'SUBMISSION_LIST_API',
-            user,
-            problem_id,
-            username,
-            status,
-            language_type,
-            course,
-            offset,
-            count,
-            before,
-            after,
-        )))
+    offset = parse_int(offset, 'offset')
+    count = parse_int(count, 'count')
+    problem_id = parse_int(problem_id, 'problemId')
+    status = parse_int(status, 'status')
+    before = parse_timestamp(before, 'before')
+    after = parse_timestamp(after, 'after')
+    ip_addr = parse_str(ip_addr, 'ip_addr')
+    if language_type is not None:
+        try:
+            language_type = sorted(map(int, language_type.split(',')))
+        except ValueError:
+            return HTTPError('cannot parse integers from languageType', 400)
+    if user.role == User.engine.Role.STUDENT:
+        username = user.username
+    params = drop_none({
+        'offset': offset,
+        'count': count,
+        'problem': problem_id,
+        'q_user': username,
+        'status': status,
+        'language_type': language_type,
+        'course': course,
+        'before': before,
+        'after': after,
+        'ip_addr': ip_addr,
+        'cursor': cursor,
+        'count_mode': count_mode,
+    })
+    # pages of ids are shared by everyone sending the same filter, only the
+    # problems of a course depend on the viewer: admins see all of them, the
+    # others those they own besides the online ones
+    scope = {k: str(v) for k, v in params.items()}
+    if course is not None:
+        scope['viewer'] = '' if user.role == 0 else user.username
+    cache_key = 'SUBMISSION_LIST_PAGE_' + json.dumps(scope, sort_keys=True)
     cache = RedisCache()
-    if cache.exists(cache_key):
-        submissions = json.loads(cache.get(cache_key))
-        submission_count = submissions['submission_count']
-        submissions = submissions['submissions']
+    if (page := cache.get(cache_key)) is not None:
+        page = json.loads(page)
+        submissions = Submission.get_entries(page['ids'])
     else:
-        offset = parse_int(offset, 'offset')
-        count = parse_int(count, 'count')
-        problem_id = parse_int(problem_id, 'problemId')
-        status = parse_int(status, 'status')
-        before = parse_timestamp(before, 'before')
-        after = parse_timestamp(after, 'after')
-        ip_addr = parse_str(ip_addr, 'ip_addr')
-
-        if language_type is not None:
-            try:
-                language_type = list(map(int, language_type.split(',')))
-            except ValueError:
-                return HTTPError('cannot parse integers from languageType',
-                                 400)
-        if user.role == User.engine.Role.STUDENT:
-            username = user.username
         try:
-            params = drop_none({
-                'user': user,
-                'offset': offset,
-                'count': count,
-                'problem': problem_id,
-                'q_user': username,
-                'status': status,
-                'language_type': language_type,
-                'course': course,
-                'before': before,
-                'after': after,
-                'ip_addr': ip_addr,
-            })
-            submissions, submission_count = Submission.filter(**params,
-                                                              with_count=True)
-            submissions = [s.to_dict() for s in submissions]
-            cache.set(
-                cache_key,
-                json.dumps({
-                    'submissions': submissions,
-                    'submission_count': submission_count
-                }),
-                15,
+            submissions, submission_count = Submission.filter(
+                user=user,
+                **params,
+                with_count=True,
             )
         except ValueError as e:
             return HTTPError(str(e), 400)
+        # a full page may be followed by another one
+        next_cursor = None
+        if count is not None and count > 0 and len(submissions) == count:
+            next_cursor = Submission.encode_cursor(submissions[-1])
+        page = {
+            'ids': [s.id for s in submissions],
+            'submission_count': submission_count,
+            'next_cursor': next_cursor,
+        }
+        cache.set(cache_key, json.dumps(page), 15)
+        # not cached as entries, these rows are loaded before reading the
+        # generations `Submission.cache_entries` checks
+        submissions = Submission.to_dicts(submissions)
     unicorns = [
         'https://media.giphy.com/media/xTiTnLmaxrlBHxsMMg/giphy.gif',
         'https://media.giphy.com/media/26AHG5KGFxSkUWw1i/giphy.gif',
@@ -276,7 +358,8 @@ def get_submission_list(
     ret = {
         'unicorn': random.choice(unicorns),
         'submissions': submissions,
-        'submissionCount': submission_count,
+        'submissionCount': page['submission_count'],
+        'nextCursor': page['next_cursor'],
     }
     return HTTPResponse('here you are, bro', data=ret)
 
@@ -323,11 +406,41 @@ def get_submission_output(
         output = submission.get_single_output(task_no, case_no)
     except FileNotFoundError as e:
         return HTTPError(str(e), 400)
+    except OutputExpired as e:
+        return HTTPError(str(e), 410)
     except AttributeError as e:
         return HTTPError(str(e), 102)
     return HTTPResponse('ok', data=output)
 
 
+@submission_router.get('/{submission_id}/output/{task_no}/{case_no}/{fd}')
+def download_submission_output(
+        task_no: int,
+        case_no: int,
+        fd: Literal['stdout', 'stderr'],
+        request: Request,
+        user=Depends(login_required),
+        submission: Submission = get_doc('submission_id', Submission),
+):
+    if not submission.permission(user, Submission.Permission.VIEW_OUTPUT):
+        return HTTPError('permission denied', 403)
+    try:
+        output = submission.open_output(task_no, case_no, fd)
+    except FileNotFoundError as e:
+        return HTTPError(str(e), 400)
+    except OutputExpired as e:
+        return HTTPError(str(e), 410)
+    except AttributeError as e:
+        return HTTPError(str(e), 102)
+    return HTTPStream(
+        request,
+        output.size,
+        output.iter_bytes,
+        media_type='text/plain; charset=utf-8',
+        close=output.close,
+    )
+
+
 @submission_router.get('/{submission_id}/pdf/{item}')
 def get_submission_pdf(
         item: str,
@@ -360,27 +473,12 @@ def get_submission_pdf(
     )
 
 
-@submission_router.put('/{submission_id}/complete')
-def on_submission_complete(
-        body: OnSubmissionCompleteBody,
-        submission: Submission = get_doc('submission_id', Submission),
-):
-    if not Submission.verify_token(submission.id, body.token):
-        return HTTPError('i don\'t know you', 403)
-    try:
-        submission.process_result(body.tasks)
-    except (ValidationError, KeyError) as e:
-        return HTTPError(f'invalid data!\n{type(e).__name__}: {e}', 400)
-    return HTTPResponse(f'{submission} result recieved.')
-
-
 @submission_router.put('/{submission_id}')
 def update_submission(
         submission_id: str,
         code: Optional[UploadFile] = File(default=None),
         user=Depends(login_required),
         submission: Submission = get_doc('submission_id', Submission),
-        http_client: httpx.Client = Depends(get_http_client),
 ):
     if submission.status >= 0:
         return HTTPError(f'{submission} has finished judgement.', 403)
@@ -388,20 +486,21 @@ def update_submission(
         return HTTPError('user not equal!', 403)
     if code is None:
         return HTTPError('can not find the source file', 400)
-    content = code.file.read()
-    if len(content) == 0:
+    # starlette has spooled the upload to a temporary file, which is
+    # streamed to minio without being read into memory
+    if code.file.seek(0, os.SEEK_END) == 0:
         return HTTPError('empty file', 400)
-    code_file = io.BytesIO(content)
+    code.file.seek(0)
     if submission.has_code():
         return HTTPError(f'{submission} has been uploaded source file!', 403)
     try:
-        success = submission.submit(code_file, client=http_client)
+        success = submission.submit(code.file)
     except FileExistsError as e:
         return HTTPError(str(e), 409)
     except ValueError as e:
         return HTTPError(str(e), 400)
-    except JudgeQueueFullError as e:
-        return HTTPResponse(str(e), 202)
+    except JobLockTimeout as e:
+        return HTTPError(f'{submission} is busy, please retry later', 409)
     except ValidationError as e:
         return HTTPError(str(e), 400, data=e.to_dict())
     except TestCaseNotFound as e:
@@ -424,7 +523,7 @@ def grade_submission(
         return HTTPError('forbidden.', 403)
     if body.score < 0 or body.score > 100:
         return HTTPError('score must be between 0 to 100.', 400)
-    submission.update(score=body.score, status=(0 if body.score == 100 else 1))
+    submission.grade(body.score)
     submission.finish_judging()
     return HTTPResponse(f'{submission} score recieved.')
 
@@ -452,7 +551,6 @@ async def comment_submission(
 def rejudge(
         user=Depends(login_required),
         submission: Submission = get_doc('submission_id', Submission),
-        http_client: httpx.Client = Depends(get_http_client),
 ):
     if submission.status == -2 or (submission.status == -1 and
                                    (datetime.now() -
@@ -461,11 +559,11 @@ def rejudge(
     if not submission.permission(user, Submission.Permission.REJUDGE):
         return HTTPError('forbidden.', 403)
     try:
-        success = submission.rejudge(client=http_client)
+        success = submission.rejudge()
     except ValueError as e:
         return HTTPError(str(e), 400)
-    except JudgeQueueFullError as e:
-        return HTTPResponse(str(e), 202)
+    except JobLockTimeout as e:
+        return HTTPError(f'{submission} is busy, please retry later', 409)
     except ValidationError as e:
         return HTTPError(str(e), 422, data=e.to_dict())
     if success:
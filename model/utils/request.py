@@ -1,10 +1,9 @@
 import inspect
-import httpx
 from fastapi import Depends, Request
 from mongo import engine
 from .response import NOJException
 
-__all__ = ('get_doc', 'get_ip', 'get_http_client')
+__all__ = ('get_doc', 'get_ip')
 
 
 def get_doc(src_param: str, cls, param_type=str):
@@ -42,10 +41,6 @@ def get_doc(src_param: str, cls, param_type=str):
     return Depends(dependency)
 
 
-def get_http_client(request: Request) -> httpx.Client:
-    return request.app.state.http_client
-
-
 def get_ip(request: Request) -> str:
     # cf-connecting-ip is set by Cloudflare and is more reliable than X-Forwarded-For
     cf_ip = request.headers.get('cf-connecting-ip', '').strip()
@@ -1,8 +1,22 @@
-from typing import Any
-from fastapi import HTTPException
-from fastapi.responses import JSONResponse, RedirectResponse
+import re
+import zlib
+from typing import Any, Callable, Iterator, Optional
+from fastapi import HTTPException, Request
+from fastapi.responses import (
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.background import BackgroundTask
 
-__all__ = ['NOJException', 'HTTPResponse', 'HTTPRedirect', 'HTTPError']
+__all__ = [
+    'NOJException',
+    'HTTPResponse',
+    'HTTPRedirect',
+    'HTTPError',
+    'HTTPStream',
+]
 
 
 class NOJException(HTTPException):
@@ -59,3 +73,106 @@ def HTTPError(
 ) -> JSONResponse:
     cookies = {'piann': None, 'jwt': None} if logout else {}
     return HTTPResponse(message, status_code, 'err', data, cookies)
+
+
+# a `Range` header that is malformed or asks for more than one range is
+# ignored, and the whole content is sent (RFC 9110 14.2)
+_IGNORE_RANGE = object()
+
+
+def _parse_range(header: str, size: int):
+    '''
+    parse a single `bytes=` range into [start, end). None if it is valid but
+    can not be satisfied, `_IGNORE_RANGE` if it should be ignored.
+    '''
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if m is None or m.groups() == ('', ''):
+        return _IGNORE_RANGE
+    first, last = m.groups()
+    if first == '':
+        # suffix range, the last N bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        if last != '' and int(last) < start:
+            return _IGNORE_RANGE
+        end = size if last == '' else min(int(last) + 1, size)
+    if start >= end:
+        return None
+    return start, end
+
+
+def _accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get('accept-encoding', '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0')
+    return False
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        if (data := compressor.compress(chunk)):
+            yield data
+    yield compressor.flush()
+
+
+def HTTPStream(
+    request: Request,
+    size: int,
+    read: Callable[[int, int], Iterator[bytes]],
+    media_type: str = 'application/octet-stream',
+    close: Optional[Callable[[], Any]] = None,
+) -> Response:
+    '''
+    Stream `size` bytes produced by `read(start, end)`. A single range in
+    the `Range` header is answered with 206, or 416 if it can not be
+    satisfied. Otherwise the content is gzipped on the fly if the client
+    accepts it. `close` is called once the response is sent.
+    '''
+    headers = {'Accept-Ranges': 'bytes', 'Vary': 'Accept-Encoding'}
+    background = BackgroundTask(close) if close is not None else None
+    range_header = request.headers.get('range')
+    byte_range = _IGNORE_RANGE
+    if range_header is not None:
+        byte_range = _parse_range(range_header, size)
+    if byte_range is not _IGNORE_RANGE:
+        if byte_range is None:
+            if close is not None:
+                close()
+            return Response(
+                status_code=416,
+                headers={
+                    **headers, 'Content-Range': f'bytes */{size}'
+                },
+            )
+        start, end = byte_range
+        return StreamingResponse(
+            read(start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                'Content-Range': f'bytes {start}-{end - 1}/{size}',
+                'Content-Length': str(end - start),
+            },
+            background=background,
+        )
+    if _accepts_gzip(request):
+        return StreamingResponse(
+            _gzip(read(0, size)),
+            media_type=media_type,
+            headers={
+                **headers, 'Content-Encoding': 'gzip'
+            },
+            background=background,
+        )
+    return StreamingResponse(
+        read(0, size),
+        media_type=media_type,
+        headers={
+            **headers, 'Content-Length': str(size)
+        },
+        background=background,
+    )
@@ -7,6 +7,7 @@ from . import problem
 from . import announcement
 from . import post
 from . import ip_filter
+from . import rejudge
 
 from .course import *
 from .engine import *
@@ -17,6 +18,7 @@ from .problem import *
 from .announcement import *
 from .post import *
 from .ip_filter import *
+from .rejudge import *
 
 __all__ = [
     *course.__all__,
@@ -28,4 +30,5 @@ __all__ = [
     *announcement.__all__,
     *post.__all__,
     *ip_filter.__all__,
+    *rejudge.__all__,
 ]
@@ -0,0 +1,228 @@
+'''
+Submission counters, per (problem, status) and per (user, problem). They are
+updated along with each status change of a submission, so statistics and
+list totals are read from a handful of small documents instead of counting
+the submissions. A course's total is the sum over its problems, which keeps
+it right when problems move between courses.
+
+The updates are not in a transaction with the submission, so a counter may
+drift if a worker dies in between, or while a submission is changed outside
+of `Submission`. `reconcile` recounts them and runs in the background.
+Counters of the submissions made before them are seeded by the migration
+`2026_10_18_000004_submission_counters`.
+'''
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import engine
+from .utils import PeriodicWorker
+
+AC = 0
+RECONCILE_INTERVAL = 6 * 60 * 60
+# SET NX gate: only one worker reconciles per interval
+RECONCILE_GATE_KEY = 'COUNTER_RECONCILE'
+# query args of `Submission.filter` the counters can answer
+COVERED_QUERY = {'problem', 'problem__in', 'user', 'status'}
+
+logger = logging.getLogger(__name__)
+
+
+def _inc_status(problem_id: int, status: int, n: int):
+    engine.SubmissionCount.objects(
+        problem_id=problem_id,
+        status=status,
+    ).update_one(upsert=True, inc__count=n)
+
+
+def add(problem_id: int, username: str, status: int, n: int = 1):
+    '''
+    count `n` more submissions in `status`, fewer if `n` is negative
+    '''
+    _inc_status(problem_id, status, n)
+    ks = {'inc__count': n}
+    if status == AC:
+        ks['inc__ac_count'] = n
+    engine.UserSubmissionCount.objects(
+        problem_id=problem_id,
+        user=username,
+    ).update_one(upsert=True, **ks)
+
+
+def move(problem_id: int, username: str, old: int, new: int, n: int = 1):
+    '''
+    `n` submissions change from status `old` to `new`
+    '''
+    if old == new:
+        return
+    _inc_status(problem_id, old, -n)
+    _inc_status(problem_id, new, n)
+    if AC in (old, new):
+        engine.UserSubmissionCount.objects(
+            problem_id=problem_id,
+            user=username,
+        ).update_one(
+            upsert=True,
+            inc__ac_count=n if new == AC else -n,
+        )
+
+
+def move_many(rows: Iterable[Dict[str, Any]], new: int):
+    '''
+    like `move`, for the output of grouping submissions by problem, user
+    and status, as `Submission.rejudge_many` does
+    '''
+    for row in rows:
+        _id = row['_id']
+        move(_id['problem'], _id['user'], _id['status'], new, row['count'])
+
+
+def status_count(problem_id: int) -> Dict[int, int]:
+    return {
+        c.status: c.count
+        for c in engine.SubmissionCount.objects(
+            problem_id=problem_id,
+            count__gt=0,
+        )
+    }
+
+
+def user_count(problem_id: int, ac: bool = False) -> int:
+    '''
+    the number of users who have tried, or solved, the problem
+    '''
+    if ac:
+        return engine.UserSubmissionCount.objects(
+            problem_id=problem_id,
+            ac_count__gt=0,
+        ).count()
+    return engine.UserSubmissionCount.objects(
+        problem_id=problem_id,
+        count__gt=0,
+    ).count()
+
+
+def count(q: Dict[str, Any]) -> Optional[int]:
+    '''
+    the number of submissions matching the query args built by
+    `Submission.filter`, None if the counters can not answer it
+    '''
+    if not set(q) <= COVERED_QUERY:
+        return None
+    status = q.get('status')
+    if 'user' in q:
+        # only accepted ones are counted per user
+        if status not in (None, AC):
+            return None
+        qs = engine.UserSubmissionCount.objects(user=q['user'].pk)
+        field = 'ac_count' if status == AC else 'count'
+    else:
+        qs = engine.SubmissionCount.objects()
+        if status is not None:
+            qs = qs.filter(status=status)
+        field = 'count'
+    if 'problem' in q:
+        qs = qs.filter(problem_id=q['problem'].problem_id)
+    elif 'problem__in' in q:
+        qs = qs.filter(problem_id__in=[p.problem_id for p in q['problem__in']])
+    return qs.sum(field)
+
+
+def _stored(status_qs, user_qs):
+    statuses = {
+        (c['problemId'], c['status']): c.get('count', 0)
+        for c in status_qs.as_pymongo()
+    }
+    users = {
+        (c['problemId'], c['user']): (c.get('count', 0), c.get('acCount', 0))
+        for c in user_qs.as_pymongo()
+    }
+    return statuses, users
+
+
+def reconcile(problem_ids: Optional[List[int]] = None) -> int:
+    '''
+    recount the counters of `problem_ids`, every problem by default, with
+    one pass over their submissions.
+
+    The counters keep moving during the pass, so they are read before and
+    after it. A problem whose counters changed in between is left to the
+    next run, the others are corrected by `$inc` of the difference, which
+    keeps the updates made after the pass.
+
+    Returns:
+        the number of problems recounted
+    '''
+    pipeline = [{
+        '$group': {
+            '_id': {
+                'problem': '$problem',
+                'user': '$user',
+                'status': '$status',
+            },
+            'count': {
+                '$sum': 1
+            },
+        },
+    }]
+    status_qs = engine.SubmissionCount.objects()
+    user_qs = engine.UserSubmissionCount.objects()
+    if problem_ids is not None:
+        problem_ids = [*problem_ids]
+        pipeline.insert(0, {'$match': {'problem': {'$in': problem_ids}}})
+        status_qs = status_qs.filter(problem_id__in=problem_ids)
+        user_qs = user_qs.filter(problem_id__in=problem_ids)
+    before = _stored(status_qs, user_qs)
+    statuses, users = Counter(), {}
+    for row in engine.Submission.objects.aggregate(pipeline):
+        _id = row['_id']
+        statuses[_id['problem'], _id['status']] += row['count']
+        cnt = users.setdefault((_id['problem'], _id['user']), [0, 0])
+        cnt[0] += row['count']
+        if _id['status'] == AC:
+            cnt[1] += row['count']
+    stored_statuses, stored_users = _stored(status_qs, user_qs)
+    busy = {
+        key[0]
+        for old, new in zip(before, (stored_statuses, stored_users))
+        for key in {*old, *new} if old.get(key) != new.get(key)
+    }
+    for key in {*statuses, *stored_statuses}:
+        if key[0] in busy:
+            continue
+        diff = statuses[key] - stored_statuses.get(key, 0)
+        if diff:
+            _inc_status(key[0], key[1], diff)
+    for key in {*users, *stored_users}:
+        if key[0] in busy:
+            continue
+        cnt = users.get(key, [0, 0])
+        stored = stored_users.get(key, (0, 0))
+        diff = (cnt[0] - stored[0], cnt[1] - stored[1])
+        if any(diff):
+            engine.UserSubmissionCount.objects(
+                problem_id=key[0],
+                user=key[1],
+            ).update_one(
+                upsert=True,
+                inc__count=diff[0],
+                inc__ac_count=diff[1],
+            )
+    problems = {p for p, _ in statuses} | {p for p, _ in stored_statuses}
+    return len(problems - busy)
+
+
+class CounterReconciler(PeriodicWorker):
+    '''
+    Background thread running `reconcile`, one worker per interval.
+    '''
+
+    def __init__(self, interval: float = RECONCILE_INTERVAL):
+        super().__init__('counter-reconciler', interval)
+
+    def run_once(self) -> Optional[int]:
+        if not self.take_gate(RECONCILE_GATE_KEY):
+            return None
+        cnt = reconcile()
+        logger.info(f'reconciled submission counters of {cnt} problems')
+        return cnt
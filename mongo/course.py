@@ -1,4 +1,5 @@
 from . import engine
+from . import counter
 from .user import *
 from .utils import *
 import re
@@ -83,7 +84,7 @@ class Course(MongoBase, engine=engine.Course):
             "homeworkCount":
             engine.Homework.objects(course_id=str(self.id)).count(),
             "submissionCount":
-            engine.Submission.objects(problem__in=problems).count(),
+            counter.count({'problem__in': problems}),
         }
 
     def edit_course(self, user, new_course, teacher):
@@ -165,11 +165,33 @@ class Homework(Document):
     course_id = StringField(required=True, db_field='courseId')
     duration = EmbeddedDocumentField(Duration, default=Duration)
     problem_ids = ListField(IntField(), db_field='problemIds')
-    student_status = DictField(db_field='studentStatus')
+    # usernames, their status is kept in `HomeworkProblemStatus`
+    students = ListField(StringField(max_length=16), default=list)
     ip_filters = ListField(StringField(max_length=64), default=list)
     penalty = StringField(max_length=10000, default='score = 0')
 
 
+class HomeworkProblemStatus(Document):
+    meta = {
+        'indexes': [{
+            'fields': ['homework', 'user', 'problem_id'],
+            'unique': True,
+        }],
+    }
+    homework = ReferenceField(
+        'Homework',
+        required=True,
+        reverse_delete_rule=CASCADE,
+    )
+    user = ReferenceField('User', required=True)
+    problem_id = IntField(required=True, db_field='problemId')
+    score = IntField(default=0)
+    # unset until a submission is judged
+    raw_score = IntField(db_field='rawScore')
+    problem_status = IntField(db_field='problemStatus')
+    submission_ids = ListField(StringField(), db_field='submissionIds')
+
+
 class Course(Document):
     course_name = StringField(
         max_length=64,
@@ -326,6 +348,16 @@ class CaseResult(EmbeddedDocument):
         max_length=256,
         db_field='outputMinioPath',
     )
+    # byte range of this case in `output_minio_path`, which is an archive
+    # shared by all cases of a result. None if the object holds only this case
+    output_offset = IntField(null=True, db_field='outputOffset')
+    output_size = IntField(null=True, db_field='outputSize')
+    # head of stdout/stderr kept inline, so showing a result needs no minio
+    # read; the sizes are of the whole outputs in bytes
+    stdout_preview = StringField(null=True, db_field='stdoutPreview')
+    stderr_preview = StringField(null=True, db_field='stderrPreview')
+    stdout_size = IntField(null=True, db_field='stdoutSize')
+    stderr_size = IntField(null=True, db_field='stderrSize')
 
 
 class TaskResult(EmbeddedDocument):
@@ -337,17 +369,23 @@ class TaskResult(EmbeddedDocument):
 
 
 class Submission(Document):
+    # matched to the queries in `mongo.submission`, `Problem` statistics and
+    # scoreboards, `tests/test_submission_indexes.py` checks they are used
     meta = {
         'indexes': [
-            (
-                'id',
-                'user',
-                'score',
-                'status',
-                'problem',
-                'language',
-                'timestamp',
-            ),
+            # lists, newest first, with the id breaking ties for cursors
+            ('-timestamp', '-id'),
+            ('user', '-timestamp', '-id'),
+            ('problem', '-timestamp', '-id'),
+            ('problem', 'status', '-timestamp', '-id'),
+            # high scores and scoreboards
+            ('problem', 'user', '-score'),
+            # fastest and smallest accepted submissions
+            ('problem', 'status', 'exec_time', 'id'),
+            ('problem', 'status', 'memory_usage', 'id'),
+            # objects still referred to, for `mongo.retention`
+            'tasks.cases.output_minio_path',
+            'code_minio_path',
         ]
     }
     problem = ReferenceField(Problem, required=True)
@@ -370,11 +408,86 @@ class Submission(Document):
         max_length=256,
         db_field='codeMinioPath',
     )
+    # sha256 hex digest of the code zip
+    code_checksum = StringField(
+        null=True,
+        max_length=64,
+        db_field='codeChecksum',
+    )
     last_send = DateTimeField(db_field='lastSend', default=datetime.now)
     comment = FileField(default=None, null=True)
     ip_addr = StringField(default=None, null=True)
 
 
+class CodeObject(Document):
+    '''
+    A content-addressed code zip in minio, shared by every submission
+    uploading the same bytes.
+    '''
+    # sha256 hex digest of the zip
+    checksum = StringField(primary_key=True, max_length=64)
+    ref_count = IntField(default=0, db_field='refCount')
+    # whether the object has been written to minio
+    stored = BooleanField(default=False)
+    # when the last reference was dropped
+    released_at = DateTimeField(null=True, db_field='releasedAt')
+
+
+class JudgeOutbox(Document):
+    '''
+    Side effects of a stored judge result, applied in the background by
+    `mongo.outbox.OutboxConsumer`.
+    '''
+    meta = {'indexes': ['available_at', 'lease']}
+    submission = ReferenceField(
+        Submission,
+        required=True,
+        reverse_delete_rule=CASCADE,
+    )
+    # steps already applied, skipped when the entry is retried
+    done = ListField(StringField(), default=list)
+    # set aside once it reaches `mongo.outbox.MAX_ATTEMPTS`
+    attempts = IntField(default=0)
+    # a claimed entry is retried after its lease runs out
+    available_at = DateTimeField(default=datetime.now, db_field='availableAt')
+    lease = StringField(null=True)
+
+
+class SubmissionCount(Document):
+    '''
+    Submissions of a problem in a status, maintained by `mongo.counter`.
+    '''
+    meta = {
+        'indexes': [{
+            'fields': ['problem_id', 'status'],
+            'unique': True,
+        }],
+    }
+    problem_id = IntField(required=True, db_field='problemId')
+    status = IntField(required=True)
+    count = IntField(default=0)
+
+
+class UserSubmissionCount(Document):
+    '''
+    Submissions of a user to a problem, maintained by `mongo.counter`.
+    '''
+    meta = {
+        'indexes': [
+            {
+                'fields': ['problem_id', 'user'],
+                'unique': True,
+            },
+            'user',
+        ],
+    }
+    problem_id = IntField(required=True, db_field='problemId')
+    user = ReferenceField('User', required=True)
+    count = IntField(default=0)
+    # accepted ones
+    ac_count = IntField(default=0, db_field='acCount')
+
+
 class Message(Document):
     timestamp = DateTimeField(default=datetime.now)
     sender = StringField(max_length=16, required=True)
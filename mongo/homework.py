@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from . import engine
 from .user import User
 from .base import MongoBase
@@ -97,17 +97,12 @@ class Homework(MongoBase, engine=engine.Homework):
             homework.duration.start = datetime.fromtimestamp(start)
         if end:
             homework.duration.end = datetime.fromtimestamp(end)
+        homework.students = [*course.student_nicknames]
         homework.save()
         # init student status
-        user_problems = {}
         for problem in problems:
-            problem_id = str(problem.problem_id)
-            user_problems[problem_id] = cls.default_problem_status()
             problem.update(push__homeworks=homework)
-        homework.update(student_status={
-            s: user_problems
-            for s in course.student_nicknames
-        })
+        cls._init_status(homework, homework.students, problem_ids)
         # add homework to course
         course.update(push__homeworks=homework.id)
         return homework
@@ -161,7 +156,6 @@ class Homework(MongoBase, engine=engine.Homework):
         homework.save()
         drop_ids = set(homework.problem_ids) - set(problem_ids)
         new_ids = set(problem_ids) - set(homework.problem_ids)
-        student_status = homework.student_status
         # add
         for pid in new_ids:
             problem = Problem(pid)
@@ -169,8 +163,7 @@ class Homework(MongoBase, engine=engine.Homework):
                 continue
             homework.update(push__problem_ids=pid)
             problem.update(push__homeworks=homework)
-            for key in course.student_nicknames:
-                student_status[key][str(pid)] = cls.default_problem_status()
+            cls._init_status(homework, homework.students, [pid])
         # delete
         for pid in drop_ids:
             problem = Problem(pid)
@@ -178,9 +171,10 @@ class Homework(MongoBase, engine=engine.Homework):
                 continue
             homework.update(pull__problem_ids=pid)
             problem.update(pull__homeworks=homework)
-            for status in student_status.values():
-                del status[str(pid)]
-        homework.update(student_status=student_status)
+            engine.HomeworkProblemStatus.objects(
+                homework=homework,
+                problem_id=pid,
+            ).delete()
         return homework
 
     # delete problems/paticipants in hw
@@ -235,23 +229,82 @@ class Homework(MongoBase, engine=engine.Homework):
             'submissionIds': [],
         }
 
+    @classmethod
+    def _init_status(
+        cls,
+        homework: engine.Homework,
+        usernames: List[str],
+        problem_ids: List[int],
+    ):
+        statuses = [
+            engine.HomeworkProblemStatus(
+                homework=homework,
+                user=username,
+                problem_id=pid,
+            ) for username in usernames for pid in problem_ids
+        ]
+        if statuses:
+            engine.HomeworkProblemStatus.objects.insert(
+                statuses,
+                load_bulk=False,
+            )
+
+    @staticmethod
+    def _to_problem_status(status: dict) -> dict:
+        ret = {
+            'score': status.get('score', 0),
+            'problemStatus': status.get('problemStatus'),
+            'submissionIds': status.get('submissionIds', []),
+        }
+        if 'rawScore' in status:
+            ret['rawScore'] = status['rawScore']
+        return ret
+
+    @property
+    def student_status(self) -> Dict[str, Dict[str, dict]]:
+        '''
+        status of all students, keyed by username and then problem id
+        '''
+        ret = {username: {} for username in self.students}
+        for status in engine.HomeworkProblemStatus.objects(
+                homework=self.id).as_pymongo():
+            ret.setdefault(status['user'], {})[str(
+                status['problemId'])] = self._to_problem_status(status)
+        return ret
+
+    def get_student_status(self, username: str) -> Optional[Dict[str, dict]]:
+        '''
+        status of one student keyed by problem id, None if the user is not
+        in this homework
+        '''
+        if username not in self.students:
+            return None
+        return {
+            str(status['problemId']): self._to_problem_status(status)
+            for status in engine.HomeworkProblemStatus.objects(
+                homework=self.id,
+                user=username,
+            ).as_pymongo()
+        }
+
     def add_student(self, students: List[User]):
-        if any(u.username in self.student_status for u in students):
+        if any(u.username in self.students for u in students):
             raise ValueError('Student already in homework')
-        user_status = {
-            str(pid): self.default_problem_status()
-            for pid in self.problem_ids
-        }
-        for student in students:
-            self.student_status[student.username] = user_status
-        self.save()
+        usernames = [u.username for u in students]
+        self.obj.update(push_all__students=usernames)
+        self.obj.reload('students')
+        self._init_status(self.obj, usernames, self.problem_ids)
 
     def remove_student(self, students: List[User]):
-        if any(u.username not in self.student_status for u in students):
+        if any(u.username not in self.students for u in students):
             raise ValueError('Student not in homework')
-        for student in students:
-            del self.student_status[student.username]
-        self.save()
+        usernames = [u.username for u in students]
+        self.obj.update(pull_all__students=usernames)
+        self.obj.reload('students')
+        engine.HomeworkProblemStatus.objects(
+            homework=self.id,
+            user__in=usernames,
+        ).delete()
 
     def do_penalty(self, submission, stat):
         d = {}
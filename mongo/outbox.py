@@ -0,0 +1,185 @@
+'''
+Side effects of judge results: user counters, homework status and the high
+score cache. `Submission.process_result` only writes an outbox entry next to
+the result, the consumer here applies the entries in batches.
+
+A batch is claimed with a lease, so consumers in every web worker can run
+at once, and an entry whose consumer died is retried after the lease. The
+steps applied are recorded on the entry and skipped on retry. Homework
+status and the cache are idempotent anyway, a user counter may be applied
+twice if a consumer dies right between applying and recording it, which is
+fine for a statistic. An entry failing `MAX_ATTEMPTS` times is logged and set
+aside instead of being retried forever.
+'''
+import logging
+import secrets
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from . import engine
+from .submission import Submission
+from .utils import PeriodicWorker, RedisCache
+
+BATCH_SIZE = 100
+LEASE = timedelta(minutes=1)
+POLL_INTERVAL = 1
+# an entry failing this many times is set aside instead of being retried
+MAX_ATTEMPTS = 5
+SET_ASIDE = 'set-aside'
+
+logger = logging.getLogger(__name__)
+
+
+def claim(
+    limit: int = BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> List[engine.JudgeOutbox]:
+    '''
+    take up to `limit` entries nobody else is working on
+    '''
+    if now is None:
+        now = datetime.now()
+    ids = [
+        *engine.JudgeOutbox.objects(
+            available_at__lte=now,
+            attempts__lt=MAX_ATTEMPTS,
+        ).order_by('available_at').limit(limit).scalar('id')
+    ]
+    if not ids:
+        return []
+    lease = secrets.token_hex(8)
+    # entries claimed by another consumer in between are not available
+    engine.JudgeOutbox.objects(
+        id__in=ids,
+        available_at__lte=now,
+    ).update(
+        lease=lease,
+        available_at=now + LEASE,
+        inc__attempts=1,
+    )
+    return [*engine.JudgeOutbox.objects(lease=lease).no_dereference()]
+
+
+def _mark(entries: List[engine.JudgeOutbox], step: str):
+    if entries:
+        engine.JudgeOutbox.objects(id__in=[e.id for e in entries]).update(
+            add_to_set__done=step)
+
+
+def _count_submissions(submissions: List[Submission]):
+    '''
+    one update per user for the whole batch
+    '''
+    counts = defaultdict(lambda: {'submission': 0, 'ac': 0, 'problems': set()})
+    for submission in submissions:
+        count = counts[submission.user.pk]
+        count['submission'] += 1
+        if submission.score == 100:
+            count['ac'] += 1
+            count['problems'].add(submission.problem_id)
+    for username, count in counts.items():
+        ks = {
+            'inc__submission': count['submission'],
+            'inc__AC_submission': count['ac'],
+        }
+        if count['problems']:
+            ks['add_to_set__AC_problem_ids'] = [*count['problems']]
+        engine.User.objects(username=username).update_one(**ks)
+
+
+def apply(entries: List[engine.JudgeOutbox]) -> int:
+    '''
+    apply the side effects of claimed entries, those failing are left to be
+    retried after their lease
+
+    Returns:
+        the number of finished entries
+    '''
+    submissions: Dict[str, Submission] = {
+        str(s.id): Submission(s)
+        for s in engine.Submission.objects(
+            id__in=[e.submission.id for e in entries])
+    }
+    live, finished = [], []
+    for entry in entries:
+        submission = submissions.get(str(entry.submission.id))
+        # rejudged since, the new result brings its own entry
+        if submission is None or submission.status < 0:
+            finished.append(entry)
+        else:
+            live.append((entry, submission))
+    pending = [(e, s) for e, s in live if 'user' not in e.done]
+    _count_submissions([s for _, s in pending])
+    _mark([e for e, _ in pending], 'user')
+    failed = set()
+    for entry, submission in live:
+        if 'homework' in entry.done:
+            continue
+        try:
+            submission.update_homework_status()
+        except Exception:
+            logger.exception(f'failed to update homework of {submission}')
+            failed.add(entry.id)
+    _mark([e for e, _ in live if e.id not in failed], 'homework')
+    keys = {s.high_score_key() for _, s in live}
+    if keys:
+        RedisCache().client.delete(*keys)
+    finished += [e for e, _ in live if e.id not in failed]
+    engine.JudgeOutbox.objects(id__in=[e.id for e in finished]).delete()
+    return len(finished)
+
+
+def set_aside(now: Optional[datetime] = None) -> int:
+    '''
+    log the entries that have failed `MAX_ATTEMPTS` times, they are no
+    longer claimed and kept under the `SET_ASIDE` lease. resetting their
+    attempts puts them back.
+
+    Returns:
+        the number of entries set aside
+    '''
+    if now is None:
+        now = datetime.now()
+    entries = [
+        *engine.JudgeOutbox.objects(
+            available_at__lte=now,
+            attempts__gte=MAX_ATTEMPTS,
+            lease__ne=SET_ASIDE,
+        ).no_dereference()
+    ]
+    for entry in entries:
+        logger.error(f'set aside outbox entry {entry.id} of submission '
+                     f'{entry.submission.id} after {entry.attempts} attempts, '
+                     f'done: {entry.done}')
+    if entries:
+        engine.JudgeOutbox.objects(id__in=[e.id for e in entries]).update(
+            lease=SET_ASIDE)
+    return len(entries)
+
+
+def drain(now: Optional[datetime] = None) -> int:
+    '''
+    apply every available entry
+
+    Returns:
+        the number of finished entries
+    '''
+    set_aside(now=now)
+    total = 0
+    while entries := claim(now=now):
+        total += apply(entries)
+    return total
+
+
+class OutboxConsumer(PeriodicWorker):
+    '''
+    Background thread applying the outbox. Started once per web worker,
+    the leases keep them from applying the same entry.
+    '''
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        super().__init__('outbox-consumer', interval)
+
+    def run_once(self) -> int:
+        return drain()
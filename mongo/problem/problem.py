@@ -13,6 +13,7 @@ from dataclasses import dataclass
 from io import BytesIO
 from ulid import ULID
 from .. import engine
+from .. import counter
 from ..base import MongoBase
 from ..course import *
 from ..utils import (RedisCache, doc_required, drop_none, MinioClient)
@@ -99,11 +100,8 @@ class Problem(MongoBase, engine=engine.Problem):
         '''
         Calculate how many submissions the user has submitted to this problem.
         '''
-        # reset quota if it's a new day
-        if user.last_submit.date() != datetime.now().date():
-            user.update(problem_submission={})
-            return 0
-        return user.problem_submission.get(str(self.problem_id), 0)
+        from .. import quota
+        return quota.submit_count(user, self.problem_id)
 
     def running_homeworks(self) -> List:
         from ..homework import Homework
@@ -113,30 +111,14 @@ class Problem(MongoBase, engine=engine.Problem):
     def is_valid_ip(self, ip: str):
         return all(hw.is_valid_ip(ip) for hw in self.running_homeworks())
 
-    def get_submission_status(self) -> Dict[str, int]:
-        pipeline = {
-            "$group": {
-                "_id": "$status",
-                "count": {
-                    "$sum": 1
-                },
-            }
-        }
-        cursor = engine.Submission.objects(problem=self.id).aggregate(
-            [pipeline], )
-        return {item['_id']: item['count'] for item in cursor}
+    def get_submission_status(self) -> Dict[int, int]:
+        return counter.status_count(self.id)
 
     def get_ac_user_count(self) -> int:
-        ac_users = engine.Submission.objects(
-            problem=self.id,
-            status=0,
-        ).distinct('user')
-        return len(ac_users)
+        return counter.user_count(self.id, ac=True)
 
     def get_tried_user_count(self) -> int:
-        tried_users = engine.Submission.objects(
-            problem=self.id, ).distinct('user')
-        return len(tried_users)
+        return counter.user_count(self.id)
 
     @doc_required('user', User)
     def high_score_key(self, user: User) -> str:
@@ -487,6 +469,20 @@ class Problem(MongoBase, engine=engine.Problem):
         # fallback to legacy GridFS storage
         return self.test_case.case_zip
 
+    def presigned_test_case_url(self, expires: timedelta) -> Optional[str]:
+        '''
+        a short-lived URL that a runner can download the test case from,
+        None if the test case is not stored in minio
+        '''
+        if self.test_case.case_zip_minio_path is None:
+            return None
+        minio_client = MinioClient()
+        return minio_client.client.presigned_get_object(
+            minio_client.bucket,
+            self.test_case.case_zip_minio_path,
+            expires=expires,
+        )
+
     def migrate_gridfs_to_minio(self):
         '''
         migrate test case from gridfs to minio
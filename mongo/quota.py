@@ -0,0 +1,159 @@
+'''
+Submission admission in Redis: a per-user rate limit and per-day quota
+counters, checked together in one round trip. Counters that are hot during
+exams (`Problem.submitter`) are written back to mongo in the background
+instead of on every submission.
+'''
+from datetime import date
+from typing import Optional
+
+from redis.exceptions import ResponseError
+
+from . import engine
+from .utils import PeriodicWorker, RedisCache
+
+# daily counters live a bit longer than the day they count
+COUNT_TTL = 2 * 24 * 60 * 60
+# HASH problem id -> submitter count not yet written back
+SUBMITTER_DELTA_KEY = 'SUBMITTER_DELTA'
+FLUSH_INTERVAL = 10
+# SET NX gate: only one worker flushes per interval
+FLUSH_GATE_KEY = 'SUBMITTER_DELTA_FLUSH'
+
+
+class RateLimited(Exception):
+
+    def __init__(self, wait_for: float):
+        super().__init__(f'wait for {wait_for:.2f} seconds')
+        self.wait_for = wait_for
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _rate_key(user) -> str:
+    return f'SUBMIT_RATE_{user.id}'
+
+
+def _count_key(user, day: Optional[date] = None) -> str:
+    if day is None:
+        day = date.today()
+    return f'SUBMIT_COUNT_{user.id}_{day.isoformat()}'
+
+
+def _stored_count(user, problem_id: int) -> int:
+    '''
+    today's count written to mongo, used to rebuild a lost redis counter
+    '''
+    if user.last_submit.date() != date.today():
+        return 0
+    return user.problem_submission.get(str(problem_id), 0)
+
+
+def admit(user, problem_id: int, rate_limit: int, quota: int) -> int:
+    '''
+    Take one submission of `problem_id` for `user` if the rate limit and the
+    daily quota allow.
+
+    Args:
+        rate_limit: minimum seconds between two submissions of a user
+        quota: daily submissions per problem, -1 means unlimited
+
+    Returns:
+        today's submission count of this problem, including this one
+
+    Raises:
+        RateLimited: the user submitted too fast
+        QuotaExceeded: the user has used all the quota
+    '''
+    client = RedisCache().client
+    rate_key, count_key = _rate_key(user), _count_key(user)
+    pipe = client.pipeline()
+    pipe.hincrby(count_key, problem_id, 1)
+    pipe.expire(count_key, COUNT_TTL)
+    if rate_limit > 0:
+        # a token bucket of size one: the token is back when the key expires
+        pipe.set(rate_key, 1, nx=True, px=int(rate_limit * 1000))
+        pipe.pttl(rate_key)
+    count, _, *rate = pipe.execute()
+    # the counter has been lost, e.g. redis restarted
+    if count == 1 and (stored := _stored_count(user, problem_id)):
+        count = client.hincrby(count_key, problem_id, stored)
+    if rate and not rate[0]:
+        client.hincrby(count_key, problem_id, -1)
+        raise RateLimited(max(rate[1], 0) / 1000)
+    if quota != -1 and count > quota:
+        refund(user, problem_id)
+        raise QuotaExceeded
+    return count
+
+
+def refund(user, problem_id: int):
+    '''
+    give back the submission taken by `admit`, for one that is not created
+    '''
+    pipe = RedisCache().client.pipeline()
+    pipe.hincrby(_count_key(user), problem_id, -1)
+    pipe.delete(_rate_key(user))
+    pipe.execute()
+
+
+def submit_count(user, problem_id: int) -> int:
+    '''
+    how many times `user` has submitted `problem_id` today
+    '''
+    count = RedisCache().client.hget(_count_key(user), problem_id)
+    if count is None:
+        return _stored_count(user, problem_id)
+    return int(count)
+
+
+def add_submitter(problem_id: int):
+    RedisCache().client.hincrby(SUBMITTER_DELTA_KEY, problem_id, 1)
+
+
+def flush_submitter() -> int:
+    '''
+    write the pending submitter counts back to mongo
+
+    Returns:
+        the number of updated problems
+    '''
+    client = RedisCache().client
+    key = f'{SUBMITTER_DELTA_KEY}_FLUSHING'
+    # take the pending deltas atomically, new ones go to a fresh hash
+    if not client.exists(key):
+        try:
+            client.rename(SUBMITTER_DELTA_KEY, key)
+        except ResponseError:
+            # nothing pending
+            return 0
+    # a flush dying halfway is retried from the renamed hash, so a count
+    # may be applied twice, which is fine for a statistic
+    deltas = client.hgetall(key)
+    for problem_id, delta in deltas.items():
+        engine.Problem.objects(problem_id=int(problem_id)).update(
+            inc__submitter=int(delta))
+    client.delete(key)
+    return len(deltas)
+
+
+class SubmitterFlusher(PeriodicWorker):
+    '''
+    Background thread writing submitter counts back, one worker per interval.
+    '''
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        super().__init__('submitter-flusher', interval)
+
+    def run_once(self) -> bool:
+        if not self.take_gate(FLUSH_GATE_KEY):
+            return False
+        flush_submitter()
+        return True
+
+    def stop(self):
+        super().stop()
+        # do not lose what is counted so far
+        flush_submitter()
@@ -0,0 +1,316 @@
+import json
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from redis.exceptions import WatchError
+from ulid import ULID
+
+from dispatch import job as dispatch_job
+from dispatch.job import _decode
+from . import engine
+from .utils import PeriodicWorker, RedisCache
+from .submission import Submission
+
+__all__ = ['RejudgeJob']
+
+logger = logging.getLogger(__name__)
+
+
+class RejudgeJob:
+    '''
+    Rejudge a large set of submissions in the background. The progress is
+    kept in Redis so any web worker can report it, and it expires a day
+    after the job stopped updating it. A worker runs a job only while it
+    holds the job's lock, so a job left by a dead worker is resumed by
+    `RejudgeResumer` once the lock expires.
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    BATCH_SIZE = 100
+    # default throttle, in submissions per second
+    RATE = 20
+    # wait for runners to catch up while the judge queue is this long
+    MAX_PENDING = 500
+    TTL = 24 * 60 * 60
+    # ids read from mongo at once while taking the snapshot
+    QUERY_PAGE_SIZE = 1000
+    # the lock expires this many seconds after the runner stops renewing it
+    LOCK_TTL = 60
+    # ids of the jobs not finished yet
+    ACTIVE_KEY = 'REJUDGE_JOBS'
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+
+    @property
+    def key(self):
+        return f'REJUDGE_JOB_{self.id}'
+
+    @property
+    def ids_key(self):
+        return f'REJUDGE_JOB_{self.id}_IDS'
+
+    @property
+    def lock_key(self):
+        return f'REJUDGE_JOB_{self.id}_LOCK'
+
+    @classmethod
+    def query(
+        cls,
+        problem_ids: List[int],
+        status: Optional[int] = None,
+        language_type: Optional[List[int]] = None,
+        before: Optional[datetime] = None,
+        after: Optional[datetime] = None,
+    ) -> Iterator[str]:
+        '''
+        ids of submissions matching the scope, excluding those are not
+        judged yet, oldest first. they are read page by page along `_id`.
+        '''
+        q = {
+            'problem__in': problem_ids,
+            'status': status,
+            'language__in': language_type,
+            'timestamp__lte': before,
+            'timestamp__gte': after,
+        }
+        q = {k: v for k, v in q.items() if v is not None}
+        if status is None:
+            q['status__gte'] = 0
+        qs = engine.Submission.objects(**q)
+        # handwritten submissions are graded by teachers
+        qs = qs.filter(language__ne=3).order_by('id')
+        last = None
+        while True:
+            page = qs if last is None else qs.filter(id__gt=last)
+            page = [*page.limit(cls.QUERY_PAGE_SIZE).scalar('id')]
+            yield from map(str, page)
+            if len(page) < cls.QUERY_PAGE_SIZE:
+                return
+            last = page[-1]
+
+    @classmethod
+    def create(
+        cls,
+        submission_ids: Iterable[str],
+        requester: str,
+        scope: Dict[str, Any],
+        rate: Optional[float] = None,
+    ) -> 'RejudgeJob':
+        '''
+        snapshot the submissions to rejudge, call `start` to run it
+        '''
+        job = cls(str(ULID()))
+        client = RedisCache().client
+        total, page = 0, []
+
+        def push():
+            pipe = client.pipeline()
+            pipe.rpush(job.ids_key, *page)
+            pipe.expire(job.ids_key, cls.TTL)
+            pipe.execute()
+
+        for _id in submission_ids:
+            page.append(_id)
+            if len(page) == cls.QUERY_PAGE_SIZE:
+                push()
+                total, page = total + len(page), []
+        if page:
+            push()
+            total += len(page)
+        now = time.time()
+        pipe = client.pipeline()
+        pipe.hset(
+            job.key,
+            mapping={
+                'state': cls.QUEUED,
+                'requester': requester,
+                'scope': json.dumps(scope),
+                'rate': rate or cls.RATE,
+                'total': total,
+                'done': 0,
+                'createdAt': now,
+                'updatedAt': now,
+            },
+        )
+        pipe.expire(job.key, cls.TTL)
+        pipe.sadd(cls.ACTIVE_KEY, job.id)
+        pipe.execute()
+        return job
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(
+            target=self.run,
+            name=f'rejudge-{self.id}',
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def _set(self, **ks):
+        pipe = RedisCache().client.pipeline()
+        pipe.hset(self.key, mapping={**ks, 'updatedAt': time.time()})
+        pipe.expire(self.key, self.TTL)
+        pipe.expire(self.ids_key, self.TTL)
+        pipe.execute()
+
+    def _hold(self, owner: str, ttl: float = 0) -> bool:
+        '''
+        keep the lock for `LOCK_TTL` more seconds after `ttl`, False if it
+        has been lost
+        '''
+        # compare-and-expire: never extend a lock re-taken by another worker
+        with RedisCache().client.pipeline() as pipe:
+            try:
+                pipe.watch(self.lock_key)
+                if _decode(pipe.get(self.lock_key)) != owner:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.expire(self.lock_key, int(self.LOCK_TTL + ttl))
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    def _release(self, owner: str):
+        with RedisCache().client.pipeline() as pipe:
+            try:
+                pipe.watch(self.lock_key)
+                if _decode(pipe.get(self.lock_key)) != owner:
+                    pipe.unwatch()
+                    return
+                pipe.multi()
+                pipe.delete(self.lock_key)
+                pipe.execute()
+            except WatchError:
+                pass
+
+    def run(self):
+        '''
+        rejudge batch by batch, at most `rate` submissions per second and
+        never flooding the judge queue. it continues from the progress left
+        by the last run, and returns at once if another one holds the job.
+        '''
+        client = RedisCache().client
+        owner = secrets.token_hex(8)
+        if not client.set(self.lock_key, owner, nx=True, ex=self.LOCK_TTL):
+            return
+        try:
+            self._run(owner)
+        finally:
+            self._release(owner)
+
+    def _run(self, owner: str):
+        client = RedisCache().client
+        info = self.info()
+        if info is None:
+            client.srem(self.ACTIVE_KEY, self.id)
+            return
+        if info['state'] in (self.DONE, self.FAILED):
+            return
+        rate = float(info['rate'])
+        done = info['done']
+        if info['state'] == self.QUEUED:
+            self._set(state=self.RUNNING, startedAt=time.time())
+        try:
+            while True:
+                batch = [
+                    _decode(_id) for _id in client.lrange(
+                        self.ids_key,
+                        done,
+                        done + self.BATCH_SIZE - 1,
+                    )
+                ]
+                if not batch:
+                    break
+                while dispatch_job.queue_length() > self.MAX_PENDING:
+                    if not self._hold(owner):
+                        return
+                    time.sleep(1)
+                begin = time.monotonic()
+                Submission.rejudge_many(batch)
+                done += len(batch)
+                self._set(done=done)
+                # throttle
+                wait = max(0, len(batch) / rate - (time.monotonic() - begin))
+                if not self._hold(owner, wait):
+                    return
+                time.sleep(wait)
+        except Exception as e:
+            logger.exception(f'rejudge job {self.id} failed')
+            self._set(state=self.FAILED, error=str(e))
+        else:
+            self._set(state=self.DONE, finishedAt=time.time())
+        client.srem(self.ACTIVE_KEY, self.id)
+
+    @classmethod
+    def resume(cls) -> List['RejudgeJob']:
+        '''
+        start the unfinished jobs nobody is running
+
+        Returns:
+            the jobs started
+        '''
+        client = RedisCache().client
+        ret = []
+        for job_id in map(_decode, client.smembers(cls.ACTIVE_KEY)):
+            job = cls(job_id)
+            if not client.exists(job.key):
+                client.srem(cls.ACTIVE_KEY, job_id)
+            elif not client.exists(job.lock_key):
+                job.start()
+                ret.append(job)
+        return ret
+
+    def info(self) -> Optional[Dict[str, Any]]:
+        '''
+        progress of this job, or None if it does not exist
+        '''
+        raw = RedisCache().client.hgetall(self.key)
+        if not raw:
+            return None
+        raw = {_decode(k): _decode(v) for k, v in raw.items()}
+        total, done = int(raw['total']), int(raw['done'])
+        eta = None
+        if raw['state'] == self.RUNNING and done > 0:
+            elapsed = float(raw['updatedAt']) - float(raw['startedAt'])
+            eta = (total - done) * elapsed / done
+        elif raw['state'] == self.DONE:
+            eta = 0
+        return {
+            'id': self.id,
+            'state': raw['state'],
+            'requester': raw['requester'],
+            'scope': json.loads(raw['scope']),
+            'rate': float(raw['rate']),
+            'total': total,
+            'done': done,
+            'eta': eta,
+            'createdAt': float(raw['createdAt']),
+            'updatedAt': float(raw['updatedAt']),
+            'error': raw.get('error'),
+        }
+
+
+class RejudgeResumer(PeriodicWorker):
+    '''
+    Background thread resuming the rejudge jobs left by dead workers. Their
+    locks expire within `RejudgeJob.LOCK_TTL`, so it checks that often.
+    '''
+
+    def __init__(self, interval: float = RejudgeJob.LOCK_TTL):
+        super().__init__('rejudge-resumer', interval)
+
+    def run_once(self) -> List[RejudgeJob]:
+        jobs = RejudgeJob.resume()
+        for job in jobs:
+            logger.info(f'resume rejudge job {job.id}')
+        return jobs
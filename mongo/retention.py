@@ -0,0 +1,168 @@
+'''
+Retention of judge outputs. Outputs past the retention policy are dropped
+from their submissions, then the objects in MinIO that no submission refers
+to any more (dropped, rejudged or deleted ones) are removed in batches.
+'''
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from minio.deleteobjects import DeleteObject
+from mongoengine import Q
+
+from config import settings
+from . import engine
+from .submission import Submission
+from .utils import MinioClient, PeriodicWorker
+
+# results and legacy code objects are stored under this prefix, content
+# addressed code objects are pruned by `Submission.prune_code_objects`
+OUTPUT_PREFIX = 'submissions/'
+# outputs are uploaded before the result is saved, so a young object may
+# belong to a result being written
+ORPHAN_GRACE = timedelta(hours=1)
+BATCH_SIZE = 1000
+SWEEP_INTERVAL = 60 * 60
+# SET NX gate: only one worker sweeps per interval
+SWEEP_GATE_KEY = 'OUTPUT_SWEEP'
+
+logger = logging.getLogger(__name__)
+
+
+def _with_outputs():
+    return engine.Submission.objects(
+        Q(tasks__cases__output_minio_path__ne=None)
+        | Q(tasks__cases__output__ne=None))
+
+
+def _batches(it, size: int) -> Iterator[List]:
+    batch = []
+    for item in it:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def expire_outputs(
+    days: Optional[int] = None,
+    keep_latest: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> int:
+    '''
+    drop the outputs of submissions older than `days`, and of those beyond
+    each user's latest `keep_latest` judged submissions of a problem
+
+    Returns:
+        the number of submissions whose outputs are dropped
+    '''
+    if now is None:
+        now = datetime.now()
+    ids = set()
+    if days is not None:
+        ids.update(_with_outputs().filter(timestamp__lt=now -
+                                          timedelta(days=days)).scalar('id'))
+    if keep_latest is not None:
+        # only the users with more submissions of a problem than that, as
+        # told by the counters, can have outputs to drop
+        pairs = engine.UserSubmissionCount.objects(count__gt=keep_latest).only(
+            'problem_id', 'user').as_pymongo()
+        for pair in pairs:
+            ids.update(_with_outputs().filter(
+                problem=pair['problemId'],
+                user=pair['user'],
+            ).order_by('-timestamp').skip(keep_latest).scalar('id'))
+    for batch in _batches(ids, BATCH_SIZE):
+        for submission in engine.Submission.objects(id__in=batch):
+            Submission(submission).delete_output()
+    return len(ids)
+
+
+def _referenced(paths: List[str]) -> set:
+    # both branches are served by their own index
+    qs = engine.Submission.objects(
+        Q(tasks__cases__output_minio_path__in=paths)
+        | Q(code_minio_path__in=paths))
+    return {
+        *qs.distinct('tasks.cases.output_minio_path'),
+        *qs.distinct('code_minio_path'),
+    }
+
+
+def sweep_orphans(
+    grace: timedelta = ORPHAN_GRACE,
+    now: Optional[datetime] = None,
+) -> Dict[str, int]:
+    '''
+    remove objects under `OUTPUT_PREFIX` no submission refers to
+
+    Returns:
+        the number of removed objects and their total bytes
+    '''
+    if now is None:
+        now = datetime.now()
+    cutoff = now.astimezone() - grace
+    minio_client = MinioClient()
+    objects = (obj for obj in minio_client.client.list_objects(
+        minio_client.bucket,
+        prefix=OUTPUT_PREFIX,
+        recursive=True,
+    ) if obj.last_modified is None or obj.last_modified < cutoff)
+    removed, reclaimed = 0, 0
+    for batch in _batches(objects, BATCH_SIZE):
+        referenced = _referenced([obj.object_name for obj in batch])
+        orphans = {
+            obj.object_name: obj.size
+            for obj in batch if obj.object_name not in referenced
+        }
+        if not orphans:
+            continue
+        errors = minio_client.client.remove_objects(
+            minio_client.bucket,
+            [DeleteObject(name) for name in orphans],
+        )
+        for error in errors:
+            logger.error(f'failed to remove {error.name}: {error.message}')
+            orphans.pop(error.name, None)
+        removed += len(orphans)
+        reclaimed += sum(orphans.values())
+    return {'objects': removed, 'bytes': reclaimed}
+
+
+def sweep(now: Optional[datetime] = None) -> Dict[str, int]:
+    '''
+    apply the retention policy in `settings` and reclaim the storage
+
+    Returns:
+        what has been done, to be logged
+    '''
+    expired = expire_outputs(
+        days=settings.OUTPUT_RETENTION_DAYS,
+        keep_latest=settings.OUTPUT_KEEP_LATEST,
+        now=now,
+    )
+    orphans = sweep_orphans(grace=ORPHAN_GRACE, now=now)
+    return {
+        'expired': expired,
+        'removedObjects': orphans['objects'],
+        'reclaimedBytes': orphans['bytes'],
+        'prunedCodeObjects': Submission.prune_code_objects(),
+    }
+
+
+class OutputSweeper(PeriodicWorker):
+    '''
+    Background thread running `sweep`, one worker per interval.
+    '''
+
+    def __init__(self, interval: float = SWEEP_INTERVAL):
+        super().__init__('output-sweeper', interval)
+
+    def run_once(self) -> Optional[Dict[str, int]]:
+        if not self.take_gate(SWEEP_GATE_KEY):
+            return None
+        report = sweep()
+        logger.info(f'output sweep: {report}')
+        return report
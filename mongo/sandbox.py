@@ -1,6 +1,15 @@
+import asyncio
 import secrets
+from typing import Iterable, List, Optional, Union
+
+import httpx
+
+from . import engine
 from .submission import Submission
 
+# upper bound of one probe round over all sandboxes, in seconds
+PROBE_DEADLINE = 5.0
+
 
 def find_by_token(token: str):
     '''
@@ -11,3 +20,44 @@ def find_by_token(token: str):
         if secrets.compare_digest(token, sandbox.token):
             return sandbox
     return None
+
+
+async def _probe_all(sandboxes, deadline, transport):
+    async with httpx.AsyncClient(
+            timeout=deadline,
+            transport=transport,
+    ) as client:
+        tasks = [
+            asyncio.ensure_future(client.get(f'{sb.url}/status'))
+            for sb in sandboxes
+        ]
+        if not tasks:
+            return []
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return [
+        httpx.TimeoutException(f'no response in {deadline}s')
+        if task in pending else task.exception() or task.result()
+        for task in tasks
+    ]
+
+
+def probe_all(
+    sandboxes: Iterable[engine.Sandbox],
+    deadline: Optional[float] = None,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> List[Union[httpx.Response, Exception]]:
+    '''
+    Query `/status` of all sandboxes concurrently. The whole call returns
+    within `deadline` (default `PROBE_DEADLINE`) seconds, so a dead sandbox costs one timeout rather
+    than one per sandbox.
+
+    Returns:
+        the response, or the exception raised by the request, of each
+        sandbox in the given order
+    '''
+    if deadline is None:
+        deadline = PROBE_DEADLINE
+    return asyncio.run(_probe_all([*sandboxes], deadline, transport))
@@ -1,60 +1,63 @@
 from __future__ import annotations
 import io
 import os
+import json
+import base64
+import binascii
+import codecs
+import struct
 import pathlib
-import secrets
-import logging
 from typing import (
     Any,
     Dict,
     Optional,
     Union,
     List,
+    Iterable,
+    Iterator,
+    Tuple,
     TypedDict,
 )
 import enum
-import httpx
-from hashlib import md5
+from dataclasses import dataclass
+from hashlib import md5, sha256
+from bson import ObjectId
+from bson.errors import InvalidId
 from bson.son import SON
-from tempfile import NamedTemporaryFile
-from datetime import date, datetime
-from zipfile import ZipFile, is_zipfile
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import (
+    ZIP_BZIP2,
+    ZIP_DEFLATED,
+    ZIP_LZMA,
+    ZIP_STORED,
+    ZipFile,
+    is_zipfile,
+)
+from redis.exceptions import WatchError
 from ulid import ULID
 
 from config import settings
+from dispatch import job as dispatch_job
 from . import engine
+from . import counter
 from .base import MongoBase
 from .user import User
 from .problem import Problem
 from .homework import Homework
 from .course import Course
-from .utils import RedisCache, MinioClient, is_testing
+from .utils import RedisCache, MinioClient, MinioObjectFile
 
 __all__ = [
     'SubmissionConfig',
     'Submission',
-    'JudgeQueueFullError',
+    'Admission',
     'TestCaseNotFound',
+    'OutputExpired',
 ]
 
-# TODO: modular token function
-
-
-def gen_key(_id):
-    return f'stoekn_{_id}'
-
-
-def gen_token():
-    return secrets.token_urlsafe()
-
 
 # Errors
-class JudgeQueueFullError(Exception):
-    '''
-    when sandbox task queue is full
-    '''
-
-
 class TestCaseNotFound(Exception):
     '''
     when a problem's testcase havn't been uploaded
@@ -68,6 +71,12 @@ class TestCaseNotFound(Exception):
         return f'{Problem(self.problem_id)}\'s testcase is not found'
 
 
+class OutputExpired(Exception):
+    '''
+    when a judged submission's output has been dropped by the retention
+    '''
+
+
 class SubmissionCodeNotFound(Exception):
     '''
     when a submission's code is not found
@@ -82,6 +91,18 @@ class SubmissionResultOutput(TypedDict):
     stderr: str | bytes
 
 
+def _file_checksum(file) -> str:
+    '''
+    sha256 hex digest of a seekable binary file, read in chunks
+    '''
+    h = sha256()
+    file.seek(0)
+    while chunk := file.read(1 << 20):
+        h.update(chunk)
+    file.seek(0)
+    return h.hexdigest()
+
+
 class SubmissionConfig(MongoBase, engine=engine.SubmissionConfig):
     TMP_DIR = pathlib.Path(settings.SUBMISSION_TMP_DIR)
 
@@ -89,6 +110,194 @@ class SubmissionConfig(MongoBase, engine=engine.SubmissionConfig):
         self.name = name
 
 
+def _read_object(minio_client: MinioClient, path: str, **ks) -> bytes:
+    try:
+        resp = minio_client.client.get_object(minio_client.bucket, path, **ks)
+        return resp.read()
+    finally:
+        if 'resp' in locals():
+            resp.close()
+            resp.release_conn()
+
+
+OUTPUT_CODECS = {
+    'stored': ZIP_STORED,
+    'deflate': ZIP_DEFLATED,
+    'bzip2': ZIP_BZIP2,
+    'lzma': ZIP_LZMA,
+}
+
+
+def zip_output(
+    stdout: str,
+    stderr: str,
+    codec: Optional[str] = None,
+    compresslevel: Optional[int] = None,
+) -> bytes:
+    '''
+    pack stdout/stderr of a case into a zip in memory, compressed by
+    `codec` (`settings.OUTPUT_CODEC` by default)
+    '''
+    if codec is None:
+        codec = settings.OUTPUT_CODEC
+        compresslevel = settings.OUTPUT_COMPRESSLEVEL
+    buf = io.BytesIO()
+    with ZipFile(
+            buf,
+            'w',
+            compression=OUTPUT_CODECS[codec],
+            compresslevel=compresslevel,
+    ) as zf:
+        zf.writestr('stdout', stdout)
+        zf.writestr('stderr', stderr)
+    return buf.getvalue()
+
+
+def _utf8_head(data: bytes) -> str:
+    '''
+    decode a prefix of utf-8 text, dropping a character cut in half
+    '''
+    return codecs.getincrementaldecoder('utf-8')().decode(data)
+
+
+def _course_role(course: engine.Course, user: User) -> int:
+    '''
+    same as `utils.perm`, but compares the references without loading the
+    users behind them
+    '''
+    return 4 - [
+        user.role == 0,
+        course.teacher is not None and course.teacher.id == user.pk,
+        any(ta.id == user.pk for ta in course.tas),
+        user.username in course.student_nicknames,
+        True,
+    ].index(True)
+
+
+class CaseOutputStream:
+    '''
+    stdout or stderr of a case, read out of its zipped output lazily so it
+    can be streamed without holding the whole output in memory
+    '''
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fp, name: str, raw: Optional[MinioObjectFile] = None):
+        self.zf = ZipFile(fp)
+        self.info = self.zf.getinfo(name)
+        self.raw = raw
+
+    @property
+    def size(self) -> int:
+        return self.info.file_size
+
+    def iter_bytes(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> Iterator[bytes]:
+        '''
+        stream bytes in [start, end) of the content
+        '''
+        if end is None or end > self.size:
+            end = self.size
+        if self.raw is not None and self.info.compress_type == ZIP_STORED:
+            # a stored member is a plain byte range of the object, skip the
+            # local file header (30 bytes, then the name and extra field)
+            header = self.raw.read_at(self.info.header_offset, 30)
+            name_len, extra_len = struct.unpack('<HH', header[26:30])
+            begin = self.info.header_offset + 30 + name_len + extra_len
+            yield from self.raw.iter_range(
+                begin + start,
+                begin + end,
+                self.CHUNK_SIZE,
+            )
+            return
+        with self.zf.open(self.info) as f:
+            f.seek(start)
+            remain = end - start
+            while remain > 0:
+                chunk = f.read(min(self.CHUNK_SIZE, remain))
+                if not chunk:
+                    break
+                remain -= len(chunk)
+                yield chunk
+
+    def close(self):
+        self.zf.close()
+
+
+@dataclass
+class Admission:
+    '''
+    The documents checked before accepting a submission, fetched with one
+    query per collection and projected to the checked fields. References
+    are kept as `DBRef`s, so reading them never hits the database.
+    '''
+    problem: Problem
+    courses: List[engine.Course]
+    homeworks: List[engine.Homework]
+
+    PROBLEM_FIELDS = (
+        'problem_id',
+        'courses',
+        'homeworks',
+        'problem_status',
+        'problem_type',
+        'owner',
+        'allowed_language',
+        'quota',
+    )
+
+    @classmethod
+    def load(cls, problem_id: int) -> Optional['Admission']:
+        qs = engine.Problem.objects(problem_id=problem_id)
+        problem = qs.only(*cls.PROBLEM_FIELDS).no_dereference().first()
+        if problem is None:
+            return None
+        courses, homeworks = [], []
+        if problem.courses:
+            courses = list(
+                engine.Course.objects(
+                    id__in=[ref.id for ref in problem.courses]).only(
+                        'teacher',
+                        'tas',
+                        'student_nicknames',
+                    ).no_dereference())
+        if problem.homeworks:
+            homeworks = list(
+                engine.Homework.objects(
+                    id__in=[ref.id for ref in problem.homeworks]).only(
+                        'duration',
+                        'ip_filters',
+                    ))
+        return cls(Problem(problem), courses, homeworks)
+
+    def can_view(self, user: User) -> bool:
+        '''
+        `Problem.Permission.VIEW` without loading the courses again
+        '''
+        if user.role == 0 or self.problem.owner == user.username:
+            return True
+        return any(_course_role(c, user) > 0 for c in self.courses)
+
+    def can_grade(self, user: User) -> bool:
+        '''
+        whether the user is a teacher or TA of one of the problem's courses
+        '''
+        return any(_course_role(c, user) >= 2 for c in self.courses)
+
+    def started(self, now: datetime) -> bool:
+        return all(now >= hw.duration.start for hw in self.homeworks)
+
+    def is_valid_ip(self, ip: str, now: datetime) -> bool:
+        '''
+        `Problem.is_valid_ip` with the loaded homeworks
+        '''
+        return all(
+            Homework(hw).is_valid_ip(ip) for hw in self.homeworks
+            if now in hw.duration)
+
+
 class Submission(MongoBase, engine=engine.Submission):
 
     class Permission(enum.IntFlag):
@@ -104,9 +313,59 @@ class Submission(MongoBase, engine=engine.Submission):
         MANAGER = STUDENT | COMMENT | REJUDGE | GRADE | VIEW_OUTPUT
 
     _config = None
+    # bytes of stdout/stderr per case shown in the detailed result, also
+    # stored inline on each case result
+    OUTPUT_PREVIEW_SIZE = 1024
+    OUTPUT_PREVIEW_KEYS = (
+        'stdoutPreview',
+        'stderrPreview',
+        'stdoutSize',
+        'stderrSize',
+    )
+    # upper bound of concurrent output reads of one submission
+    OUTPUT_FETCH_WORKERS = 8
+    # sort orders of `filter`: (field, direction), ties are broken by id
+    SORT_KEYS = {
+        None: ('timestamp', -1),
+        'runTime': ('exec_time', 1),
+        'memoryUsage': ('memory_usage', 1),
+    }
+    # how `filter` counts: `scan` counts the matching submissions, `counter`
+    # reads `mongo.counter` when it covers the query and scans otherwise,
+    # `estimate` stops scanning at `ESTIMATE_LIMIT` instead
+    COUNT_MODES = ('scan', 'counter', 'estimate')
+    ESTIMATE_LIMIT = 10000
+    # rendered list entries are cached per submission and dropped when the
+    # result changes, the judged ones for longer
+    ENTRY_TTL = 60 * 60
+    PENDING_ENTRY_TTL = 15
+    # fields rendered by `to_dict`, list views load only these instead of
+    # every task and case result
+    SUMMARY_FIELDS = (
+        'problem',
+        'user',
+        'language',
+        'timestamp',
+        'status',
+        'score',
+        'exec_time',
+        'memory_usage',
+        'code_minio_path',
+        'code_checksum',
+        'last_send',
+        'ip_addr',
+    )
+    # fields of `engine.User.info`, loaded for the users of a list
+    USER_INFO_FIELDS = (
+        'username',
+        'profile.displayed_name',
+        'md5',
+        'role',
+    )
 
     def __init__(self, submission_id):
-        self.submission_id = str(submission_id)
+        # `submission_id` may also be a loaded document
+        self.submission_id = str(self.obj.id)
 
     def __str__(self):
         return f'submission [{self.submission_id}]'
@@ -174,11 +433,19 @@ class Submission(MongoBase, engine=engine.Submission):
 
     @classmethod
     def config(cls):
-        if not cls._config:
-            cls._config = SubmissionConfig('submission')
+        # reload on every call since admins edit it from any worker, but in
+        # one round trip instead of checking the existence first
+        if cls._config is not None:
+            try:
+                cls._config.obj.reload()
+                return cls._config
+            except engine.DoesNotExist:
+                pass
+        # first call, or the config has been dropped
+        cls._config = SubmissionConfig('submission')
         if not cls._config:
             cls._config.save()
-        return cls._config.reload()
+        return cls._config
 
     def get_single_output(
         self,
@@ -190,36 +457,78 @@ class Submission(MongoBase, engine=engine.Submission):
             case = self.tasks[task_no].cases[case_no]
         except IndexError:
             raise FileNotFoundError('task not exist')
-        ret = {}
-        try:
-            with ZipFile(self._get_output_raw(case)) as zf:
-                ret = {k: zf.read(k) for k in ('stdout', 'stderr')}
-                if text:
-                    ret = {k: v.decode('utf-8') for k, v in ret.items()}
-        except AttributeError:
-            raise AttributeError('The submission is still in pending')
+        self._check_output(case)
+        with ZipFile(self._get_output_raw(case)) as zf:
+            ret = {k: zf.read(k) for k in ('stdout', 'stderr')}
+            if text:
+                ret = {k: v.decode('utf-8') for k, v in ret.items()}
         return ret
 
+    def _check_output(self, case: engine.CaseResult):
+        '''
+        raise if the case has no output, telling a pending submission from
+        one whose output has expired
+        '''
+        if case.output_minio_path is not None:
+            return
+        if case.output is not None and case.output.grid_id is not None:
+            return
+        # the loaded document may predate a rejudge
+        status = engine.Submission.objects(id=self.id).scalar('status').first()
+        if status is None or status < 0:
+            raise AttributeError('The submission is still in pending')
+        raise OutputExpired('The output has expired')
+
+    def open_output(
+        self,
+        task_no: int,
+        case_no: int,
+        fd: str,
+    ) -> CaseOutputStream:
+        '''
+        open stdout or stderr of a case for streaming
+        '''
+        try:
+            case = self.tasks[task_no].cases[case_no]
+        except IndexError:
+            raise FileNotFoundError('task not exist')
+        self._check_output(case)
+        if case.output_minio_path is None:
+            # outputs left in gridfs are small, read them as they are
+            return CaseOutputStream(case.output, fd)
+        raw = MinioObjectFile(
+            MinioClient(),
+            case.output_minio_path,
+            offset=case.output_offset or 0,
+            size=case.output_size,
+        )
+        # zipfile makes small reads while locating and inflating members,
+        # buffer them instead of issuing a GET for each
+        fp = io.BufferedReader(raw, CaseOutputStream.CHUNK_SIZE)
+        return CaseOutputStream(fp, fd, raw)
+
     def _get_output_raw(self, case: engine.CaseResult) -> io.BytesIO:
         '''
         get a output blob of a submission result
         '''
         if case.output_minio_path is not None:
-            # get from minio
-            minio_client = MinioClient()
-            try:
-                resp = minio_client.client.get_object(
-                    minio_client.bucket,
-                    case.output_minio_path,
-                )
-                return io.BytesIO(resp.read())
-            finally:
-                if 'resp' in locals():
-                    resp.close()
-                    resp.release_conn()
+            return io.BytesIO(self._get_minio_output(case))
         # fallback to gridfs
         return case.output
 
+    def _get_minio_output(self, case: engine.CaseResult) -> bytes:
+        '''
+        read the zipped output of a case from minio, only its own byte range
+        if it lives in a result archive
+        '''
+        ranged = {}
+        if case.output_size is not None:
+            ranged = {
+                'offset': case.output_offset,
+                'length': case.output_size,
+            }
+        return _read_object(MinioClient(), case.output_minio_path, **ranged)
+
     def delete_output(self, *args):
         '''
         delete stdout/stderr of this submission
@@ -231,6 +540,9 @@ class Submission(MongoBase, engine=engine.Submission):
             for case in task.cases:
                 case.output.delete()
                 case.output_minio_path = None
+                case.output_offset = case.output_size = None
+                case.stdout_preview = case.stderr_preview = None
+                case.stdout_size = case.stderr_size = None
         self.save()
 
     def delete(self, *keeps):
@@ -246,6 +558,7 @@ class Submission(MongoBase, engine=engine.Submission):
         drops = {'comment', 'code', 'output'} - {*keeps}
         del_funcs = {
             'output': self.delete_output,
+            'code': self.delete_code,
         }
 
         def default_del_func(d):
@@ -253,55 +566,20 @@ class Submission(MongoBase, engine=engine.Submission):
 
         for d in drops:
             del_funcs.get(d, default_del_func)(d)
+        dispatch_job.cancel(self.id)
         self.obj.delete()
+        counter.add(self.problem_id, self.username, self.status, -1)
+        self.invalidate_entry()
 
-    def sandbox_resp_handler(self, resp):
-        # judge queue is currently full
-        def on_500(resp):
-            raise JudgeQueueFullError
-
-        # backend send some invalid data
-        def on_400(resp):
-            raise ValueError(resp.text)
-
-        # send a invalid token
-        def on_403(resp):
-            raise ValueError('invalid token')
-
-        h = {
-            500: on_500,
-            403: on_403,
-            400: on_400,
-            200: lambda r: True,
-        }
-        try:
-            return h[resp.status_code](resp)
-        except KeyError:
-            self.logger.error('can not handle response from sandbox')
-            self.logger.error(
-                f'status code: {resp.status_code}\n'
-                f'headers: {resp.headers}\n'
-                f'body: {resp.text}', )
-            return False
+    def delete_code(self, *args):
+        '''
+        delete code in gridfs and release the reference to the minio one
 
-    def target_sandbox(self, client: httpx.Client | None = None):
-        if client is None:
-            client = httpx.Client(timeout=5.0)
-        load = 10**3  # current min load
-        tar = None  # target
-        for sb in self.config().sandbox_instances:
-            resp = client.get(f'{sb.url}/status')
-            if not resp.is_success:
-                self.logger.warning(f'sandbox {sb.name} status exception')
-                self.logger.warning(
-                    f'status code: {resp.status_code}\n '
-                    f'body: {resp.text}', )
-                continue
-            resp = resp.json()
-            if resp['load'] < load:
-                load = resp['load']
-                tar = sb
-        return tar
+        Args:
+            args: ignored value, don't mind
+        '''
+        self.obj.code.delete()
+        self._release_code()
 
     def get_comment(self) -> bytes:
         '''
@@ -340,47 +618,182 @@ class Submission(MongoBase, engine=engine.Submission):
         file.seek(0)
         return None
 
-    def rejudge(self, client: httpx.Client | None = None) -> bool:
+    def rejudge(self) -> bool:
         '''
         rejudge this submission
         '''
         # delete output file
         self.delete_output()
         # turn back to haven't be judged
+        counter.move(self.problem_id, self.username, self.status, -1)
         self.update(
             status=-1,
             last_send=datetime.now(),
             tasks=[],
         )
-        if is_testing():
-            return True
-        return self.send(client=client)
+        self.invalidate_entry()
+        self.enqueue()
+        return True
 
-    def _generate_code_minio_path(self):
-        return f'submissions/{self.id}_{ULID()}.zip'
+    @classmethod
+    def rejudge_many(cls, submission_ids: List[str]) -> int:
+        '''
+        rejudge a batch of submissions with a constant number of queries,
+        used by bulk rejudge jobs
 
-    def _put_code(self, code_file) -> str:
+        Returns:
+            the number of enqueued submissions
         '''
-        put code file to minio, return the object name
+        qs = engine.Submission.objects(id__in=submission_ids)
+        # collect gridfs outputs left by old submissions, outputs in minio
+        # are dropped along with the task results
+        grid_ids = {}
+        for submission in qs.only('tasks'):
+            for task in submission.tasks:
+                for case in task.cases:
+                    if case.output is not None and case.output.grid_id:
+                        grid_ids.setdefault(case.output.collection_name,
+                                            []).append(case.output.grid_id)
+        db = engine.Submission._get_db()
+        for collection_name, ids in grid_ids.items():
+            db[f'{collection_name}.files'].delete_many({'_id': {'$in': ids}})
+            db[f'{collection_name}.chunks'].delete_many(
+                {'files_id': {
+                    '$in': ids
+                }})
+        # turn back to haven't be judged
+        ids = [str(_id) for _id in qs.scalar('id')]
+        counter.move_many(
+            qs.aggregate([{
+                '$group': {
+                    '_id': {
+                        'problem': '$problem',
+                        'user': '$user',
+                        'status': '$status',
+                    },
+                    'count': {
+                        '$sum': 1
+                    },
+                },
+            }]),
+            -1,
+        )
+        qs.update(
+            status=-1,
+            last_send=datetime.now(),
+            tasks=[],
+        )
+        cls.invalidate_entries(ids)
+        # bulk rejudges must not delay live submissions
+        for _id in ids:
+            dispatch_job.enqueue(_id, dispatch_job.BACKGROUND)
+        return len(ids)
+
+    @staticmethod
+    def _generate_code_minio_path(checksum: str):
+        return f'code/{checksum}.zip'
+
+    def _put_code(self, code_file) -> Tuple[str, str]:
+        '''
+        put code file to minio, keyed by its content. uploading bytes that
+        are already stored only takes a reference to the existing object.
+
+        Args:
+            code_file: a seekable binary file, it is never loaded into
+                memory as a whole
+
+        Returns:
+            the object name and the sha256 hex digest of the file
         '''
+        # only reads the central directory
         if (err := self._check_code(code_file)) is not None:
             raise ValueError(err)
+        checksum = _file_checksum(code_file)
+        size = code_file.seek(0, os.SEEK_END)
+        code_file.seek(0)
+        path = self._generate_code_minio_path(checksum)
+        code_object = engine.CodeObject.objects(pk=checksum).modify(
+            upsert=True,
+            new=True,
+            inc__ref_count=1,
+            set__released_at=None,
+        )
+        # concurrent first uploads may both put, which is harmless since
+        # they write the same bytes
+        if not code_object.stored:
+            minio_client = MinioClient()
+            try:
+                # a known length lets minio stream the file instead of
+                # buffering 5 MiB parts in memory
+                minio_client.client.put_object(
+                    minio_client.bucket,
+                    path,
+                    code_file,
+                    size,
+                    content_type='application/zip',
+                )
+            except Exception:
+                # nobody owns the reference taken above
+                self._drop_code_reference(checksum)
+                raise
+            code_object.update(stored=True)
+        return path, checksum
 
-        minio_client = MinioClient()
-        path = self._generate_code_minio_path()
-        minio_client.client.put_object(
-            minio_client.bucket,
-            path,
-            code_file,
-            -1,
-            part_size=5 * 1024 * 1024,
-            content_type='application/zip',
+    @staticmethod
+    def _drop_code_reference(checksum: str):
+        code_object = engine.CodeObject.objects(pk=checksum).modify(
+            new=True,
+            dec__ref_count=1,
         )
-        return path
+        if code_object is not None and code_object.ref_count <= 0:
+            engine.CodeObject.objects(
+                pk=checksum,
+                ref_count__lte=0,
+            ).update(set__released_at=datetime.now())
+
+    def _release_code(self):
+        '''
+        drop the reference to the content-addressed code object. objects
+        nobody refers to are removed by `prune_code_objects` later, after a
+        grace period in which a new upload may still take them back.
+        '''
+        if self.code_checksum is None or self.code_minio_path != \
+                self._generate_code_minio_path(self.code_checksum):
+            return
+        self._drop_code_reference(self.code_checksum)
+
+    @classmethod
+    def prune_code_objects(cls, grace: timedelta = timedelta(hours=1)) -> int:
+        '''
+        remove the code objects that have been unreferenced for `grace`
+
+        Returns:
+            the number of removed objects
+        '''
+        cutoff = datetime.now() - grace
+        minio_client = MinioClient()
+        cnt = 0
+        for code_object in engine.CodeObject.objects(
+                ref_count__lte=0,
+                released_at__lt=cutoff,
+        ):
+            # conditional delete, lose to any upload taking it back
+            if not engine.CodeObject.objects(
+                    pk=code_object.pk,
+                    ref_count__lte=0,
+                    released_at__lt=cutoff,
+            ).delete():
+                continue
+            minio_client.client.remove_object(
+                minio_client.bucket,
+                cls._generate_code_minio_path(code_object.checksum),
+            )
+            cnt += 1
+        return cnt
 
-    def submit(self, code_file, client: httpx.Client | None = None) -> bool:
+    def submit(self, code_file) -> bool:
         '''
-        prepare data for submit code to sandbox and then send it
+        store the code and enqueue a judge job for it
 
         Args:
             code_file: a zip file contains user's code
@@ -388,11 +801,15 @@ class Submission(MongoBase, engine=engine.Submission):
         # unexisted id
         if not self:
             raise engine.DoesNotExist(f'{self}')
+        code_minio_path, code_checksum = self._put_code(code_file)
+        counter.move(self.problem_id, self.username, self.status, -1)
         self.update(
             status=-1,
             last_send=datetime.now(),
-            code_minio_path=self._put_code(code_file),
+            code_minio_path=code_minio_path,
+            code_checksum=code_checksum,
         )
+        self.invalidate_entry()
         self.reload()
         self.logger.debug(f'{self} code updated.')
         # delete old handwritten submission
@@ -404,58 +821,86 @@ class Submission(MongoBase, engine=engine.Submission):
             }
             for submission in engine.Submission.objects(**q):
                 if submission != self.obj:
-                    for homework in self.problem.homeworks:
-                        stat = homework.student_status[self.user.username][str(
-                            self.problem_id)]
-                        stat['score'] = 0
-                        stat['problemStatus'] = -1
-                        stat['submissionIds'] = []
-                        homework.save()
-                    submission.delete()
-        # we no need to actually send code to sandbox during testing
-        if is_testing() or self.handwritten:
-            return True
-        return self.send(client=client)
+                    engine.HomeworkProblemStatus.objects(
+                        homework__in=[*self._homeworks()],
+                        user=self.username,
+                        problem_id=self.problem_id,
+                    ).update(
+                        score=0,
+                        problem_status=-1,
+                        submission_ids=[],
+                    )
+                    Submission(submission).delete()
+        # handwritten submission is judged by teacher
+        if not self.handwritten:
+            self.enqueue()
+        return True
 
-    def send(self, client: httpx.Client | None = None) -> bool:
+    def judge_lane(self) -> str:
         '''
-        send code to sandbox
+        priority lane of this submission's judge job, decided by the state
+        of the homeworks containing its problem
         '''
-        if self.handwritten:
-            logging.warning(f'try to send a handwritten {self}')
-            return False
-        if client is None:
-            client = httpx.Client(timeout=httpx.Timeout(5.0, read=30.0))
-        # TODO: Ensure problem is ready to submitted
-        # if not Problem(self.problem).is_test_case_ready():
-        #     raise TestCaseNotFound(self.problem.problem_id)
-        # setup post body
-        files = {
-            'src': io.BytesIO(b"".join(self._get_code_raw())),
-        }
-        # look for the target sandbox
-        tar = self.target_sandbox(client=client)
-        if tar is None:
-            self.logger.error(f'can not target a sandbox for {repr(self)}')
-            return False
-        # save token for validation
-        Submission.assign_token(self.id, tar.token)
-        post_data = {
-            'token': tar.token,
-            'checker': 'print("not implement yet. qaq")',
-            'problem_id': self.problem_id,
-            'language': self.language,
-        }
-        judge_url = f'{tar.url}/submit/{self.id}'
-        # send submission to snadbox for judgement
-        self.logger.info(f'send {self} to {tar.name}')
-        resp = client.post(
-            judge_url,
-            data=post_data,
-            files=files,
+        homeworks = Problem(self.problem).running_homeworks()
+        # a running homework restricted by ip is an exam
+        if any(hw.ip_filters for hw in homeworks):
+            return dispatch_job.EXAM
+        if homeworks:
+            return dispatch_job.NORMAL
+        # practice in public course only
+        if all(course.course_name == 'Public'
+               for course in self.problem.courses):
+            return dispatch_job.BACKGROUND
+        return dispatch_job.NORMAL
+
+    def enqueue(self, lane: Optional[str] = None) -> str:
+        '''
+        put a judge job into the dispatch queue, superseding the previous one
+
+        Args:
+            lane: priority lane, derived by `judge_lane` if not given
+
+        Returns:
+            the job id
+        '''
+        if lane is None:
+            lane = self.judge_lane()
+        job_id = dispatch_job.enqueue(self.id, lane)
+        self.logger.info(f'enqueue {self} as {job_id} in {lane} lane')
+        return job_id
+
+    def mark_judge_error(self):
+        '''
+        give up judging, e.g. every runner leasing it has died
+        '''
+        JE = self.status2code['JE']
+        counter.move(self.problem_id, self.username, self.status, JE)
+        self.update(status=JE, score=0)
+        self.invalidate_entry()
+        self.reload()
+
+    def grade(self, score: int):
+        '''
+        a teacher's score of a handwritten submission
+        '''
+        status = 0 if score == 100 else 1
+        counter.move(self.problem_id, self.username, self.status, status)
+        self.update(score=score, status=status)
+        self.invalidate_entry()
+        self.obj.reload('score', 'status')
+
+    def presigned_code_url(self, expires: timedelta) -> Optional[str]:
+        '''
+        a short-lived URL that a runner can download the code zip from
+        '''
+        if self.code_minio_path is None:
+            return None
+        minio_client = MinioClient()
+        return minio_client.client.presigned_get_object(
+            minio_client.bucket,
+            self.code_minio_path,
+            expires=expires,
         )
-        self.logger.info(f'recieve {self} resp from sandbox')
-        return self.sandbox_resp_handler(resp)
 
     def process_result(self, tasks: list):
         '''
@@ -481,38 +926,25 @@ class Submission(MongoBase, engine=engine.Submission):
                 # convert status into integer
                 case['status'] = self.status2code.get(case['status'], -3)
         # process task
-        minio_client = MinioClient()
+        # outputs of all cases are packed into one archive, each case is a
+        # standalone zip at the recorded offset
+        archive = io.BytesIO()
+        archive_path = self._generate_output_archive_path()
         for i, cases in enumerate(tasks):
-            # save stdout/stderr
-            fds = ['stdout', 'stderr']
             for j, case in enumerate(cases):
-                tf = NamedTemporaryFile(delete=True)
-                with ZipFile(tf, 'w') as zf:
-                    for fd in fds:
-                        content = case.pop(fd)
-                        if content is None:
-                            self.logger.error(
-                                f'key {fd} not in case result {self} {i:02d}{j:02d}'
-                            )
-                        zf.writestr(fd, content)
-                tf.seek(0)
-                # upload to minio
-                output_minio_path = self._generate_output_minio_path(i, j)
-                minio_client.client.put_object(
-                    minio_client.bucket,
-                    output_minio_path,
-                    io.BytesIO(tf.read()),
-                    -1,
-                    part_size=5 * 1024 * 1024,  # 5MB
-                    content_type='application/zip',
-                )
+                preview = self._inline_preview(case)
+                output = self._zip_output(case, i, j)
                 # convert dict to document
                 cases[j] = engine.CaseResult(
                     status=case['status'],
                     exec_time=case['execTime'],
                     memory_usage=case['memoryUsage'],
-                    output_minio_path=output_minio_path,
+                    output_minio_path=archive_path,
+                    output_offset=archive.tell(),
+                    output_size=len(output),
+                    **preview,
                 )
+                archive.write(output)
             status = max(c.status for c in cases)
             exec_time = max(c.exec_time for c in cases)
             memory_usage = max(c.memory_usage for c in cases)
@@ -524,9 +956,20 @@ class Submission(MongoBase, engine=engine.Submission):
                 if status == 0 else 0,
                 cases=cases,
             )
+        length = archive.tell()
+        archive.seek(0)
+        minio_client = MinioClient()
+        minio_client.client.put_object(
+            minio_client.bucket,
+            archive_path,
+            archive,
+            length,
+            content_type='application/octet-stream',
+        )
         status = max(t.status for t in tasks)
         exec_time = max(t.exec_time for t in tasks)
         memory_usage = max(t.memory_usage for t in tasks)
+        counter.move(self.problem_id, self.username, self.status, status)
         self.update(
             score=sum(task.score for task in tasks),
             status=status,
@@ -534,52 +977,147 @@ class Submission(MongoBase, engine=engine.Submission):
             exec_time=exec_time,
             memory_usage=memory_usage,
         )
+        # the side effects are applied in the background, so the sandbox
+        # does not wait for them
+        engine.JudgeOutbox(submission=self.obj).save()
+        self.invalidate_entry()
         self.reload()
-        self.finish_judging()
         return True
 
+    def _inline_preview(self, case: dict) -> Dict[str, Any]:
+        '''
+        the head of stdout/stderr and their sizes, to be stored on the case
+        '''
+        ret = {}
+        for fd in ('stdout', 'stderr'):
+            content = (case.get(fd) or '').encode('utf-8')
+            ret[f'{fd}_preview'] = _utf8_head(
+                content[:self.OUTPUT_PREVIEW_SIZE])
+            ret[f'{fd}_size'] = len(content)
+        return ret
+
+    def _zip_output(self, case: dict, task_no: int, case_no: int) -> bytes:
+        '''
+        pack stdout/stderr of a case result into a zip in memory
+        '''
+        for fd in ('stdout', 'stderr'):
+            if case.get(fd) is None:
+                self.logger.error(
+                    f'key {fd} not in case result {self} {task_no:02d}{case_no:02d}'
+                )
+        return zip_output(case.pop('stdout'), case.pop('stderr'))
+
     def _generate_output_minio_path(self, task_no: int, case_no: int) -> str:
         '''
         generate a output file path for minio
         '''
         return f'submissions/{self.id}_task{task_no:02d}_case{case_no:02d}_{ULID()}.zip'
 
+    def _generate_output_archive_path(self) -> str:
+        '''
+        generate a path for the output archive of a whole result
+        '''
+        return f'submissions/{self.id}_output_{ULID()}.bin'
+
     def finish_judging(self):
+        '''
+        apply the side effects of a judge result right away, stored results
+        leave them to `mongo.outbox` instead
+        '''
         # update user's submission
         User(self.username).add_submission(self)
-        # update homework data
-        for homework in self.problem.homeworks:
-            try:
-                stat = homework.student_status[self.username][str(
-                    self.problem_id)]
-            except KeyError:
+        self.update_homework_status()
+        RedisCache().delete(self.high_score_key())
+
+    def high_score_key(self) -> str:
+        return Problem(self.problem).high_score_key(user=self.user)
+
+    def update_homework_status(self):
+        # handwritten problem is judged by teacher
+        if self.handwritten:
+            return
+        for homework in self._homeworks():
+            if not self._update_homework_status(homework):
                 self.logger.warning(
                     f'{self} not in {homework} [user={self.username}, problem={self.problem_id}]'
                 )
-                continue
-            if self.handwritten:
-                continue
-            if 'rawScore' not in stat:
-                stat['rawScore'] = 0
-            stat['submissionIds'].append(self.id)
-            # handwritten problem will only keep the last submission
-            if self.handwritten:
-                stat['submissionIds'] = stat['submissionIds'][-1:]
-            # if the homework is overdue, do the penalty
-            if self.timestamp > homework.duration.end and not self.handwritten and homework.penalty is not None:
-                self.score, stat['rawScore'] = Homework(homework).do_penalty(
-                    self, stat)
-            else:
-                if self.score > stat['rawScore']:
-                    stat['rawScore'] = self.score
-            # update high score / handwritten problem is judged by teacher
-            if self.score >= stat['score'] or self.handwritten:
-                stat['score'] = self.score
-                stat['problemStatus'] = self.status
-
-            homework.save()
-        key = Problem(self.problem).high_score_key(user=self.user)
-        RedisCache().delete(key)
+
+    def _homeworks(self):
+        '''
+        the homeworks containing this problem, with only what grading needs
+        '''
+        problem = engine.Problem.objects(
+            pk=self.problem_id).only('homeworks').no_dereference().get()
+        return engine.Homework.objects(
+            id__in=[ref.id for ref in problem.homeworks]).only(
+                'homework_name',
+                'duration',
+                'penalty',
+            )
+
+    def _homework_status(self, homework: engine.Homework, **ks):
+        return engine.HomeworkProblemStatus.objects(
+            homework=homework,
+            user=self.username,
+            problem_id=self.problem_id,
+            **ks,
+        )
+
+    def _update_homework_status(self, homework: engine.Homework) -> bool:
+        '''
+        record this submission in the homework status of its user and
+        problem. Each write is conditioned on what it was computed from, so
+        concurrent results are not lost.
+
+        Returns:
+            whether the status exists
+        '''
+        if self.timestamp > homework.duration.end and homework.penalty is not None:
+            return self._update_homework_status_overdue(homework)
+        # update high score with the status it came from
+        if self._homework_status(homework, score__lte=self.score).update_one(
+                add_to_set__submission_ids=self.id,
+                max__raw_score=self.score,
+                set__score=self.score,
+                set__problem_status=self.status,
+        ):
+            return True
+        return bool(
+            self._homework_status(homework).update_one(
+                add_to_set__submission_ids=self.id,
+                max__raw_score=self.score,
+            ))
+
+    def _update_homework_status_overdue(
+        self,
+        homework: engine.Homework,
+    ) -> bool:
+        '''
+        the penalty depends on the raw score recorded before, so the status
+        is compared and set, and recomputed if another result got there first
+        '''
+        score = self.score
+        while True:
+            status = self._homework_status(homework).first()
+            if status is None:
+                return False
+            stat = {
+                'score': status.score,
+                'rawScore': status.raw_score or 0,
+            }
+            self.score = score
+            self.score, raw_score = Homework(homework).do_penalty(self, stat)
+            if self._homework_status(
+                    homework,
+                    score=status.score,
+                    raw_score=status.raw_score,
+            ).update_one(
+                    add_to_set__submission_ids=self.id,
+                    set__raw_score=raw_score,
+                    set__score=self.score,
+                    set__problem_status=self.status,
+            ):
+                return True
 
     def add_comment(self, file):
         '''
@@ -623,7 +1161,18 @@ class Submission(MongoBase, engine=engine.Submission):
         sort_by: Optional[str] = None,
         with_count: bool = False,
         ip_addr: Optional[str] = None,
+        fields: Optional[Iterable[str]] = SUMMARY_FIELDS,
+        cursor: Optional[str] = None,
+        count_mode: str = 'scan',
     ):
+        '''
+        Args:
+            fields: fields to load, the whole documents if None
+            cursor: continue after the submission it is made from by
+                `encode_cursor`, `offset` is counted from there
+            count_mode: how the count is taken with `with_count`, one of
+                `COUNT_MODES`
+        '''
         if before is not None and after is not None:
             if after > before:
                 raise ValueError('the query period is empty')
@@ -633,6 +1182,12 @@ class Submission(MongoBase, engine=engine.Submission):
             raise ValueError(f'count must >=-1!')
         if sort_by is not None and sort_by not in ['runTime', 'memoryUsage']:
             raise ValueError(f'can only sort by runTime or memoryUsage')
+        if count_mode not in cls.COUNT_MODES:
+            raise ValueError(
+                f'count mode must be one of {", ".join(cls.COUNT_MODES)}')
+        after_cursor = None
+        if cursor is not None:
+            after_cursor = cls._decode_cursor(cursor, sort_by)
         wont_have_results = False
         if isinstance(problem, int):
             problem = Problem(problem).obj
@@ -677,9 +1232,17 @@ class Submission(MongoBase, engine=engine.Submission):
         }
         q = {k: v for k, v in q.items() if v is not None}
         # sort by upload time
-        submissions = engine.Submission.objects(
-            **q).order_by(sort_by if sort_by is not None else '-timestamp')
-        submission_count = submissions.count()
+        field, direction = cls.SORT_KEYS[sort_by]
+        sign = '-' if direction < 0 else ''
+        submissions = engine.Submission.objects(**q)
+        submission_count = None
+        if with_count:
+            submission_count = cls._count(submissions, q, count_mode)
+        if after_cursor is not None:
+            submissions = submissions.filter(after_cursor)
+        submissions = submissions.order_by(f'{sign}{field}', f'{sign}id')
+        if fields is not None:
+            submissions = submissions.only(*fields)
         # truncate
         if count == -1:
             submissions = submissions[offset:]
@@ -690,11 +1253,58 @@ class Submission(MongoBase, engine=engine.Submission):
             return submissions, submission_count
         return submissions
 
+    @classmethod
+    def _count(cls, submissions, q: Dict[str, Any], count_mode: str) -> int:
+        if count_mode != 'scan':
+            if (cnt := counter.count(q)) is not None:
+                return cnt
+        if count_mode == 'estimate':
+            # stop counting at the limit instead of scanning everything
+            return submissions.limit(
+                cls.ESTIMATE_LIMIT).count(with_limit_and_skip=True)
+        return submissions.count()
+
+    @classmethod
+    def encode_cursor(
+        cls,
+        submission: Submission,
+        sort_by: Optional[str] = None,
+    ) -> str:
+        '''
+        an opaque cursor for `filter` to continue after `submission`
+        '''
+        field, _ = cls.SORT_KEYS[sort_by]
+        value = getattr(submission, field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        raw = json.dumps([sort_by, value, str(submission.obj.id)])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @classmethod
+    def _decode_cursor(cls, cursor: str, sort_by: Optional[str]) -> engine.Q:
+        field, direction = cls.SORT_KEYS[sort_by]
+        try:
+            key, value, _id = json.loads(base64.urlsafe_b64decode(cursor))
+            _id = ObjectId(_id)
+            if key != sort_by:
+                raise ValueError
+            if field == 'timestamp':
+                value = datetime.fromisoformat(value)
+        except (ValueError, TypeError, InvalidId, binascii.Error):
+            raise ValueError('invalid cursor')
+        op = 'lt' if direction < 0 else 'gt'
+        # a seek on the sort index no matter how deep the page is
+        return engine.Q(**{f'{field}__{op}': value}) | engine.Q(
+            **{
+                field: value,
+                f'id__{op}': _id,
+            })
+
     @classmethod
     def add(
         cls,
-        problem_id: int,
-        username: str,
+        problem_id: Union[int, Problem],
+        username: Union[str, User],
         lang: int,
         timestamp: Optional[date] = None,
         ip_addr: Optional[str] = None,
@@ -702,15 +1312,22 @@ class Submission(MongoBase, engine=engine.Submission):
         '''
         Insert a new submission into db
 
+        Args:
+            problem_id: a problem id, or a `Problem` already loaded by the
+                caller, which is trusted to exist
+            username: a username, or a loaded `User`, same as above
+
         Returns:
             The created submission
         '''
         # check existence
-        user = User(username)
-        if not user:
+        if isinstance(username, User):
+            user = username
+        elif not (user := User(username)):
             raise engine.DoesNotExist(f'{user} does not exist')
-        problem = Problem(problem_id)
-        if not problem:
+        if isinstance(problem_id, Problem):
+            problem = problem_id
+        elif not (problem := Problem(problem_id)):
             raise engine.DoesNotExist(f'{problem} dose not exist')
         # TODO: Ensure problem is ready to submitted
         # if not problem.is_test_case_ready():
@@ -724,42 +1341,178 @@ class Submission(MongoBase, engine=engine.Submission):
                                        timestamp=timestamp,
                                        ip_addr=ip_addr)
         submission.save()
-        return cls(submission.id)
+        counter.add(problem.problem_id, user.username, submission.status)
+        return cls(submission)
+
+    @staticmethod
+    def _entry_key(_id: str) -> str:
+        return f'SUBMISSION_ENTRY_{_id}'
+
+    @staticmethod
+    def _entry_gen_key(_id: str) -> str:
+        return f'SUBMISSION_ENTRY_GEN_{_id}'
+
+    def invalidate_entry(self):
+        self.invalidate_entries([self.id])
 
     @classmethod
-    def assign_token(cls, submission_id, token=None):
+    def invalidate_entries(cls, ids: Iterable[str]):
         '''
-        generate a token for the submission
+        drop the cached entries, and bump their generations so an entry
+        rendered from rows loaded before is not cached
         '''
-        if token is None:
-            token = gen_token()
-        RedisCache().set(gen_key(submission_id), token)
-        return token
+        ids = [*ids]
+        if not ids:
+            return
+        pipe = RedisCache().client.pipeline()
+        for _id in ids:
+            pipe.incr(cls._entry_gen_key(_id))
+            pipe.expire(cls._entry_gen_key(_id), cls.ENTRY_TTL)
+        pipe.delete(*map(cls._entry_key, ids))
+        pipe.execute()
 
     @classmethod
-    def verify_token(cls, submission_id, token):
-        cache = RedisCache()
-        key = gen_key(submission_id)
-        s_token = cache.get(key)
-        if s_token is None:
-            return False
-        s_token = s_token.decode('ascii')
-        valid = secrets.compare_digest(s_token, token)
-        if valid:
-            cache.delete(key)
-        return valid
-
-    def to_dict(self) -> Dict[str, Any]:
-        ret = self._to_dict()
+    def cache_entries(
+        cls,
+        submissions: Iterable['Submission'],
+        gens: Dict[str, Optional[bytes]],
+    ) -> Dict[str, Dict[str, Any]]:
+        '''
+        render submissions by `to_dict` and cache them as list entries. an
+        entry is only cached if its generation is still the one in `gens`,
+        read before the submissions were loaded. user info is not cached,
+        only the username.
+
+        Returns:
+            the entries keyed by submission id
+        '''
+        submissions = [*submissions]
+        if not submissions:
+            return {}
+        entries = dict(
+            zip((s.id for s in submissions), cls.to_dicts(submissions)))
+        keys = [cls._entry_gen_key(s.id) for s in submissions]
+        with RedisCache().client.pipeline() as pipe:
+            try:
+                pipe.watch(*keys)
+                current = pipe.mget(keys)
+                pipe.multi()
+                for submission, gen in zip(submissions, current):
+                    # invalidated since it was loaded
+                    if gen != gens.get(submission.id):
+                        continue
+                    entry = {
+                        **entries[submission.id],
+                        'user':
+                        cls._username(submission),
+                    }
+                    # a judged result only changes by a rejudge, which
+                    # drops it
+                    ttl = cls.ENTRY_TTL if submission.status >= 0 \
+                        else cls.PENDING_ENTRY_TTL
+                    pipe.set(
+                        cls._entry_key(submission.id),
+                        json.dumps(entry),
+                        ex=ttl,
+                    )
+                pipe.execute()
+            except WatchError:
+                # invalidated while being written, left uncached
+                pass
+        return entries
+
+    @classmethod
+    def get_entries(cls, ids: List[str]) -> List[Dict[str, Any]]:
+        '''
+        rendered submissions of `ids` in the same order, those not cached are
+        loaded with one query. deleted submissions are left out.
+        '''
+        if not ids:
+            return []
+        client = RedisCache().client
+        entries = {
+            _id: json.loads(entry)
+            for _id, entry in zip(
+                ids,
+                client.mget([cls._entry_key(_id) for _id in ids]),
+            ) if entry is not None
+        }
+        users = cls._user_infos({e['user'] for e in entries.values()})
+        for entry in entries.values():
+            entry['user'] = users.get(entry['user'])
+        if missing := [_id for _id in ids if _id not in entries]:
+            # read before loading, so a change after it is not cached
+            gens = dict(
+                zip(
+                    missing,
+                    client.mget([cls._entry_gen_key(_id) for _id in missing]),
+                ))
+            entries.update(
+                cls.cache_entries(
+                    (cls(s) for s in engine.Submission.objects(
+                        id__in=missing).only(*cls.SUMMARY_FIELDS)),
+                    gens,
+                ))
+        return [entries[_id] for _id in ids if _id in entries]
+
+    @staticmethod
+    def _username(submission: 'Submission') -> str:
+        # the reference is stored as the username, reading it from the raw
+        # document does not dereference it
+        return submission.to_mongo(fields=('user', ))['user']
+
+    @classmethod
+    def _user_infos(cls, usernames: Iterable[str]) -> Dict[str, Dict]:
+        '''
+        `info` of users by username, with one query
+        '''
+        usernames = [*usernames]
+        if not usernames:
+            return {}
+        return {
+            user.username: user.info
+            for user in engine.User.objects(username__in=usernames).only(
+                *cls.USER_INFO_FIELDS)
+        }
+
+    @classmethod
+    def to_dicts(
+        cls,
+        submissions: Iterable['Submission'],
+    ) -> List[Dict[str, Any]]:
+        '''
+        `to_dict` of many submissions, their users are loaded with one query
+        instead of dereferencing each one
+        '''
+        submissions = [*submissions]
+        users = cls._user_infos({cls._username(s) for s in submissions})
+        return [s.to_dict(users=users) for s in submissions]
+
+    def to_dict(
+        self,
+        users: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        '''
+        Args:
+            users: `info` of users by username, loaded by the caller
+        '''
+        ret = self._to_dict(users)
         # Convert Bson object to python dictionary
         ret = ret.to_dict()
         return ret
 
-    def _to_dict(self) -> SON:
-        ret = self.to_mongo()
+    def _to_dict(
+        self,
+        users: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> SON:
+        ret = self.to_mongo(fields=self.SUMMARY_FIELDS)
+        if users is None:
+            user = self.user.info
+        else:
+            user = users.get(ret['user'])
         _ret = {
             'problemId': ret['problem'],
-            'user': self.user.info,
+            'user': user,
             'submissionId': str(self.id),
             'timestamp': self.timestamp.timestamp(),
             'lastSend': self.last_send.timestamp(),
@@ -768,14 +1521,11 @@ class Submission(MongoBase, engine=engine.Submission):
         old = [
             '_id',
             'problem',
-            'code',
-            'comment',
-            'tasks',
             'ip_addr',
         ]
         # delete old keys
         for o in old:
-            del ret[o]
+            ret.pop(o, None)
         # insert new keys
         ret.update(**_ret)
         return ret
@@ -788,21 +1538,108 @@ class Submission(MongoBase, engine=engine.Submission):
         for task in tasks:
             for case in task['cases']:
                 del case['output']
+                for k in self.OUTPUT_PREVIEW_KEYS:
+                    case.pop(k, None)
         return [task.to_dict() for task in tasks]
 
-    def get_detailed_result(self) -> List[Dict[str, Any]]:
+    def get_detailed_result(
+        self,
+        preview_size: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
         '''
-        Get all results (including stdout/stderr) of this submission
+        Get all results of this submission, with the first `preview_size`
+        bytes of stdout/stderr and their full sizes. The whole output of a
+        case is read by `get_single_output`.
+
+        Previews stored on the cases are used as is, only results judged
+        before they were stored are read from the outputs.
         '''
+        if preview_size is None:
+            preview_size = self.OUTPUT_PREVIEW_SIZE
         tasks = [task.to_mongo() for task in self.tasks]
+        missing = [(i, j, case) for i, task in enumerate(self.tasks)
+                   for j, case in enumerate(task.cases)
+                   if case.stdout_size is None]
+        outputs = self._preview_outputs(
+            [case for *_, case in missing],
+            preview_size,
+        )
+        previews = {
+            (i, j): output
+            for (i, j, _), output in zip(missing, outputs)
+        }
         for i, task in enumerate(tasks):
-            for j, case in enumerate(task.cases):
-                output = self.get_single_output(i, j)
-                case['stdout'] = output['stdout']
-                case['stderr'] = output['stderr']
-                del case['output']  # non-serializable field
+            for j, case in enumerate(task['cases']):
+                case.pop('output', None)  # non-serializable field
+                if (i, j) in previews:
+                    case.update(previews[i, j])
+                    continue
+                for k in ('stdout', 'stderr'):
+                    preview = case.pop(f'{k}Preview').encode('utf-8')
+                    case[k] = _utf8_head(preview[:preview_size])
         return [task.to_dict() for task in tasks]
 
+    def _preview_outputs(
+        self,
+        cases: List[engine.CaseResult],
+        size: int,
+    ) -> List[Dict[str, Any]]:
+        '''
+        `_preview_output` of cases, read concurrently. only the byte ranges
+        zipfile asks for are fetched, that is the central directory and the
+        head of each member, not the whole output.
+        '''
+        if not cases:
+            return []
+        minio_client = MinioClient()
+
+        def preview(case: engine.CaseResult) -> Dict[str, Any]:
+            if case.output_minio_path is None:
+                # fallback to gridfs, None if the output has been dropped
+                has_output = case.output is not None and case.output.grid_id
+                return self._preview_output(
+                    case.output if has_output else None,
+                    size,
+                )
+            raw = MinioObjectFile(
+                minio_client,
+                case.output_minio_path,
+                offset=case.output_offset or 0,
+                size=case.output_size,
+            )
+            # a local header and the head of its member, as zipfile reads
+            # them, are fetched in one ranged GET
+            return self._preview_output(
+                io.BufferedReader(raw, size + 8 * 1024),
+                size,
+            )
+
+        workers = min(self.OUTPUT_FETCH_WORKERS, len(cases))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [*executor.map(preview, cases)]
+
+    @staticmethod
+    def _preview_output(blob, size: int) -> Dict[str, Any]:
+        '''
+        decompress only the first `size` bytes of stdout/stderr in a zipped
+        output
+        '''
+        ret = {}
+        if blob is None:
+            # dropped by the retention policy
+            return {
+                'stdout': '',
+                'stderr': '',
+                'stdoutSize': None,
+                'stderrSize': None,
+            }
+        with ZipFile(blob) as zf:
+            for k in ('stdout', 'stderr'):
+                with zf.open(k) as f:
+                    ret[k] = _utf8_head(f.read(size))
+                ret[f'{k}Size'] = zf.getinfo(k).file_size
+        return ret
+
     def _get_code_raw(self):
         if self.code.grid_id is None and self.code_minio_path is None:
             return None
@@ -854,7 +1691,10 @@ class Submission(MongoBase, engine=engine.Submission):
         return self.get_code(f'main{ext}')
 
     def has_code(self) -> bool:
-        return self._get_code_zip() is not None
+        # decided by the metadata, without downloading the code
+        if self.code_minio_path is not None:
+            return True
+        return self.code is not None and self.code.grid_id is not None
 
     def own_permission(self, user) -> Permission:
         key = f'SUBMISSION_PERMISSION_{self.id}_{user.id}_{self.problem.id}'
@@ -905,7 +1745,11 @@ class Submission(MongoBase, engine=engine.Submission):
         # upload code to minio
         if self.code_minio_path is None:
             self.logger.info(f"uploading code to minio. submission={self.id}")
-            self.update(code_minio_path=self._put_code(self.code), )
+            code_minio_path, code_checksum = self._put_code(self.code)
+            self.update(
+                code_minio_path=code_minio_path,
+                code_checksum=code_checksum,
+            )
             self.reload()
             self.logger.info(
                 f"code uploaded to minio. submission={self.id} path={self.code_minio_path}"
@@ -937,24 +1781,15 @@ class Submission(MongoBase, engine=engine.Submission):
         if gridfs_code is None:
             # if file is deleted but GridFS proxy is not updated
             return False
-        gridfs_checksum = md5(gridfs_code).hexdigest()
+        gridfs_checksum = sha256(gridfs_code).hexdigest()
         self.logger.info(
             f"calculated grid checksum. submission={self.id} checksum={gridfs_checksum}"
         )
-
-        minio_client = MinioClient()
-        try:
-            resp = minio_client.client.get_object(
-                minio_client.bucket,
-                self.code_minio_path,
-            )
-            minio_code = resp.read()
-        finally:
-            if 'resp' in locals():
-                resp.close()
-                resp.release_conn()
-
-        minio_checksum = md5(minio_code).hexdigest()
+        # the checksum is recorded when the code is put to minio, only
+        # code uploaded before that has to be downloaded
+        minio_checksum = self.code_checksum
+        if minio_checksum is None:
+            minio_checksum = sha256(b''.join(self._get_code_raw())).hexdigest()
         self.logger.info(
             f"calculated minio checksum. submission={self.id} checksum={minio_checksum}"
         )
@@ -1036,18 +1871,7 @@ class Submission(MongoBase, engine=engine.Submission):
             f"calculated grid checksum. submission={self.id} task={i} case={j} checksum={gridfs_checksum}"
         )
 
-        minio_client = MinioClient()
-        try:
-            resp = minio_client.client.get_object(
-                minio_client.bucket,
-                case.output_minio_path,
-            )
-            minio_output = resp.read()
-        finally:
-            if 'resp' in locals():
-                resp.close()
-                resp.release_conn()
-
+        minio_output = self._get_minio_output(case)
         minio_checksum = md5(minio_output).hexdigest()
         self.logger.info(
             f"calculated minio checksum. submission={self.id} task={i} case={j} checksum={minio_checksum}"
@@ -253,9 +253,10 @@ class User(MongoBase, engine=engine.User):
             self.update(
                 add_to_set__AC_problem_ids=submission.problem_id,
                 inc__AC_submission=1,
+                inc__submission=1,
             )
-        self.submission += 1
-        self.save()
+        else:
+            self.update(inc__submission=1)
 
 
 def jwt_decode(token):
@@ -1,8 +1,10 @@
 import abc
+import io
 import hashlib
 import logging
+import threading
 from functools import wraps
-from typing import Dict, Optional, Any, TYPE_CHECKING
+from typing import Dict, Iterator, Optional, Any, TYPE_CHECKING
 from minio import Minio
 import redis
 from config import settings
@@ -19,6 +21,7 @@ __all__ = (
     'RedisCache',
     'doc_required',
     'drop_none',
+    'PeriodicWorker',
 )
 
 
@@ -75,6 +78,9 @@ class Cache(abc.ABC):
 
 class RedisCache(Cache):
     POOL = None
+    # fakeredis keeps a dataset per client, so the fake one is shared like
+    # the pool to let every instance see the same keys
+    FAKE_CLIENT = None
 
     def __new__(cls) -> Any:
         if cls.POOL is None:
@@ -95,8 +101,10 @@ class RedisCache(Cache):
     def client(self):
         if self._client is None:
             if self.PORT is None:
-                import fakeredis
-                self._client = fakeredis.FakeStrictRedis()
+                if RedisCache.FAKE_CLIENT is None:
+                    import fakeredis
+                    RedisCache.FAKE_CLIENT = fakeredis.FakeStrictRedis()
+                self._client = RedisCache.FAKE_CLIENT
             else:
                 self._client = redis.Redis(connection_pool=self.POOL)
         return self._client
@@ -114,6 +122,45 @@ class RedisCache(Cache):
         return self.client.set(key, value, ex=ex)
 
 
+class PeriodicWorker(threading.Thread):
+    '''
+    Background thread calling `run_once` every `interval` seconds until it
+    is stopped. One is started per web worker, those doing a job only one
+    of them should do take a gate first with `take_gate`.
+    '''
+
+    def __init__(self, name: str, interval: float):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logging.getLogger(
+                    type(self).__module__).exception(f'{self.name} failed')
+            self._stop_event.wait(self.interval)
+
+    def run_once(self):
+        raise NotImplementedError  # pragma: no cover
+
+    def take_gate(self, key: str) -> bool:
+        '''
+        SET NX `key` for one interval, False if another worker has taken it
+        '''
+        return bool(RedisCache().client.set(
+            key,
+            1,
+            nx=True,
+            ex=max(int(self.interval), 1),
+        ))
+
+    def stop(self):
+        self._stop_event.set()
+
+
 def doc_required(
     src,
     des,
@@ -188,3 +235,86 @@ class MinioClient:
             region=settings.MINIO_REGION,
         )
         self.bucket = settings.MINIO_BUCKET
+
+
+class MinioObjectFile(io.RawIOBase):
+    '''
+    A read-only file over `size` bytes of a minio object starting at
+    `offset`. Nothing is downloaded up front, every read is a ranged GET.
+    '''
+
+    def __init__(
+        self,
+        minio_client: MinioClient,
+        path: str,
+        offset: int = 0,
+        size: Optional[int] = None,
+    ):
+        super().__init__()
+        self.minio_client = minio_client
+        self.path = path
+        self.offset = offset
+        if size is None:
+            size = minio_client.client.stat_object(
+                minio_client.bucket,
+                path,
+            ).size - offset
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += self.size
+        if pos < 0:
+            raise ValueError('negative seek position')
+        self.pos = pos
+        return self.pos
+
+    def readinto(self, b) -> int:
+        data = self.read_at(self.pos, len(b))
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def read_at(self, pos: int, n: int) -> bytes:
+        '''
+        read `n` bytes at `pos` without moving the file position
+        '''
+        n = min(n, self.size - pos)
+        if n <= 0:
+            return b''
+        return b''.join(self.iter_range(pos, pos + n))
+
+    def iter_range(
+        self,
+        start: int,
+        end: int,
+        chunk_size: int = 64 * 1024,
+    ) -> Iterator[bytes]:
+        '''
+        stream bytes in [start, end) with a single GET
+        '''
+        if start >= end:
+            return
+        resp = self.minio_client.client.get_object(
+            self.minio_client.bucket,
+            self.path,
+            offset=self.offset + start,
+            length=end - start,
+        )
+        try:
+            yield from resp.stream(chunk_size)
+        finally:
+            resp.close()
+            resp.release_conn()
@@ -4,6 +4,7 @@ import httpx
 
 from mongo import *
 from mongo import engine
+from mongo.utils import RedisCache
 import mongomock.gridfs
 
 import pytest
@@ -18,6 +19,26 @@ from testcontainers.minio import MinioContainer
 from config import settings
 
 
+@pytest.fixture(autouse=True)
+def fresh_redis():
+    # every RedisCache shares one fake client, start each test with an empty
+    # one so keys do not leak between tests
+    RedisCache.FAKE_CLIENT = None
+    yield
+    RedisCache.FAKE_CLIENT = None
+
+
+@pytest.fixture
+def fresh_db(app):
+    '''
+    an empty database, dropped again after the test. the seeded admin is
+    dropped as well.
+    '''
+    utils.drop_db()
+    yield
+    utils.drop_db()
+
+
 # use a tmp minio for entire test session
 @pytest.fixture(autouse=True, scope='session')
 def setup_minio():
@@ -0,0 +1,285 @@
+import mongomock.collection
+import pytest
+
+from mongo import Course, Submission, User, engine
+from mongo import counter
+from tests import utils
+
+pytestmark = pytest.mark.usefixtures('fresh_db')
+
+
+def _scanned(problem):
+    '''
+    the counters as recounted from the submissions
+    '''
+    submissions = engine.Submission.objects(problem=problem.id)
+    statuses = {}
+    for status in submissions.scalar('status'):
+        statuses[status] = statuses.get(status, 0) + 1
+    return (
+        statuses,
+        len(submissions.distinct('user')),
+        len(submissions.filter(status=0).distinct('user')),
+    )
+
+
+def _counted(problem):
+    return (
+        problem.get_submission_status(),
+        problem.get_tried_user_count(),
+        problem.get_ac_user_count(),
+    )
+
+
+def test_follow_submission_lifecycle():
+    _, (alice, bob), _, problem, _ = \
+        utils.homework.create_course_problem(student_count=2)
+    # created without code yet
+    Submission.add(problem.id, alice.username, 0)
+    assert _counted(problem) == ({-2: 1}, 1, 0)
+    judged = utils.submission.create_judged_submission(
+        user=alice,
+        problem=problem,
+    )
+    other = utils.submission.create_submission(
+        user=bob,
+        problem=problem,
+        status=1,
+    )
+    assert _counted(problem) == _scanned(problem) == ({
+        -2: 1,
+        0: 1,
+        1: 1
+    }, 2, 1)
+    judged.rejudge()
+    assert _counted(problem) == _scanned(problem)
+    assert problem.get_ac_user_count() == 0
+    other.delete()
+    assert _counted(problem) == _scanned(problem) == ({-2: 1, -1: 1}, 1, 0)
+
+
+def test_rejudge_many():
+    _, students, _, problem, _ = \
+        utils.homework.create_course_problem(student_count=2)
+    submissions = [
+        utils.submission.create_submission(
+            user=user,
+            problem=problem,
+            status=status,
+        ) for user in students for status in (0, 1)
+    ]
+    Submission.rejudge_many([s.id for s in submissions])
+    assert _counted(problem) == _scanned(problem) == ({-1: 4}, 2, 0)
+
+
+def test_grade():
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    submission = utils.submission.create_submission(
+        user=student,
+        problem=problem,
+        status=-1,
+    )
+    submission.grade(100)
+    assert submission.status == 0
+    assert _counted(problem) == _scanned(problem) == ({0: 1}, 1, 1)
+
+
+def test_reconcile():
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    for status in (0, 1, 1):
+        utils.submission.create_submission(
+            user=student,
+            problem=problem,
+            status=status,
+        )
+    # drift left by writes outside of `Submission`
+    engine.Submission.objects(problem=problem.id).update(status=2)
+    engine.SubmissionCount.objects(
+        problem_id=problem.id,
+        status=0,
+    ).update(inc__count=5)
+    assert _counted(problem) != _scanned(problem)
+    assert counter.reconcile() == 1
+    assert _counted(problem) == _scanned(problem) == ({2: 3}, 1, 0)
+
+
+def test_reconcile_groups_once(monkeypatch):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    other = utils.problem.create_problem(owner=utils.user.create_user(role=0))
+    for p in (problem, other):
+        utils.submission.create_submission(user=student, problem=p)
+    engine.SubmissionCount.objects.update(inc__count=1)
+    aggregates = []
+    orig = mongomock.collection.Collection.aggregate
+
+    def aggregate(self, *args, **kwargs):
+        aggregates.append(self.name)
+        return orig(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'aggregate',
+                        aggregate)
+    assert counter.reconcile() == 2
+    assert aggregates == ['submission']
+    monkeypatch.setattr(mongomock.collection.Collection, 'aggregate', orig)
+    for p in (problem, other):
+        assert _counted(p) == _scanned(p)
+
+
+def _drift(problem, student):
+    for status in (0, 1):
+        utils.submission.create_submission(
+            user=student,
+            problem=problem,
+            status=status,
+        )
+    engine.SubmissionCount.objects(problem_id=problem.id).update(inc__count=2)
+    engine.UserSubmissionCount.objects(problem_id=problem.id).update(
+        inc__ac_count=1)
+
+
+def test_reconcile_keeps_updates_after_pass(monkeypatch):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    _drift(problem, student)
+    orig = counter._stored
+    calls = []
+
+    def _stored(*args):
+        ret = orig(*args)
+        calls.append(ret)
+        if len(calls) == 2:
+            # counted after the counters were read
+            utils.submission.create_submission(
+                user=student,
+                problem=problem,
+                status=1,
+            )
+        return ret
+
+    monkeypatch.setattr(counter, '_stored', _stored)
+    assert counter.reconcile() == 1
+    assert _counted(problem) == _scanned(problem) == ({0: 1, 1: 2}, 1, 1)
+
+
+def test_reconcile_skips_busy_problem(monkeypatch):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    _drift(problem, student)
+    drifted = _counted(problem)
+    orig = mongomock.collection.Collection.aggregate
+
+    def aggregate(self, *args, **kwargs):
+        # submitted while the submissions are grouped
+        utils.submission.create_submission(
+            user=student,
+            problem=problem,
+            status=1,
+        )
+        return orig(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'aggregate',
+                        aggregate)
+    assert counter.reconcile() == 0
+    monkeypatch.setattr(mongomock.collection.Collection, 'aggregate', orig)
+    assert _counted(problem) != _scanned(problem)
+    assert _counted(problem)[0][1] == drifted[0][1] + 1
+    assert counter.reconcile() == 1
+    assert _counted(problem) == _scanned(problem)
+
+
+@pytest.mark.parametrize('count_mode', ['counter', 'estimate'])
+def test_filter_count(count_mode):
+    _, (alice, bob), course, problem, _ = \
+        utils.homework.create_course_problem(student_count=2)
+    for user, status in ((alice, 0), (alice, 1), (bob, 0), (bob, 4)):
+        utils.submission.create_submission(
+            user=user,
+            problem=problem,
+            status=status,
+        )
+    admin = utils.user.create_user(role=0)
+    for ks in (
+        {},
+        {
+            'problem': problem.id
+        },
+        {
+            'problem': problem.id,
+            'status': 0
+        },
+        {
+            'q_user': alice.username
+        },
+        {
+            'q_user': alice.username,
+            'status': 0
+        },
+        {
+            'course': course.course_name
+        },
+            # not covered by the counters
+        {
+            'q_user': alice.username,
+            'status': 1
+        },
+        {
+            'language_type': [0]
+        },
+    ):
+        _, scanned = Submission.filter(user=admin, with_count=True, **ks)
+        _, counted = Submission.filter(
+            user=admin,
+            with_count=True,
+            count_mode=count_mode,
+            **ks,
+        )
+        assert counted == scanned, ks
+
+
+def test_estimate_stops_at_limit(monkeypatch):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    for _ in range(3):
+        utils.submission.create_submission(user=student, problem=problem)
+    monkeypatch.setattr(Submission, 'ESTIMATE_LIMIT', 2)
+    _, cnt = Submission.filter(
+        user=User('first_admin'),
+        language_type=[0],
+        with_count=True,
+        count_mode='estimate',
+    )
+    assert cnt == 2
+
+
+def test_filter_invalid_count_mode():
+    with pytest.raises(ValueError):
+        Submission.filter(user=User('first_admin'), count_mode='guess')
+
+
+def test_course_summary():
+    _, (student, ), course, problem, _ = \
+        utils.homework.create_course_problem()
+    for _ in range(3):
+        utils.submission.create_submission(user=student, problem=problem)
+    summary = Course(course.course_name).get_course_summary([problem.obj])
+    assert summary['submissionCount'] == 3
+
+
+def test_list_api_count_mode(forge_client):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem()
+    for status in (0, 1):
+        utils.submission.create_submission(
+            user=student,
+            problem=problem,
+            status=status,
+        )
+    client = forge_client(utils.user.create_user(role=0).username)
+    rv = client.get(f'/submission?problemId={problem.id}&countMode=counter')
+    assert rv.status_code == 200, rv.json()
+    assert rv.json()['data']['submissionCount'] == 2
+    rv = client.get('/submission?countMode=guess')
+    assert rv.status_code == 400
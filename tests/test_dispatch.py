@@ -0,0 +1,254 @@
+import io
+import time
+from zipfile import ZipFile
+
+import pytest
+
+from config import settings
+from mongo import Submission, Homework, User
+from dispatch import job, params, redis_keys, runner
+from tests import utils
+
+
+@pytest.fixture(autouse=True)
+def fresh_dispatch():
+    utils.drop_db()
+    yield
+    utils.drop_db()
+
+
+@pytest.fixture
+def runner_headers(client, monkeypatch):
+    monkeypatch.setattr(settings, 'RUNNER_REGISTRATION_TOKEN', 'secret')
+    rv = client.post(
+        '/dispatch/runners',
+        json={
+            'name': 'runner-1',
+            'registrationToken': 'secret'
+        },
+    )
+    assert rv.status_code == 201, rv.json()
+    data = rv.json()['data']
+    assert data['maxConcurrentJobs'] == params.MAX_CONCURRENT_JOBS
+    return {
+        'X-Runner-Id': data['runnerId'],
+        'Authorization': f'Bearer {data["token"]}',
+    }
+
+
+def _upload(user, problem) -> Submission:
+    submission = Submission.add(
+        problem_id=problem.problem_id,
+        username=user.username,
+        lang=0,
+    )
+    code = io.BytesIO()
+    with ZipFile(code, 'w') as zf:
+        zf.writestr('main.c', 'int main() {}\n')
+    code.seek(0)
+    assert submission.submit(code) is True
+    return submission.reload()
+
+
+def test_register_with_wrong_token(client, monkeypatch):
+    monkeypatch.setattr(settings, 'RUNNER_REGISTRATION_TOKEN', 'secret')
+    rv = client.post(
+        '/dispatch/runners',
+        json={
+            'name': 'runner-1',
+            'registrationToken': 'wrong'
+        },
+    )
+    assert rv.status_code == 401, rv.json()
+
+
+def test_lease_requires_runner_credential(client):
+    rv = client.post('/dispatch/jobs/lease')
+    assert rv.status_code == 401, rv.json()
+    rv = client.post(
+        '/dispatch/jobs/lease',
+        headers={
+            'X-Runner-Id': 'rn_x',
+            'Authorization': 'Bearer rk_x'
+        },
+    )
+    assert rv.status_code == 401, rv.json()
+
+
+def test_submit_only_enqueues(app):
+    user = utils.user.create_user()
+    problem = utils.problem.create_problem()
+    submission = _upload(user, problem)
+    assert submission.status == -1
+    assert job.current_job(submission.id) is not None
+    assert job.queue_length() == 1
+
+
+def test_job_lifecycle(client, runner_headers):
+    user = utils.user.create_user()
+    problem = utils.problem.create_problem(
+        test_case_info=utils.problem.create_test_case_info(
+            language=0,
+            task_len=1,
+        ))
+    submission = _upload(user, problem)
+
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    assert rv.status_code == 200, rv.json()
+    payload = rv.json()['data']
+    assert payload['submissionId'] == submission.id
+    assert payload['problemId'] == problem.problem_id
+    assert payload['attempt'] == 1
+    assert payload['codeUrl'] is not None
+    assert len(payload['tasks']) == 1
+    # queue is empty now
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    assert rv.json()['data'] is None
+
+    rv = client.post(
+        '/dispatch/runners/heartbeat',
+        headers=runner_headers,
+        json={'jobIds': [payload['jobId'], 'jb_unknown']},
+    )
+    assert rv.status_code == 200, rv.json()
+    assert rv.json()['data']['lostJobIds'] == ['jb_unknown']
+
+    case = {
+        'exitCode': 0,
+        'status': 'AC',
+        'stdout': 'out',
+        'stderr': '',
+        'execTime': 10,
+        'memoryUsage': 100,
+    }
+    tasks = [[dict(case) for _ in range(t.case_count)]
+             for t in problem.test_case.tasks]
+    rv = client.put(
+        f'/dispatch/jobs/{payload["jobId"]}/complete',
+        headers=runner_headers,
+        json={'tasks': tasks},
+    )
+    assert rv.status_code == 200, rv.json()
+    assert submission.reload().status == 0
+    # the same result can not be accepted twice
+    rv = client.put(
+        f'/dispatch/jobs/{payload["jobId"]}/complete',
+        headers=runner_headers,
+        json={'tasks': tasks},
+    )
+    assert rv.status_code == 409, rv.json()
+
+
+def test_failed_result_is_judged_again(client, runner_headers, monkeypatch):
+    user = utils.user.create_user()
+    problem = utils.problem.create_problem(
+        test_case_info=utils.problem.create_test_case_info(
+            language=0,
+            task_len=1,
+        ))
+    submission = _upload(user, problem)
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    job_id = rv.json()['data']['jobId']
+
+    def process_result(self, tasks):
+        raise KeyError('status')
+
+    monkeypatch.setattr(Submission, 'process_result', process_result)
+    rv = client.put(
+        f'/dispatch/jobs/{job_id}/complete',
+        headers=runner_headers,
+        json={'tasks': []},
+    )
+    assert rv.status_code == 400, rv.json()
+    assert submission.reload().status == -1
+    # the job is back in the queue instead of being lost
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    assert rv.json()['data']['jobId'] == job_id
+    assert rv.json()['data']['attempt'] == 2
+
+
+def test_rejudge_supersedes_leased_job(client, runner_headers):
+    user = utils.user.create_user()
+    problem = utils.problem.create_problem()
+    submission = _upload(user, problem)
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    old_job_id = rv.json()['data']['jobId']
+
+    submission.rejudge()
+    rv = client.put(
+        f'/dispatch/jobs/{old_job_id}/complete',
+        headers=runner_headers,
+        json={'tasks': []},
+    )
+    assert rv.status_code == 409, rv.json()
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    assert rv.json()['data']['submissionId'] == submission.id
+    assert rv.json()['data']['jobId'] != old_job_id
+
+
+def test_exhausted_job_becomes_judge_error(client, runner_headers,
+                                           monkeypatch):
+    user = utils.user.create_user()
+    problem = utils.problem.create_problem()
+    submission = _upload(user, problem)
+    now = [job._now()]
+    monkeypatch.setattr(job, '_now', lambda: now[0])
+    for attempt in range(1, params.MAX_ATTEMPTS + 1):
+        assert job.lease('rn_dead').attempt == attempt
+        now[0] += params.LEASE_TTL_SEC + 1
+        if attempt < params.MAX_ATTEMPTS:
+            job.recover(force=True)
+    # let the lease poll run the last recovery itself
+    runner._redis().delete(redis_keys.DISPATCH_LAST_RECOVERY)
+    rv = client.post('/dispatch/jobs/lease', headers=runner_headers)
+    assert rv.status_code == 200, rv.json()
+    assert rv.json()['data'] is None
+    assert submission.reload().status == submission.status2code['JE']
+
+
+def _homework(problem, ip_filters=()):
+    now = time.time()
+    homework = Homework.add(
+        user=User('first_admin'),
+        course_name=problem.courses[0].course_name,
+        hw_name='hw',
+        markdown='',
+        start=now - 60,
+        end=now + 60,
+        penalty=None,
+        problem_ids=[problem.problem_id],
+        scoreboard_status=0,
+    )
+    homework.update(ip_filters=[*ip_filters])
+    return homework
+
+
+@pytest.mark.parametrize('course, ip_filters, lane', [
+    ('Public', None, job.BACKGROUND),
+    ('Public', (), job.NORMAL),
+    ('Public', ('127.0.0.1', ), job.EXAM),
+    (None, None, job.NORMAL),
+])
+def test_judge_lane(app, course, ip_filters, lane):
+    problem = utils.problem.create_problem(course=course)
+    if ip_filters is not None:
+        _homework(problem, ip_filters)
+    submission = _upload(utils.user.create_user(), problem)
+    assert submission.judge_lane() == lane
+    assert job.queue_lengths()[lane] == 1
+
+
+def test_queue_status(forge_client):
+    job.enqueue('sub-1', job.EXAM)
+    job.enqueue('sub-2', job.BACKGROUND)
+    job.lease('rn_a')
+    admin = utils.user.create_user(role=0)
+    rv = forge_client(admin.username).get('/dispatch/queue')
+    assert rv.status_code == 200, rv.json()
+    data = rv.json()['data']
+    assert sum(data['pending'].values()) == 1
+    assert data['leased'] == 1
+    assert data['weights'] == params.LANE_WEIGHTS
+    student = utils.user.create_user(role=2)
+    rv = forge_client(student.username).get('/dispatch/queue')
+    assert rv.status_code == 403, rv.json()
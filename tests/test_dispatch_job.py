@@ -0,0 +1,336 @@
+import pytest
+
+from config import settings
+from mongo.utils import RedisCache
+from dispatch import job, params, redis_keys, runner
+
+
+@pytest.fixture(autouse=True, scope='session')
+def setup_minio():
+    # Shadow conftest's Docker/MinIO session fixture: the job lifecycle only
+    # touches fakeredis.
+    yield
+
+
+@pytest.fixture(autouse=True)
+def fresh_fakeredis(monkeypatch):
+    monkeypatch.setattr(settings, 'REDIS_HOST', None)
+    monkeypatch.setattr(settings, 'REDIS_PORT', None)
+    RedisCache.POOL = None
+    RedisCache.FAKE_CLIENT = None
+    yield
+    RedisCache.POOL = None
+    RedisCache.FAKE_CLIENT = None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(job, '_now', lambda: now[0])
+    return now
+
+
+# --- enqueue ------------------------------------------------------------
+
+
+def test_enqueue_creates_pending_job():
+    job_id = job.enqueue('sub-1')
+
+    client = runner._redis()
+    assert job_id.startswith('jb_')
+    assert job.current_job('sub-1') == job_id
+    assert client.lrange(redis_keys.JOBS_PENDING, 0, -1) == [job_id.encode()]
+    state = client.hgetall(redis_keys.job(job_id))
+    assert state[b'submission_id'] == b'sub-1'
+    assert state[b'state'] == b'pending'
+    assert state[b'attempts'] == b'0'
+    # lock released
+    assert client.exists(redis_keys.submission_job_lock('sub-1')) == 0
+
+
+def test_enqueue_supersedes_previous_job():
+    old = job.enqueue('sub-1')
+    new = job.enqueue('sub-1')
+
+    assert job.current_job('sub-1') == new
+    assert runner._redis().exists(redis_keys.job(old)) == 0
+    # the stale queue entry is skipped on lease
+    lease = job.lease('rn_a')
+    assert lease.job_id == new
+    assert job.lease('rn_b') is None
+    assert job.queue_length() == 0
+
+
+def test_enqueue_waits_for_busy_lock(monkeypatch):
+    monkeypatch.setattr(params, 'JOB_LOCK_WAIT_SEC', 0)
+    runner._redis().set(redis_keys.submission_job_lock('sub-1'), 'other')
+    with pytest.raises(job.JobLockTimeout):
+        job.enqueue('sub-1')
+
+
+# --- lease --------------------------------------------------------------
+
+
+def test_lease_is_fifo():
+    first = job.enqueue('sub-1')
+    second = job.enqueue('sub-2')
+
+    assert job.lease('rn_a').job_id == first
+    assert job.lease('rn_a').job_id == second
+    assert job.lease('rn_a') is None
+
+
+def test_lease_marks_job_leased(clock):
+    job_id = job.enqueue('sub-1')
+    lease = job.lease('rn_a')
+
+    assert lease == job.Lease(
+        job_id=job_id,
+        submission_id='sub-1',
+        attempt=1,
+        expires_at=clock[0] + params.LEASE_TTL_SEC,
+    )
+    client = runner._redis()
+    assert client.sismember(redis_keys.JOBS_LEASED, job_id)
+    state = client.hgetall(redis_keys.job(job_id))
+    assert state[b'state'] == b'leased'
+    assert state[b'runner_id'] == b'rn_a'
+
+
+def test_lease_skips_cancelled_job():
+    job.enqueue('sub-1')
+    assert job.cancel('sub-1') is not None
+    assert job.lease('rn_a') is None
+    assert job.current_job('sub-1') is None
+
+
+# --- renew --------------------------------------------------------------
+
+
+def test_renew_extends_held_lease(clock):
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    clock[0] += 20
+    assert job.renew('rn_a', [job_id]) == []
+    expires_at = runner._redis().hget(redis_keys.job(job_id),
+                                      'lease_expires_at')
+    assert float(expires_at) == clock[0] + params.LEASE_TTL_SEC
+
+
+def test_renew_reports_lost_jobs():
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    # another runner, an unknown job, and a superseded job are all lost
+    assert job.renew('rn_b', [job_id]) == [job_id]
+    assert job.renew('rn_a', ['jb_unknown']) == ['jb_unknown']
+    job.enqueue('sub-1')
+    assert job.renew('rn_a', [job_id]) == [job_id]
+
+
+def test_renew_does_not_outlive_completion(monkeypatch):
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    orig = job._decode
+    raced = []
+
+    def _decode(value):
+        # the job is completed between the lease check and the write
+        if not raced:
+            raced.append(True)
+            assert job.complete('rn_a', job_id) == 'sub-1'
+        return orig(value)
+
+    monkeypatch.setattr(job, '_decode', _decode)
+    assert job.renew('rn_a', [job_id]) == [job_id]
+    assert runner._redis().exists(redis_keys.job(job_id)) == 0
+
+
+# --- complete -----------------------------------------------------------
+
+
+def test_held_keeps_job():
+    job_id = job.enqueue('sub-1')
+    assert job.held('rn_a', job_id) is None
+    job.lease('rn_a')
+    assert job.held('rn_b', job_id) is None
+    assert job.held('rn_a', job_id) == 'sub-1'
+    assert job.held('rn_a', job_id) == 'sub-1'
+    assert job.complete('rn_a', job_id) == 'sub-1'
+    assert job.held('rn_a', job_id) is None
+
+
+def test_release_requeues_job():
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    assert job.release('rn_b', job_id).requeued == []
+    assert job.release('rn_a', job_id).requeued == [job_id]
+    assert job.held('rn_a', job_id) is None
+    lease = job.lease('rn_b')
+    assert (lease.job_id, lease.attempt) == (job_id, 2)
+
+
+def test_release_drops_exhausted_job():
+    job_id = job.enqueue('sub-1')
+    for _ in range(params.MAX_ATTEMPTS - 1):
+        job.lease('rn_a')
+        job.release('rn_a', job_id)
+    job.lease('rn_a')
+    assert job.release('rn_a', job_id).exhausted == ['sub-1']
+    assert job.current_job('sub-1') is None
+    assert job.lease('rn_a') is None
+
+
+def test_complete_retires_job():
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+
+    assert job.complete('rn_a', job_id) == 'sub-1'
+    client = runner._redis()
+    assert client.exists(redis_keys.job(job_id)) == 0
+    assert not client.sismember(redis_keys.JOBS_LEASED, job_id)
+    assert job.current_job('sub-1') is None
+    # a second completion is rejected
+    assert job.complete('rn_a', job_id) is None
+
+
+def test_complete_rejects_other_runner():
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    assert job.complete('rn_b', job_id) is None
+    assert job.complete('rn_a', job_id) == 'sub-1'
+
+
+def test_complete_rejects_superseded_job():
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    job.enqueue('sub-1')
+    assert job.complete('rn_a', job_id) is None
+
+
+def test_complete_rejects_pending_job():
+    job_id = job.enqueue('sub-1')
+    assert job.complete('rn_a', job_id) is None
+
+
+# --- recover ------------------------------------------------------------
+
+
+def test_recover_requeues_expired_lease(clock):
+    job_id = job.enqueue('sub-1')
+    job.enqueue('sub-2')
+    job.lease('rn_a')
+
+    clock[0] += params.LEASE_TTL_SEC + 1
+    result = job.recover()
+    assert result.requeued == [job_id]
+    assert result.exhausted == []
+    # the dead runner can no longer complete it
+    assert job.complete('rn_a', job_id) is None
+    # retried ahead of the jobs that never ran
+    lease = job.lease('rn_b')
+    assert lease.job_id == job_id
+    assert lease.attempt == 2
+
+
+def test_recover_spares_live_lease(clock):
+    job_id = job.enqueue('sub-1')
+    job.lease('rn_a')
+    clock[0] += params.LEASE_TTL_SEC - 1
+    assert job.recover().requeued == []
+    assert job.complete('rn_a', job_id) == 'sub-1'
+
+
+def test_recover_is_time_gated(clock):
+    job.enqueue('sub-1')
+    job.lease('rn_a')
+    assert job.recover().requeued == []
+    clock[0] += params.LEASE_TTL_SEC + 1
+    # the gate set by the first scan is still alive
+    assert job.recover().requeued == []
+    assert len(job.recover(force=True).requeued) == 1
+
+
+def test_recover_drops_exhausted_job(clock):
+    job_id = job.enqueue('sub-1')
+    for attempt in range(params.MAX_ATTEMPTS):
+        lease = job.lease(f'rn_{attempt}')
+        assert lease.attempt == attempt + 1
+        clock[0] += params.LEASE_TTL_SEC + 1
+        result = job.recover(force=True)
+    assert result.exhausted == ['sub-1']
+    assert result.requeued == []
+    assert job.current_job('sub-1') is None
+    assert runner._redis().exists(redis_keys.job(job_id)) == 0
+    assert job.lease('rn_a') is None
+
+
+# --- lanes --------------------------------------------------------------
+
+
+def test_schedule_is_smooth():
+    assert job._schedule({'a': 2, 'b': 1}) == ['a', 'b', 'a']
+    schedule = job._schedule(params.LANE_WEIGHTS)
+    assert len(schedule) == sum(params.LANE_WEIGHTS.values())
+    for lane, weight in params.LANE_WEIGHTS.items():
+        assert schedule.count(lane) == weight
+    # the busiest lane never takes two turns in a row here
+    assert all(a != b or a == job.EXAM for a, b in zip(schedule, schedule[1:]))
+
+
+def test_lease_shares_turns_by_weight():
+    for i in range(20):
+        job.enqueue(f'exam-{i}', job.EXAM)
+        job.enqueue(f'bg-{i}', job.BACKGROUND)
+    lanes = [job.lease('rn_a').lane for _ in range(20)]
+    weights = params.LANE_WEIGHTS
+    # the normal lane is empty, its turns go to the exam lane
+    share = weights[job.BACKGROUND] / sum(weights.values())
+    assert lanes.count(job.BACKGROUND) == int(20 * share)
+    assert lanes.count(job.EXAM) == 20 - int(20 * share)
+
+
+def test_lease_falls_back_to_any_lane():
+    job_id = job.enqueue('sub-1', job.BACKGROUND)
+    lease = job.lease('rn_a')
+    assert lease.job_id == job_id
+    assert lease.lane == job.BACKGROUND
+    assert job.lease('rn_a') is None
+
+
+def test_enqueue_rejects_unknown_lane():
+    with pytest.raises(ValueError):
+        job.enqueue('sub-1', 'vip')
+
+
+def test_recover_requeues_into_same_lane(clock):
+    job_id = job.enqueue('sub-1', job.EXAM)
+    job.lease('rn_a')
+    clock[0] += params.LEASE_TTL_SEC + 1
+    assert job.recover().requeued == [job_id]
+    assert job.queue_lengths() == {
+        job.EXAM: 1,
+        job.NORMAL: 0,
+        job.BACKGROUND: 0,
+    }
+    assert job.lease('rn_b').lane == job.EXAM
+
+
+# --- runner heartbeat ---------------------------------------------------
+
+
+def test_heartbeat_marks_runner_alive(monkeypatch):
+    monkeypatch.setattr(runner, '_now', lambda: 1_000_000.0)
+    reg = runner.register('r', '1.1.1.1')
+    monkeypatch.setattr(runner, '_now', lambda: 1_000_060.0)
+    runner.heartbeat(reg.runner_id)
+
+    client = runner._redis()
+    assert client.zscore(redis_keys.RUNNERS_REGISTERED,
+                         reg.runner_id) == 1_000_060.0
+    assert client.get(redis_keys.runner_alive(reg.runner_id)) == b'1'
+
+
+def test_heartbeat_does_not_resurrect_swept_runner():
+    runner.heartbeat('rn_ghost')
+    assert runner._redis().zscore(redis_keys.RUNNERS_REGISTERED,
+                                  'rn_ghost') is None
@@ -17,15 +17,15 @@ def setup_minio():
 @pytest.fixture(autouse=True)
 def fresh_fakeredis(monkeypatch):
     # Force each test onto a fresh FakeStrictRedis: RedisCache caches its
-    # connection pool on the class and dispatch caches one RedisCache instance.
+    # connection pool and the fake client on the class.
     # REDIS_PORT must be None in settings so RedisCache falls back to fakeredis.
     monkeypatch.setattr(settings, 'REDIS_HOST', None)
     monkeypatch.setattr(settings, 'REDIS_PORT', None)
     RedisCache.POOL = None
-    runner._cache = None
+    RedisCache.FAKE_CLIENT = None
     yield
     RedisCache.POOL = None
-    runner._cache = None
+    RedisCache.FAKE_CLIENT = None
 
 
 def _sha256_hex(text: str) -> str:
@@ -6,6 +6,7 @@ from starlette.testclient import TestClient
 from tests.base_tester import BaseTester, random_string
 from tests.conftest import ForgeClient
 from mongo import *
+from mongo import engine
 from tests import utils
 from datetime import datetime, timedelta
 
@@ -309,7 +310,7 @@ class TestHomework(BaseTester):
         assert {*rv_data['problemIds']} == {*new_data['problemIds']}
         # ensure that student status also updated
         hw_id = course_data.homework_ids[0]
-        homework = Homework.get_by_id(hw_id)
+        homework = Homework(Homework.get_by_id(hw_id))
         course = Course(course_data.name)
         print(course.obj.student_nicknames)
         status = next(iter(homework.student_status.values()))
@@ -756,12 +757,13 @@ class TestHomeworkMongo(BaseTester):
         assert hw.problem_ids == [problem.id]
 
     def test_add_student(self):
-        c = utils.course.create_course(students=1)
+        c = utils.course.create_course()
         u = c.teacher
         hw_name = 'shibainu17'
         hw = Homework.add(u, course_name=c, hw_name=hw_name)
         hw = Homework(hw)
-        student_name = list(c.student_nicknames.keys())[0]
+        # not in the course when the homework is added
+        student_name = utils.user.create_user().username
         student = User(student_name)
         hw.add_student([student])
         assert student_name in hw.student_status
@@ -770,20 +772,45 @@ class TestHomeworkMongo(BaseTester):
             hw.add_student([student])
         assert str(err.value) == 'Student already in homework'
 
+    def test_student_status(self):
+        c = utils.course.create_course(students=2)
+        problem = utils.problem.create_problem()
+        hw = Homework(
+            Homework.add(
+                c.teacher,
+                course_name=c,
+                hw_name='shibainu20',
+                problem_ids=[problem.id],
+            ))
+        names = [*c.student_nicknames]
+        default_status = {str(problem.id): Homework.default_problem_status()}
+        assert hw.student_status == {name: default_status for name in names}
+        assert hw.get_student_status(names[0]) == default_status
+        assert hw.get_student_status('nobody') is None
+        hw.remove_student([User(names[0])])
+        assert [*hw.student_status] == names[1:]
+        assert engine.HomeworkProblemStatus.objects(
+            homework=hw.id).count() == 1
+        # status goes with its homework
+        hw.delete_problems(course=c, user=c.teacher)
+        assert engine.HomeworkProblemStatus.objects(
+            homework=hw.id).count() == 0
+
     def test_remove_student_not_exist(self):
-        c = utils.course.create_course(students=1)
+        c = utils.course.create_course()
         u = c.teacher
         hw_name = 'shibainu18'
         hw = Homework.add(u, course_name=c, hw_name=hw_name)
         hw = Homework(hw)
-        student_name = list(c.student_nicknames.keys())[0]
+        # not in the course when the homework is added
+        student_name = utils.user.create_user().username
         student = User(student_name)
         with pytest.raises(ValueError) as err:
             hw.remove_student([student])
         assert str(err.value) == 'Student not in homework'
 
     def test_do_penalty(self, app):
-        c = utils.course.create_course(students=1)
+        c = utils.course.create_course()
         u = c.teacher
         hw_name = 'shibainu19'
         due_time = datetime.today() - timedelta(days=1)
@@ -798,7 +825,8 @@ class TestHomeworkMongo(BaseTester):
                           penalty='1',
                           problem_ids=[problem.id])
         hw = Homework(hw)
-        student_name = list(c.student_nicknames.keys())[0]
+        # not in the course when the homework is added
+        student_name = utils.user.create_user().username
         student = User(student_name)
 
         hw.add_student(students=[student])
@@ -1,5 +1,5 @@
 import pytest
-from mongo.utils import RedisCache, redis, doc_required
+from mongo.utils import RedisCache, PeriodicWorker, redis, doc_required
 from mongo import Course
 from unittest.mock import MagicMock
 from config import settings
@@ -65,3 +65,31 @@ def test_doc_required_replace_des(caplog, app):
 
     assert "WARNING" in caplog.text
     assert "replace a existed argument" in caplog.text
+
+
+def test_periodic_worker_keeps_running_after_error():
+
+    class Worker(PeriodicWorker):
+
+        def __init__(self):
+            super().__init__('test-worker', 0.01)
+            self.runs = 0
+
+        def run_once(self):
+            self.runs += 1
+            if self.runs == 3:
+                self.stop()
+            raise RuntimeError('boom')
+
+    worker = Worker()
+    worker.start()
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+    assert worker.runs == 3
+
+
+def test_periodic_worker_gate():
+    a, b = PeriodicWorker('a', 60), PeriodicWorker('b', 60)
+    assert a.take_gate('TEST_GATE') is True
+    assert b.take_gate('TEST_GATE') is False
+    assert RedisCache().client.ttl('TEST_GATE') == 60
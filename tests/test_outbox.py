@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import mongomock.collection
+import pytest
+
+from mongo import Submission, User, engine
+from mongo import outbox
+from tests import utils
+
+pytestmark = pytest.mark.usefixtures('fresh_db')
+
+
+def test_applied_in_background():
+    _, (student, ), _, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    submission = utils.submission.create_judged_submission(user=student,
+                                                           problem=problem)
+    # the result is stored, the rest waits for the consumer
+    assert submission.status == 0
+    assert User(student.username).submission == 0
+    assert utils.homework.get_problem_status(homework, student,
+                                             problem)['submissionIds'] == []
+    assert outbox.drain() == 1
+    assert User(student.username).submission == 1
+    assert utils.homework.get_problem_status(
+        homework, student, problem)['submissionIds'] == [submission.id]
+    assert engine.JudgeOutbox.objects.count() == 0
+
+
+def test_retry_is_idempotent(monkeypatch):
+    _, (student, ), _, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    submission = utils.submission.create_judged_submission(user=student,
+                                                           problem=problem)
+    orig = Submission.update_homework_status
+
+    def update_homework_status(self):
+        raise ConnectionError('mongo is down')
+
+    monkeypatch.setattr(Submission, 'update_homework_status',
+                        update_homework_status)
+    assert outbox.drain() == 0
+    (entry, ) = engine.JudgeOutbox.objects
+    assert entry.done == ['user']
+    # leased, not retried before it runs out
+    assert outbox.drain() == 0
+    monkeypatch.setattr(Submission, 'update_homework_status', orig)
+    assert outbox.drain(now=datetime.now() + outbox.LEASE) == 1
+    assert User(student.username).submission == 1
+    assert utils.homework.get_problem_status(
+        homework, student, problem)['submissionIds'] == [submission.id]
+    # applying the same result again changes nothing
+    submission.update_homework_status()
+    assert utils.homework.get_problem_status(
+        homework, student, problem)['submissionIds'] == [submission.id]
+
+
+def test_failing_entry_is_set_aside(monkeypatch):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem(hw_count=1)
+    utils.submission.create_judged_submission(user=student, problem=problem)
+
+    def update_homework_status(self):
+        raise ValueError('poison')
+
+    monkeypatch.setattr(Submission, 'update_homework_status',
+                        update_homework_status)
+    now = datetime.now()
+    for _ in range(outbox.MAX_ATTEMPTS):
+        assert outbox.drain(now=now) == 0
+        now += outbox.LEASE
+    (entry, ) = engine.JudgeOutbox.objects
+    assert entry.attempts == outbox.MAX_ATTEMPTS
+    assert outbox.claim(now=now) == []
+    assert outbox.set_aside(now=now) == 1
+    assert entry.reload().lease == outbox.SET_ASIDE
+    assert outbox.set_aside(now=now) == 0
+    assert outbox.drain(now=now + outbox.LEASE) == 0
+    assert engine.JudgeOutbox.objects.get().attempts == outbox.MAX_ATTEMPTS
+
+
+def test_claimed_once():
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem(hw_count=1)
+    utils.submission.create_judged_submission(user=student, problem=problem)
+    assert len(outbox.claim()) == 1
+    assert outbox.claim() == []
+
+
+def test_one_user_update_per_batch(monkeypatch):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem(hw_count=1)
+    submissions = [
+        utils.submission.create_judged_submission(user=student,
+                                                  problem=problem)
+        for _ in range(5)
+    ]
+    updates = []
+    orig = mongomock.collection.Collection.update_one
+
+    def update_one(self, *args, **kwargs):
+        if self.name == 'user':
+            updates.append(args)
+        return orig(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'update_one',
+                        update_one)
+    assert outbox.drain() == 5
+    assert len(updates) == 1
+    user = User(student.username)
+    assert user.submission == 5
+    assert user.AC_submission == sum(s.score == 100 for s in submissions)
+
+
+def test_rejudged_entry_is_dropped():
+    _, (student, ), _, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    submission = utils.submission.create_judged_submission(user=student,
+                                                           problem=problem)
+    submission.update(status=-1)
+    assert outbox.drain() == 1
+    assert User(student.username).submission == 0
+    assert utils.homework.get_problem_status(homework, student,
+                                             problem)['submissionIds'] == []
@@ -0,0 +1,219 @@
+import time
+
+import pytest
+
+from mongo import Submission, RejudgeJob
+from mongo import rejudge
+from mongo.utils import RedisCache
+from dispatch import job
+from tests import utils
+
+pytestmark = pytest.mark.usefixtures('fresh_db')
+
+
+def _judged_submissions(problem, k, **ks):
+    ret = []
+    for _ in range(k):
+        submission = utils.submission.create_judged_submission(
+            user=utils.user.create_user(),
+            problem=problem,
+            **ks,
+        )
+        job.cancel(submission.id)
+        ret.append(submission)
+    return ret
+
+
+def _wait(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        rv = client.get(f'/submission/rejudge-jobs/{job_id}')
+        assert rv.status_code == 200, rv.json()
+        if rv.json()['data']['state'] in (RejudgeJob.DONE, RejudgeJob.FAILED):
+            return rv.json()['data']
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+def test_query_skips_pending_and_handwritten(app):
+    problem = utils.homework.create_course_problem().problem
+    judged = _judged_submissions(problem, 2)
+    utils.submission.create_submission(
+        user=utils.user.create_user(),
+        problem=problem,
+        status=-1,
+    )
+    assert [*RejudgeJob.query([problem.problem_id])] == [s.id for s in judged]
+    assert [*RejudgeJob.query([problem.problem_id], status=1)] == []
+
+
+def test_query_by_page(app, monkeypatch):
+    problem = utils.homework.create_course_problem().problem
+    judged = _judged_submissions(problem, 5)
+    monkeypatch.setattr(RejudgeJob, 'QUERY_PAGE_SIZE', 2)
+    rejudge_job = RejudgeJob.create(
+        RejudgeJob.query([problem.problem_id]),
+        requester='admin',
+        scope={},
+    )
+    assert rejudge_job.info()['total'] == 5
+    assert [*RejudgeJob.query([problem.problem_id])] == [s.id for s in judged]
+
+
+def test_rejudge_many(app):
+    problem = utils.homework.create_course_problem().problem
+    submissions = _judged_submissions(problem, 3)
+    assert all(s.tasks for s in submissions)
+    assert Submission.rejudge_many([s.id for s in submissions]) == 3
+    for submission in submissions:
+        submission.reload()
+        assert submission.status == -1
+        assert submission.tasks == []
+        assert job.current_job(submission.id) is not None
+
+
+def test_run_job(app):
+    problem = utils.homework.create_course_problem().problem
+    submissions = _judged_submissions(problem, 5)
+    rejudge_job = RejudgeJob.create(
+        [s.id for s in submissions],
+        requester='admin',
+        scope={'problemId': problem.problem_id},
+        rate=10**6,
+    )
+    assert rejudge_job.info()['state'] == RejudgeJob.QUEUED
+    rejudge_job.BATCH_SIZE = 2
+    rejudge_job.run()
+    info = rejudge_job.info()
+    assert info['state'] == RejudgeJob.DONE
+    assert info['done'] == info['total'] == 5
+    assert info['eta'] == 0
+    for submission in submissions:
+        assert submission.reload().status == -1
+        assert job.current_job(submission.id) is not None
+
+
+def test_resume_job(app, monkeypatch):
+    problem = utils.homework.create_course_problem().problem
+    submissions = _judged_submissions(problem, 5)
+    rejudge_job = RejudgeJob.create(
+        [s.id for s in submissions],
+        requester='admin',
+        scope={},
+        rate=10**6,
+    )
+    # left by a worker died after two submissions
+    rejudge_job._set(state=RejudgeJob.RUNNING, startedAt=time.time(), done=2)
+    monkeypatch.setattr(RejudgeJob, 'start', RejudgeJob.run)
+    assert [j.id for j in RejudgeJob.resume()] == [rejudge_job.id]
+    info = rejudge_job.info()
+    assert info['state'] == RejudgeJob.DONE
+    assert info['done'] == 5
+    assert [s.reload().status for s in submissions] == [0, 0, -1, -1, -1]
+    # finished jobs are not resumed again
+    assert RejudgeJob.resume() == []
+
+
+def test_held_job_is_not_run(app, monkeypatch):
+    problem = utils.homework.create_course_problem().problem
+    submissions = _judged_submissions(problem, 2)
+    rejudge_job = RejudgeJob.create(
+        [s.id for s in submissions],
+        requester='admin',
+        scope={},
+    )
+    RedisCache().client.set(rejudge_job.lock_key, 'other')
+    monkeypatch.setattr(RejudgeJob, 'start', RejudgeJob.run)
+    assert RejudgeJob.resume() == []
+    rejudge_job.run()
+    assert rejudge_job.info()['state'] == RejudgeJob.QUEUED
+    assert all(s.reload().status == 0 for s in submissions)
+
+
+def test_lock_taken_over_is_not_extended(monkeypatch):
+    rejudge_job = RejudgeJob('job')
+    client = RedisCache().client
+    client.set(rejudge_job.lock_key, 'me', ex=5)
+    assert rejudge_job._hold('me')
+    assert client.ttl(rejudge_job.lock_key) == RejudgeJob.LOCK_TTL
+    orig = rejudge._decode
+
+    def _decode(value):
+        # the lock expires and is taken by another worker after the check
+        client.set(rejudge_job.lock_key, 'other', ex=5)
+        return orig(value)
+
+    monkeypatch.setattr(rejudge, '_decode', _decode)
+    assert not rejudge_job._hold('me')
+    assert client.ttl(rejudge_job.lock_key) == 5
+    rejudge_job._release('me')
+    assert client.get(rejudge_job.lock_key) == b'other'
+
+
+def test_rejudge_problem_by_api(forge_client):
+    admin = utils.user.create_user(role=0)
+    client_admin = forge_client(admin.username)
+    problem = utils.homework.create_course_problem().problem
+    submissions = _judged_submissions(problem, 3)
+    rv = client_admin.post(
+        '/submission/rejudge-jobs',
+        json={
+            'problemId': problem.problem_id,
+            'rate': 1000,
+        },
+    )
+    assert rv.status_code == 202, rv.json()
+    info = _wait(client_admin, rv.json()['data']['id'])
+    assert info['total'] == info['done'] == 3
+    for submission in submissions:
+        assert submission.reload().status == -1
+
+
+def test_rejudge_requires_permission(forge_client):
+    client_student = forge_client(utils.user.create_user(role=2).username)
+    problem = utils.homework.create_course_problem().problem
+    rv = client_student.post(
+        '/submission/rejudge-jobs',
+        json={'problemId': problem.problem_id},
+    )
+    assert rv.status_code == 403, rv.json()
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {
+        'problemId': 1,
+        'homeworkId': 'abc'
+    },
+])
+def test_rejudge_requires_one_scope(forge_client, body):
+    client_admin = forge_client(utils.user.create_user(role=0).username)
+    rv = client_admin.post('/submission/rejudge-jobs', json=body)
+    assert rv.status_code == 400, rv.json()
+
+
+def test_others_job_is_hidden(forge_client):
+    client_student = forge_client(utils.user.create_user(role=2).username)
+    rejudge_job = RejudgeJob.create([], requester='admin', scope={})
+    rv = client_student.get(f'/submission/rejudge-jobs/{rejudge_job.id}')
+    assert rv.status_code == 404, rv.json()
+
+
+def test_rejudge_homework_by_api(forge_client):
+    teacher, _, _, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    now = time.time()
+    inside = _judged_submissions(problem, 2, timestamp=now - 60)
+    outside = _judged_submissions(problem, 1, timestamp=now - 7200)
+    rv = forge_client(teacher.username).post(
+        '/submission/rejudge-jobs',
+        json={
+            'homeworkId': str(homework.id),
+            'rate': 1000,
+        },
+    )
+    assert rv.status_code == 202, rv.json()
+    info = _wait(forge_client(teacher.username), rv.json()['data']['id'])
+    assert info['total'] == 2
+    assert all(s.reload().status == -1 for s in inside)
+    assert all(s.reload().status == 0 for s in outside)
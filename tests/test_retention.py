@@ -0,0 +1,144 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+
+from mongo import retention
+from mongo.utils import MinioClient
+from tests import utils
+
+
+@pytest.fixture(autouse=True)
+def no_objects(fresh_db):
+    # objects left by other tests would be orphans here
+    minio_client = MinioClient()
+    errors = minio_client.client.remove_objects(minio_client.bucket, [
+        DeleteObject(obj.object_name)
+        for obj in minio_client.client.list_objects(
+            minio_client.bucket,
+            prefix=retention.OUTPUT_PREFIX,
+            recursive=True,
+        )
+    ])
+    assert not list(errors)
+
+
+def _problem():
+    return utils.problem.create_problem(
+        test_case_info=utils.problem.create_test_case_info(
+            language=0,
+            task_len=1,
+            case_count_range=(2, 2),
+        ))
+
+
+def _judged(user, problem, timestamp=None):
+    return utils.submission.create_judged_submission(
+        user=user,
+        problem=problem,
+        timestamp=timestamp and timestamp.timestamp(),
+    )
+
+
+def _has_output(submission):
+    submission.reload()
+    return all(c.output_minio_path is not None for t in submission.tasks
+               for c in t.cases)
+
+
+def _exists(path):
+    minio_client = MinioClient()
+    try:
+        minio_client.client.stat_object(minio_client.bucket, path)
+    except S3Error:
+        return False
+    return True
+
+
+def test_expire_by_age():
+    problem = _problem()
+    user = utils.user.create_user()
+    old = _judged(user, problem, timestamp=datetime.now() - timedelta(days=10))
+    new = _judged(user, problem)
+    assert retention.expire_outputs(days=7) == 1
+    assert not _has_output(old)
+    assert _has_output(new)
+    # the judge results are kept
+    assert old.status == 0 and len(old.tasks[0].cases) == 2
+    case = old.get_detailed_result()[0]['cases'][0]
+    assert case['stdout'] == '' and case['stdoutSize'] is None
+
+
+def test_keep_latest():
+    problem = _problem()
+    user, other = utils.user.create_user(), utils.user.create_user()
+    now = datetime.now()
+    mine = [
+        _judged(user, problem, timestamp=now - timedelta(minutes=i))
+        for i in range(3)
+    ]
+    others = _judged(other, problem, timestamp=now - timedelta(hours=1))
+    assert retention.expire_outputs(keep_latest=1) == 2
+    assert _has_output(mine[0])
+    assert not any(map(_has_output, mine[1:]))
+    assert _has_output(others)
+    # nothing more to do
+    assert retention.expire_outputs(keep_latest=1) == 0
+
+
+def test_sweep_orphans():
+    problem = _problem()
+    user = utils.user.create_user()
+    dropped = _judged(user, problem)
+    kept = _judged(user, problem)
+    dropped_path = dropped.tasks[0].cases[0].output_minio_path
+    kept_path = kept.tasks[0].cases[0].output_minio_path
+    size = MinioClient().client.stat_object(
+        MinioClient().bucket,
+        dropped_path,
+    ).size
+    dropped.delete_output()
+    # too young to tell from a result being written
+    assert retention.sweep_orphans() == {'objects': 0, 'bytes': 0}
+    assert retention.sweep_orphans(grace=timedelta(0)) == {
+        'objects': 1,
+        'bytes': size,
+    }
+    assert not _exists(dropped_path)
+    assert _exists(kept_path)
+    assert kept.get_single_output(0, 1) == {'stdout': 'out', 'stderr': 'err'}
+
+
+def test_legacy_code_is_not_orphan():
+    problem = _problem()
+    submission = _judged(utils.user.create_user(), problem)
+    # code uploaded before it was content addressed
+    path = f'submissions/{submission.id}_legacy.zip'
+    minio_client = MinioClient()
+    minio_client.client.put_object(
+        minio_client.bucket,
+        path,
+        io.BytesIO(b'code'),
+        4,
+    )
+    submission.update(code_minio_path=path)
+    assert retention.sweep_orphans(grace=timedelta(0))['objects'] == 0
+    assert _exists(path)
+
+
+def test_sweep(monkeypatch):
+    problem = _problem()
+    user = utils.user.create_user()
+    old = _judged(user, problem, timestamp=datetime.now() - timedelta(days=2))
+    path = old.tasks[0].cases[0].output_minio_path
+    monkeypatch.setattr(retention.settings, 'OUTPUT_RETENTION_DAYS', 1)
+    monkeypatch.setattr(retention, 'ORPHAN_GRACE', timedelta(0))
+    report = retention.OutputSweeper().run_once()
+    assert report['expired'] == 1
+    assert report['removedObjects'] == 1
+    assert report['reclaimedBytes'] > 0
+    assert not _exists(path)
+    # another worker within the same interval does nothing
+    assert retention.OutputSweeper().run_once() is None
@@ -119,6 +119,37 @@ class TestUserGetSubmission(SubmissionTester):
         assert rv.status_code == 200, rv_json
         assert len(rv_data['submissions']) == 1
 
+    def test_get_submission_list_by_cursor(self, forge_client):
+        client = forge_client('student')
+        rv, rv_json, rv_data = BaseTester.request(
+            client,
+            'get',
+            f'/submission?offset=0&count=-1',
+        )
+        expected = [s['submissionId'] for s in rv_data['submissions']]
+        assert rv_data['nextCursor'] is None
+        ids, cursor = [], ''
+        while cursor is not None:
+            rv, rv_json, rv_data = BaseTester.request(
+                client,
+                'get',
+                f'/submission?count=3&cursor={cursor}'
+                if cursor else '/submission?offset=0&count=3',
+            )
+            assert rv.status_code == 200, rv_json
+            ids += [s['submissionId'] for s in rv_data['submissions']]
+            cursor = rv_data['nextCursor']
+        assert ids == expected
+
+    def test_get_submission_list_with_invalid_cursor(self, forge_client):
+        client = forge_client('student')
+        rv, rv_json, rv_data = BaseTester.request(
+            client,
+            'get',
+            f'/submission?count=3&cursor=nope',
+        )
+        assert rv.status_code == 400, rv_json
+
     def test_get_submission_list_with_maximun_offset(self, forge_client):
         client = forge_client('student')
         rv, rv_json, rv_data = BaseTester.request(
@@ -1081,3 +1112,130 @@ def test_cannot_view_output_out_of_index(app, forge_client):
     rv = client.get(f'/submission/{submission.id}/output/100/100')
     assert rv.status_code == 400, rv.json()
     assert rv.json()['message'] == 'task not exist'
+
+
+def _judged_with_output(stdout: str):
+    student = utils.user.create_user()
+    problem = utils.problem.create_problem(
+        test_case_info=utils.problem.create_test_case_info(
+            language=0,
+            task_len=1,
+            case_count_range=(2, 2),
+        ))
+    submission = utils.submission.create_submission(
+        user=student,
+        problem=problem,
+        status=2,
+    )
+    submission.process_result([[{
+        'exitCode': 0,
+        'status': 'CE',
+        'stdout': stdout,
+        'stderr': f'err{i}',
+        'execTime': 10,
+        'memoryUsage': 1024,
+    } for i in range(2)]])
+    return student, submission
+
+
+def test_download_output(app, forge_client):
+    student, submission = _judged_with_output('0123456789' * 1000)
+    client = forge_client(student.username)
+    rv = client.get(
+        f'/submission/{submission.id}/output/0/1/stdout',
+        headers={'Accept-Encoding': 'identity'},
+    )
+    assert rv.status_code == 200
+    assert rv.headers['content-length'] == '10000'
+    assert rv.headers['accept-ranges'] == 'bytes'
+    assert rv.headers['content-type'].startswith('text/plain')
+    assert rv.content == b'0123456789' * 1000
+    rv = client.get(f'/submission/{submission.id}/output/0/1/stderr')
+    assert rv.status_code == 200
+    assert rv.text == 'err1'
+
+
+def test_download_output_gzipped(app, forge_client):
+    student, submission = _judged_with_output('a' * 100000)
+    client = forge_client(student.username)
+    rv = client.get(
+        f'/submission/{submission.id}/output/0/0/stdout',
+        headers={'Accept-Encoding': 'gzip'},
+    )
+    assert rv.status_code == 200
+    assert rv.headers['content-encoding'] == 'gzip'
+    assert rv.num_bytes_downloaded < 100000
+    assert rv.content == b'a' * 100000
+
+
+@pytest.mark.parametrize('header, expected, content_range', [
+    ('bytes=10-19', b'0123456789', 'bytes 10-19/10000'),
+    ('bytes=9995-', b'56789', 'bytes 9995-9999/10000'),
+    ('bytes=-3', b'789', 'bytes 9997-9999/10000'),
+    ('bytes=9998-20000', b'89', 'bytes 9998-9999/10000'),
+])
+def test_download_output_range(app, forge_client, header, expected,
+                               content_range):
+    student, submission = _judged_with_output('0123456789' * 1000)
+    client = forge_client(student.username)
+    rv = client.get(
+        f'/submission/{submission.id}/output/0/0/stdout',
+        headers={'Range': header},
+    )
+    assert rv.status_code == 206
+    assert rv.headers['content-range'] == content_range
+    assert rv.headers['content-length'] == str(len(expected))
+    assert 'content-encoding' not in rv.headers
+    assert rv.content == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=10000-', 'bytes=-0'])
+def test_download_output_bad_range(app, forge_client, header):
+    student, submission = _judged_with_output('0123456789' * 1000)
+    client = forge_client(student.username)
+    rv = client.get(
+        f'/submission/{submission.id}/output/0/0/stdout',
+        headers={'Range': header},
+    )
+    assert rv.status_code == 416
+    assert rv.headers['content-range'] == 'bytes */10000'
+
+
+@pytest.mark.parametrize('header', [
+    'items=0-1',
+    'bytes=5-2',
+    'bytes=0-1,5-6',
+    'bytes=',
+])
+def test_download_output_ignored_range(app, forge_client, header):
+    student, submission = _judged_with_output('0123456789' * 1000)
+    client = forge_client(student.username)
+    rv = client.get(
+        f'/submission/{submission.id}/output/0/0/stdout',
+        headers={
+            'Range': header,
+            'Accept-Encoding': 'identity',
+        },
+    )
+    assert rv.status_code == 200
+    assert 'content-range' not in rv.headers
+    assert rv.content == b'0123456789' * 1000
+
+
+def test_download_expired_output(app, forge_client):
+    student, submission = _judged_with_output('out')
+    submission.delete_output()
+    client = forge_client(student.username)
+    rv = client.get(f'/submission/{submission.id}/output/0/0/stdout')
+    assert rv.status_code == 410, rv.json()
+    rv = client.get(f'/submission/{submission.id}/output/0/0')
+    assert rv.status_code == 410, rv.json()
+
+
+def test_download_output_permission(app, forge_client):
+    _, submission = _judged_with_output('out')
+    client = forge_client(utils.user.create_user().username)
+    rv = client.get(f'/submission/{submission.id}/output/0/0/stdout')
+    assert rv.status_code == 403, rv.json()
+    rv = client.get(f'/submission/{submission.id}/output/0/0/code')
+    assert rv.status_code == 400, rv.json()
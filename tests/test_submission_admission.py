@@ -0,0 +1,117 @@
+import time
+from collections import Counter
+from datetime import datetime
+
+import mongomock.collection
+import pytest
+
+from mongo import Admission, Submission
+from tests import utils
+
+# collection methods mongoengine goes through, each one a round trip
+MONGO_OPS = (
+    'find',
+    'find_one',
+    'insert_one',
+    'update_one',
+    'update_many',
+    'find_one_and_update',
+    'replace_one',
+    'aggregate',
+    'count_documents',
+)
+
+
+@pytest.fixture
+def mongo_ops(monkeypatch):
+    '''
+    count the round trips to mongo by collection and operation
+    '''
+    calls = Counter()
+    for op in MONGO_OPS:
+        orig = getattr(mongomock.collection.Collection, op)
+
+        def wrapper(self, *args, _orig=orig, _op=op, **kwargs):
+            calls[self.name, _op] += 1
+            return _orig(self, *args, **kwargs)
+
+        monkeypatch.setattr(mongomock.collection.Collection, op, wrapper)
+    return calls
+
+
+@pytest.mark.parametrize('hw_count', [1, 4])
+def test_create_round_trips(forge_client, mongo_ops, hw_count):
+    _, (student, ), _, problem, _ = \
+        utils.homework.create_course_problem(hw_count=hw_count)
+    client = forge_client(student.username)
+    mongo_ops.clear()
+    rv = client.post(
+        '/submission',
+        json={
+            'problemId': problem.problem_id,
+            'languageType': 0,
+        },
+    )
+    assert rv.status_code == 200, rv.json()
+    # login, config, problem, courses, homeworks, insert, user update and
+    # the two submission counters; it used to be 23 with a single homework
+    # and grew with each one
+    assert sum(mongo_ops.values()) == 9, mongo_ops
+    assert all(n == 1 for n in mongo_ops.values()), mongo_ops
+
+
+def test_config_is_one_round_trip(app, mongo_ops):
+    Submission.config()
+    mongo_ops.clear()
+    Submission.config()
+    assert sum(mongo_ops.values()) == 1
+
+
+def test_config_is_recreated(app):
+    config = Submission.config()
+    config.obj.delete()
+    assert Submission.config().rate_limit == config.rate_limit
+    assert Submission.config()
+
+
+def test_load_missing_problem(app):
+    assert Admission.load(99999) is None
+
+
+def test_view_and_grade():
+    teacher, (student, ), course, problem, _ = \
+        utils.homework.create_course_problem(hw_count=1)
+    ta = utils.user.create_user(role=2)
+    course.update(push__tas=ta.obj)
+    outsider = utils.user.create_user(role=2)
+    admin = utils.user.create_user(role=0)
+    admission = Admission.load(problem.problem_id)
+    assert admission.can_view(student)
+    assert not admission.can_grade(student)
+    assert not admission.can_view(outsider)
+    for user in (teacher, ta, admin):
+        assert admission.can_view(user)
+        assert admission.can_grade(user)
+
+
+def test_not_started(app):
+    now = time.time()
+    *_, problem, _ = utils.homework.create_course_problem(
+        hw_count=1,
+        start=now + 3600,
+        end=now + 7200,
+    )
+    admission = Admission.load(problem.problem_id)
+    assert not admission.started(datetime.now())
+    # not running, so its ip filters do not apply yet
+    assert admission.is_valid_ip('8.8.8.8', datetime.now())
+
+
+def test_ip_filter(app):
+    *_, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    homework.obj.update(ip_filters=['192.168.0.1'])
+    admission = Admission.load(problem.problem_id)
+    assert admission.started(datetime.now())
+    assert admission.is_valid_ip('192.168.0.1', datetime.now())
+    assert not admission.is_valid_ip('8.8.8.8', datetime.now())
@@ -0,0 +1,208 @@
+'''
+Every query shape on submissions has to be served by an index. The shapes
+are recorded from the real code paths. mongomock has no query planner, so
+they are matched against the declared indexes here the way the planner picks
+candidates, and `explain()` is checked as well when running on a real mongo.
+'''
+import json
+
+import mongomock.collection
+import pytest
+
+from config import settings
+from mongo import Course, RejudgeJob, Submission, User, engine
+from mongo import retention
+from tests import utils
+
+COLLECTION = 'submission'
+
+pytestmark = pytest.mark.usefixtures('fresh_db')
+
+
+@pytest.fixture
+def shapes(monkeypatch):
+    '''
+    (filter, sort) of every query sent to the submission collection
+    '''
+    recorded = []
+    in_aggregate = []
+    orig_get_dataset = mongomock.collection.Collection._get_dataset
+    orig_aggregate = mongomock.collection.Collection.aggregate
+
+    def _get_dataset(self, spec, sort, *args, **kwargs):
+        if self.name == COLLECTION and not in_aggregate:
+            recorded.append((spec or {}, sort or []))
+        return orig_get_dataset(self, spec, sort, *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        if self.name == COLLECTION:
+            match = pipeline[0].get('$match', {}) if pipeline else {}
+            recorded.append((match, []))
+        in_aggregate.append(True)
+        try:
+            return orig_aggregate(self, pipeline, *args, **kwargs)
+        finally:
+            in_aggregate.pop()
+
+    monkeypatch.setattr(mongomock.collection.Collection, '_get_dataset',
+                        _get_dataset)
+    monkeypatch.setattr(mongomock.collection.Collection, 'aggregate',
+                        aggregate)
+    return recorded
+
+
+def _fields(spec) -> set:
+    '''
+    fields constrained by a filter
+    '''
+    fields = set()
+    for k, v in spec.items():
+        if k == '$and':
+            for sub in v:
+                fields |= _fields(sub)
+        elif k == '$or':
+            # only those every branch constrains
+            fields |= set.intersection(*map(_fields, v))
+        elif not k.startswith('$'):
+            fields.add(k)
+    return fields
+
+
+def _indexes():
+    return [[f for f, _ in spec['fields']]
+            for spec in engine.Submission._meta['index_specs']] + [['_id']]
+
+
+def _served(spec, sort) -> bool:
+    '''
+    whether some index could be scanned instead of the collection: it leads
+    with a constrained field, or it provides the sort order
+    '''
+    # each branch of a top-level $or can be served by its own index
+    if set(spec) == {'$or'} and all(_served(s, []) for s in spec['$or']):
+        return True
+    fields = _fields(spec)
+    sort_fields = [f for f, _ in sort]
+    for index in _indexes():
+        if index[0] in fields:
+            return True
+        if sort_fields and index[:len(sort_fields)] == sort_fields:
+            return True
+    return False
+
+
+def _setup():
+    teacher, (student, ), course, problem, _ = \
+        utils.homework.create_course_problem()
+    for status in (0, 1, 0):
+        utils.submission.create_submission(
+            user=student,
+            problem=problem,
+            status=status,
+        )
+    return teacher, student, course, problem
+
+
+def _exercise(teacher, student, course, problem):
+    admin = User('first_admin')
+    # submission lists
+    Submission.filter(user=admin, with_count=True)
+    Submission.filter(user=student, q_user=student.username)
+    Submission.filter(user=admin, problem=problem.problem_id)
+    Submission.filter(user=admin, problem=problem.problem_id, status=0)
+    Submission.filter(user=teacher, course=course.course_name)
+    Submission.filter(user=admin, language_type=[0, 1])
+    page = Submission.filter(user=admin, count=1)
+    Submission.filter(
+        user=admin,
+        count=1,
+        cursor=Submission.encode_cursor(page[0]),
+    )
+    # problem statistics
+    for sort_by in ('runTime', 'memoryUsage'):
+        Submission.filter(
+            user=admin,
+            count=10,
+            problem=problem.problem_id,
+            status=0,
+            sort_by=sort_by,
+        )
+    problem.get_high_score(user=student)
+    problem.get_submission_status()
+    problem.get_ac_user_count()
+    problem.get_tried_user_count()
+    # scoreboard
+    Course(course.course_name).get_scoreboard([problem.problem_id])
+    # rejudge scope
+    [*RejudgeJob.query([problem.problem_id], after=page[0].timestamp)]
+    # output retention
+    retention.expire_outputs(keep_latest=1)
+    retention._referenced(['submissions/x'])
+
+
+def test_query_shapes_use_indexes(shapes):
+    ctx = _setup()
+    shapes.clear()
+    _exercise(*ctx)
+    assert shapes
+    scans = [(spec, sort) for spec, sort in shapes if not _served(spec, sort)]
+    assert scans == [], scans
+
+
+def test_no_index_leads_with_id():
+    # the old compound index led with _id and served none of the queries
+    assert all(index[0] != '_id' or index == ['_id'] for index in _indexes())
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    '''
+    cursors of every query sent to the submission collection
+    '''
+    import pymongo.collection
+    queries = []
+    orig_find = pymongo.collection.Collection.find
+
+    def find(self, *args, **kwargs):
+        cursor = orig_find(self, *args, **kwargs)
+        if self.name == COLLECTION:
+            queries.append(cursor)
+        return cursor
+
+    def by_filter(name):
+        orig = getattr(pymongo.collection.Collection, name)
+
+        def wrapper(self, *args, **kwargs):
+            if self.name == COLLECTION:
+                spec = args[1] if name == 'distinct' else args[0]
+                queries.append(orig_find(self, spec))
+            return orig(self, *args, **kwargs)
+
+        monkeypatch.setattr(pymongo.collection.Collection, name, wrapper)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        if self.name == COLLECTION:
+            queries.append(orig_find(self, pipeline[0].get('$match', {})))
+        return orig_aggregate(self, pipeline, *args, **kwargs)
+
+    orig_aggregate = pymongo.collection.Collection.aggregate
+    monkeypatch.setattr(pymongo.collection.Collection, 'find', find)
+    monkeypatch.setattr(pymongo.collection.Collection, 'aggregate', aggregate)
+    by_filter('distinct')
+    by_filter('count_documents')
+    return queries
+
+
+@pytest.mark.skipif(
+    settings.MONGO_HOST.startswith('mongomock'),
+    reason='explain needs a real mongo',
+)
+def test_explain_has_no_collection_scan(plans):
+    engine.Submission.ensure_indexes()
+    ctx = _setup()
+    plans.clear()
+    _exercise(*ctx)
+    for cursor in plans:
+        plan = json.dumps(cursor.explain()['queryPlanner']['winningPlan'],
+                          default=str)
+        assert 'COLLSCAN' not in plan, plan
@@ -0,0 +1,132 @@
+import pytest
+
+from mongo import Submission, engine
+from mongo.utils import RedisCache
+from tests import utils
+
+pytestmark = pytest.mark.usefixtures('fresh_db')
+
+
+def _submissions(n=3, status=1):
+    _, (student, ), _, problem, _ = utils.homework.create_course_problem()
+    return [
+        utils.submission.create_submission(
+            user=student,
+            problem=problem,
+            status=status,
+        ) for _ in range(n)
+    ]
+
+
+def test_entries_keep_order_and_skip_deleted():
+    submissions = _submissions()
+    ids = [s.id for s in reversed(submissions)]
+    assert [e['submissionId'] for e in Submission.get_entries(ids)] == ids
+    submissions[0].delete()
+    assert [e['submissionId'] for e in Submission.get_entries(ids)] == ids[:-1]
+
+
+def test_entries_are_loaded_once(monkeypatch):
+    submissions = _submissions()
+    ids = [s.id for s in submissions]
+    Submission.get_entries(ids[:1])
+    rendered = []
+    orig = Submission.cache_entries.__func__
+
+    def cache_entries(cls, submissions, gens):
+        submissions = [*submissions]
+        rendered.append([s.id for s in submissions])
+        return orig(cls, submissions, gens)
+
+    monkeypatch.setattr(Submission, 'cache_entries',
+                        classmethod(cache_entries))
+    Submission.get_entries(ids)
+    # only the missing ones are rendered
+    assert rendered == [ids[1:]]
+
+
+def test_ttl_by_status():
+    judged, pending = _submissions(n=1)[0], _submissions(n=1, status=-1)[0]
+    Submission.get_entries([judged.id, pending.id])
+    client = RedisCache().client
+    assert client.ttl(Submission._entry_key(judged.id)) > \
+        Submission.PENDING_ENTRY_TTL
+    assert client.ttl(Submission._entry_key(pending.id)) <= \
+        Submission.PENDING_ENTRY_TTL
+
+
+def test_result_drops_entry():
+    submission = _submissions(n=1)[0]
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['status'] == 1
+    # written around `Submission`, the cached entry is stale
+    engine.Submission.objects(id=submission.obj.id).update(status=0)
+    submission.reload()
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['status'] == 1
+    utils.submission.add_fake_output(submission)
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['status'] == 0
+    submission.rejudge()
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['status'] == -1
+
+
+def test_invalidated_while_loading_is_not_cached(monkeypatch):
+    submission = _submissions(n=1)[0]
+    utils.submission.add_fake_output(submission)
+    orig = Submission.to_dicts.__func__
+
+    def to_dicts(cls, submissions):
+        submissions = [*submissions]
+        # rejudged after the rows are loaded
+        Submission(submission.id).rejudge()
+        return orig(cls, submissions)
+
+    monkeypatch.setattr(Submission, 'to_dicts', classmethod(to_dicts))
+    # rendered from the rows loaded before the rejudge
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['status'] != -1
+    monkeypatch.setattr(Submission, 'to_dicts', classmethod(orig))
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['status'] == -1
+
+
+def test_entries_follow_profile():
+    submission = _submissions(n=1)[0]
+    (entry, ) = Submission.get_entries([submission.id])
+    engine.User.objects(username=submission.username).update(
+        profile__displayed_name='renamed')
+    (entry, ) = Submission.get_entries([submission.id])
+    assert entry['user']['displayedName'] == 'renamed'
+    assert entry == Submission(submission.id).to_dict()
+
+
+def test_rejudge_many_drops_entries():
+    submissions = _submissions()
+    ids = [s.id for s in submissions]
+    Submission.get_entries(ids)
+    Submission.rejudge_many(ids)
+    assert all(e['status'] == -1 for e in Submission.get_entries(ids))
+
+
+def test_page_is_shared(forge_client, monkeypatch):
+    _submissions()
+    calls = []
+    orig = Submission.filter.__func__
+
+    def filter(cls, *args, **kwargs):
+        calls.append(kwargs)
+        return orig(cls, *args, **kwargs)
+
+    monkeypatch.setattr(Submission, 'filter', classmethod(filter))
+    pages = []
+    for role in (0, 1):
+        client = forge_client(utils.user.create_user(role=role).username)
+        rv = client.get('/submission?offset=0&count=2')
+        assert rv.status_code == 200, rv.json()
+        pages.append(rv.json()['data'])
+    # the second viewer is served the first one's page
+    assert len(calls) == 1
+    assert pages[0]['submissions'] == pages[1]['submissions']
+    assert pages[0]['submissionCount'] == pages[1]['submissionCount'] == 3
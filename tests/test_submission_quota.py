@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+
+from mongo import Submission, TestCaseNotFound, quota
+from tests import utils
+
+
+@pytest.fixture(autouse=True)
+def fresh_counters(app):
+    utils.drop_db()
+    yield
+    utils.drop_db()
+
+
+def test_rate_limit():
+    user = utils.user.create_user()
+    assert quota.admit(user, 1, rate_limit=5, quota=-1) == 1
+    with pytest.raises(quota.RateLimited) as e:
+        quota.admit(user, 1, rate_limit=5, quota=-1)
+    assert 4 < e.value.wait_for <= 5
+    # a rejected submission is not counted
+    assert quota.submit_count(user, 1) == 1
+
+
+def test_no_rate_limit():
+    user = utils.user.create_user()
+    for i in range(5):
+        assert quota.admit(user, 1, rate_limit=0, quota=-1) == i + 1
+
+
+def test_quota():
+    user = utils.user.create_user()
+    for _ in range(3):
+        quota.admit(user, 1, rate_limit=0, quota=3)
+    with pytest.raises(quota.QuotaExceeded):
+        quota.admit(user, 1, rate_limit=0, quota=3)
+    assert quota.submit_count(user, 1) == 3
+    # quota is counted per problem
+    assert quota.admit(user, 2, rate_limit=0, quota=3) == 1
+
+
+def test_quota_exceeded_returns_rate_token():
+    user = utils.user.create_user()
+    quota.admit(user, 1, rate_limit=0, quota=1)
+    with pytest.raises(quota.QuotaExceeded):
+        quota.admit(user, 1, rate_limit=60, quota=1)
+    assert quota.admit(user, 2, rate_limit=60, quota=1) == 1
+
+
+def test_failed_creation_is_refunded(forge_client, monkeypatch):
+    teacher = utils.user.create_user(role=1)
+    student = utils.user.create_user(role=2)
+    course = utils.course.create_course(teacher=teacher, students=[student])
+    problem = utils.problem.create_problem(course=course, owner=teacher)
+
+    def add(*args, **kwargs):
+        raise TestCaseNotFound(problem.problem_id)
+
+    monkeypatch.setattr(Submission, 'add', add)
+    client = forge_client(student.username)
+    rv = client.post(
+        '/submission',
+        json={
+            'problemId': problem.problem_id,
+            'languageType': 0,
+        },
+    )
+    assert rv.status_code == 403, rv.json()
+    assert quota.submit_count(student, problem.problem_id) == 0
+    # the rate token is back as well
+    assert quota.admit(student, problem.problem_id, rate_limit=60,
+                       quota=1) == 1
+
+
+def test_rebuild_lost_counter():
+    user = utils.user.create_user()
+    user.update(last_submit=datetime.now(), problem_submission={'1': 4})
+    user.reload()
+    assert quota.submit_count(user, 1) == 4
+    assert quota.admit(user, 1, rate_limit=0, quota=-1) == 5
+    assert quota.submit_count(user, 1) == 5
+
+
+def test_old_counts_are_ignored():
+    user = utils.user.create_user()
+    user.update(
+        last_submit=datetime(2000, 1, 1),
+        problem_submission={'1': 4},
+    )
+    user.reload()
+    assert quota.submit_count(user, 1) == 0
+    assert quota.admit(user, 1, rate_limit=0, quota=-1) == 1
+
+
+def test_flush_submitter():
+    problem = utils.problem.create_problem()
+    assert quota.flush_submitter() == 0
+    for _ in range(3):
+        quota.add_submitter(problem.problem_id)
+    assert problem.reload().submitter == 0
+    assert quota.flush_submitter() == 1
+    assert problem.reload().submitter == 3
+    assert quota.flush_submitter() == 0
+    assert problem.reload().submitter == 3
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from tests import utils
 from mongo import Submission, User
 import secrets
+import mongomock.collection
 
 
 def setup_function(_):
@@ -165,3 +166,92 @@ def test_query_with_lang():
     for lang in range(0, 3):
         results = Submission.filter(user=admin, language_type=lang)
         assert len(results) == expected_count
+
+
+def test_rows_load_summary_only():
+    admin = utils.user.create_user(role=User.engine.Role.ADMIN)
+    problem = utils.problem.create_problem(
+        owner=admin,
+        course='Public',
+        test_case_info=utils.problem.create_test_case_info(
+            language=0,
+            task_len=2,
+            case_count_range=(20, 20),
+        ),
+    )
+    submission = utils.submission.create_submission(
+        user=admin,
+        problem=problem,
+        status=0,
+    )
+    utils.submission.add_fake_output(submission)
+    (row, ) = Submission.filter(user=admin)
+    # case results are left in the database
+    assert row.tasks == []
+    assert row.to_dict() == Submission(submission.id).to_dict()
+    (row, ) = Submission.filter(user=admin, fields=None)
+    assert len(row.tasks) == 2
+
+
+def test_rows_load_users_at_once(monkeypatch):
+    admin = utils.user.create_user(role=User.engine.Role.ADMIN)
+    problem = utils.problem.create_problem(owner=admin, course='Public')
+    users = [utils.user.create_user() for _ in range(3)]
+    for _ in range(4):
+        for user in users:
+            utils.submission.create_submission(user=user, problem=problem)
+    rows = Submission.filter(user=admin)
+    finds = []
+    orig = mongomock.collection.Collection.find
+
+    def find(self, *args, **kwargs):
+        if self.name == 'user':
+            finds.append(args)
+        return orig(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'find', find)
+    dicts = Submission.to_dicts(rows)
+    assert len(finds) == 1
+    monkeypatch.setattr(mongomock.collection.Collection, 'find', orig)
+    assert dicts == [Submission(row.id).to_dict() for row in rows]
+
+
+@pytest.mark.parametrize('sort_by', [None, 'runTime', 'memoryUsage'])
+def test_cursor_walks_every_submission(sort_by):
+    admin = utils.user.create_user(role=User.engine.Role.ADMIN)
+    problem = utils.problem.create_problem(owner=admin, course='Public')
+    timestamp = time.time()
+    for i in range(10):
+        utils.submission.create_submission(
+            user=admin,
+            problem=problem,
+            # ties are broken by id
+            timestamp=timestamp + i // 3,
+            exec_time=i % 4,
+            memory_usage=i % 3,
+            status=1,
+        )
+    expected = [s.id for s in Submission.filter(user=admin, sort_by=sort_by)]
+    ids, cursor = [], None
+    while True:
+        page = Submission.filter(
+            user=admin,
+            count=4,
+            sort_by=sort_by,
+            cursor=cursor,
+        )
+        ids += [s.id for s in page]
+        if len(page) < 4:
+            break
+        cursor = Submission.encode_cursor(page[-1], sort_by)
+    assert ids == expected
+
+
+def test_invalid_cursor():
+    admin = utils.user.create_user(role=User.engine.Role.ADMIN)
+    problem = utils.problem.create_problem(owner=admin, course='Public')
+    submission = utils.submission.create_submission(user=admin,
+                                                    problem=problem)
+    for cursor in ('nope', Submission.encode_cursor(submission, 'runTime')):
+        with pytest.raises(ValueError, match='invalid cursor'):
+            Submission.filter(user=admin, cursor=cursor)
@@ -0,0 +1,138 @@
+import time
+
+import mongomock.collection
+
+from mongo import Homework
+from tests import utils
+
+
+def setup_function(_):
+    utils.drop_db()
+
+
+def teardown_function(_):
+    utils.drop_db()
+
+
+def test_keep_high_score():
+    _, (student, ), _, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    submissions = [
+        utils.submission.create_submission(user=student,
+                                           problem=problem,
+                                           score=score,
+                                           status=status)
+        for score, status in ((30, 1), (80, 1), (50, 1), (80, 3))
+    ]
+    for submission in submissions:
+        submission.finish_judging()
+    stat = utils.homework.get_problem_status(homework, student, problem)
+    assert stat['submissionIds'] == [s.id for s in submissions]
+    assert stat['rawScore'] == 80
+    # a tie takes the status of the latter
+    assert (stat['score'], stat['problemStatus']) == (80, 3)
+
+
+def test_other_cells_are_untouched():
+    _, students, _, problem, (homework, ) = \
+        utils.homework.create_course_problem(student_count=2, hw_count=1)
+    utils.submission.create_submission(user=students[0],
+                                       problem=problem,
+                                       score=100,
+                                       status=0).finish_judging()
+    assert utils.homework.get_problem_status(homework, students[1], problem) == \
+        Homework.default_problem_status()
+
+
+def test_stale_homework_does_not_overwrite():
+    _, (student, ), _, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    first = utils.submission.create_submission(user=student,
+                                               problem=problem,
+                                               score=100,
+                                               status=0)
+    second = utils.submission.create_submission(user=student,
+                                                problem=problem,
+                                                score=40,
+                                                status=1)
+    # both results are judged before either homework update lands
+    first.problem.homeworks
+    second.problem.homeworks
+    first.finish_judging()
+    second.finish_judging()
+    stat = utils.homework.get_problem_status(homework, student, problem)
+    assert stat['submissionIds'] == [first.id, second.id]
+    assert (stat['score'], stat['problemStatus']) == (100, 0)
+
+
+def test_write_size_is_constant(monkeypatch):
+    updates = []
+    for op in ('update_one', 'update_many', 'replace_one'):
+        orig = getattr(mongomock.collection.Collection, op)
+
+        def wrapper(self, filter, update, *args, _orig=orig, **kwargs):
+            updates.append((self.name, update))
+            return _orig(self, filter, update, *args, **kwargs)
+
+        monkeypatch.setattr(mongomock.collection.Collection, op, wrapper)
+    _, students, _, problem, (homework, ) = \
+        utils.homework.create_course_problem(student_count=20, hw_count=1)
+    submission = utils.submission.create_submission(user=students[0],
+                                                    problem=problem,
+                                                    score=100,
+                                                    status=0)
+    updates.clear()
+    submission.finish_judging()
+    # the homework is left alone, one status is updated in place
+    assert [name for name, _ in updates if name != 'user'] == [
+        'homework_problem_status',
+    ]
+    update = next(u for name, u in updates if name != 'user')
+    assert all(op.startswith('$') for op in update), update
+
+
+def test_penalty_is_recomputed_on_conflict(monkeypatch):
+    now = time.time()
+    _, (student, ), _, problem, (homework, ) = \
+        utils.homework.create_course_problem(
+            hw_count=1,
+            start=now - 7200,
+            end=now - 3600,
+            penalty='score = score * 0.5',
+        )
+    first = utils.submission.create_submission(user=student,
+                                               problem=problem,
+                                               score=60,
+                                               status=1)
+    second = utils.submission.create_submission(user=student,
+                                                problem=problem,
+                                                score=100,
+                                                status=0)
+    orig = Homework.do_penalty
+    raced = []
+
+    def do_penalty(self, submission, stat):
+        # the other result lands between the read and the write
+        if not raced:
+            raced.append(True)
+            first.finish_judging()
+        return orig(self, submission, stat)
+
+    monkeypatch.setattr(Homework, 'do_penalty', do_penalty)
+    second.finish_judging()
+    stat = utils.homework.get_problem_status(homework, student, problem)
+    assert stat['submissionIds'] == [first.id, second.id]
+    # 60 * 0.5 from the first, then (100 - 60) * 0.5 from the second
+    assert stat['rawScore'] == 100
+    assert stat['score'] == 50
+
+
+def test_not_in_homework():
+    *_, problem, (homework, ) = \
+        utils.homework.create_course_problem(hw_count=1)
+    outsider = utils.user.create_user(role=2)
+    utils.submission.create_submission(user=outsider,
+                                       problem=problem,
+                                       score=100,
+                                       status=0).finish_judging()
+    assert Homework(homework.id).get_student_status(outsider.username) is None
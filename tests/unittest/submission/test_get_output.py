@@ -1,10 +1,13 @@
 import pytest
 import time
 import io
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZipFile
+from minio import Minio
 from datetime import datetime, timedelta
 from tests import utils
+from config import settings
 from mongo import Submission, User
+from mongo.submission import CaseOutputStream, OutputExpired
 
 
 def setup_function(_):
@@ -66,3 +69,168 @@ class TestSubmissionGetOutput:
         with pytest.raises(AttributeError) as err:
             submission.get_single_output(0, 0)
         assert str(err.value) == 'The submission is still in pending'
+
+    def test_read_expired_output(self, app):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem(
+            test_case_info=utils.problem.create_test_case_info(
+                language=0,
+                task_len=1,
+            ))
+        submission = utils.submission.create_judged_submission(
+            user=user,
+            problem=problem,
+        )
+        submission.delete_output()
+        with pytest.raises(OutputExpired):
+            submission.get_single_output(0, 0)
+        with pytest.raises(OutputExpired):
+            submission.open_output(0, 0, 'stdout')
+
+
+class TestSubmissionDetailedResult:
+
+    def _judged(self, stdout, task_len=1):
+        problem = utils.problem.create_problem(
+            test_case_info=utils.problem.create_test_case_info(
+                language=0,
+                task_len=task_len,
+                case_count_range=(2, 2),
+            ))
+        submission = utils.submission.create_submission(
+            user=utils.user.create_user(),
+            problem=problem,
+            status=0,
+        )
+        submission.process_result([[{
+            'exitCode': 0,
+            'status': 'AC',
+            'stdout': stdout,
+            'stderr': 'err',
+            'execTime': 10,
+            'memoryUsage': 1024,
+        } for _ in range(2)] for _ in range(task_len)])
+        return submission.reload()
+
+    def test_output_is_truncated(self, app):
+        submission = self._judged('a' * 10000)
+        tasks = submission.get_detailed_result()
+        case = tasks[0]['cases'][0]
+        assert case['stdout'] == 'a' * Submission.OUTPUT_PREVIEW_SIZE
+        assert case['stdoutSize'] == 10000
+        assert case['stderr'] == 'err'
+        assert case['stderrSize'] == 3
+        assert 'output' not in case
+        # the full output is still there
+        assert submission.get_single_output(0, 0)['stdout'] == 'a' * 10000
+
+    def test_cut_character_is_dropped(self, app):
+        submission = self._judged('中文')
+        tasks = submission.get_detailed_result(preview_size=4)
+        assert tasks[0]['cases'][0]['stdout'] == '中'
+        assert tasks[0]['cases'][0]['stdoutSize'] == 6
+
+    def _count_gets(self, monkeypatch):
+        gets = []
+        orig_get = Minio.get_object
+
+        def get_object(self, *args, **kwargs):
+            gets.append(args[1])
+            return orig_get(self, *args, **kwargs)
+
+        monkeypatch.setattr(Minio, 'get_object', get_object)
+        return gets
+
+    def test_inline_preview_needs_no_minio(self, app, monkeypatch):
+        submission = self._judged('out', task_len=3)
+        gets = self._count_gets(monkeypatch)
+        tasks = submission.get_detailed_result()
+        assert gets == []
+        assert [c['stdout'] for t in tasks for c in t['cases']] == ['out'] * 6
+        assert all('stdoutPreview' not in c for t in tasks for c in t['cases'])
+
+    def test_old_output_is_read_by_range(self, app, monkeypatch):
+        monkeypatch.setattr(settings, 'OUTPUT_CODEC', 'stored')
+        submission = self._judged('a' * 10**6, task_len=3)
+        # results judged before previews were stored inline
+        for i in range(3):
+            for j in range(2):
+                submission.update(
+                    **{
+                        f'unset__tasks__{i}__cases__{j}__{k}': True
+                        for k in ('stdout_preview', 'stderr_preview',
+                                  'stdout_size', 'stderr_size')
+                    })
+        submission.reload()
+        lengths = []
+        orig_get = Minio.get_object
+
+        def get_object(self, *args, **kwargs):
+            lengths.append(kwargs.get('length'))
+            return orig_get(self, *args, **kwargs)
+
+        monkeypatch.setattr(Minio, 'get_object', get_object)
+        tasks = submission.get_detailed_result()
+        cases = [c for t in tasks for c in t['cases']]
+        assert all(c['stdout'] == 'a' * Submission.OUTPUT_PREVIEW_SIZE
+                   for c in cases)
+        assert all(c['stdoutSize'] == 10**6 for c in cases)
+        assert all(c['stderr'] == 'err' for c in cases)
+        # only the heads are fetched, never a whole output
+        assert lengths
+        assert all(0 < n <= 10 * 1024 for n in lengths)
+
+    def test_result_hides_output(self, app):
+        submission = self._judged('out')
+        case = submission.get_result()[0]['cases'][0]
+        assert not {'stdout', 'stdoutPreview', 'stdoutSize'} & case.keys()
+
+
+class TestSubmissionOpenOutput:
+
+    def test_range_read_fetches_only_the_range(self, app, monkeypatch):
+        monkeypatch.setattr(settings, 'OUTPUT_CODEC', 'stored')
+        problem = utils.problem.create_problem(
+            test_case_info=utils.problem.create_test_case_info(
+                language=0,
+                task_len=1,
+                case_count_range=(1, 1),
+            ))
+        submission = utils.submission.create_submission(
+            user=utils.user.create_user(),
+            problem=problem,
+            status=0,
+        )
+        submission.process_result([[{
+            'exitCode': 0,
+            'status': 'AC',
+            'stdout': 'x' * 10**6 + 'tail',
+            'stderr': '',
+            'execTime': 10,
+            'memoryUsage': 1024,
+        }]])
+        submission.reload()
+        lengths = []
+        orig_get = Minio.get_object
+
+        def get_object(self, *args, **kwargs):
+            lengths.append(kwargs.get('length'))
+            return orig_get(self, *args, **kwargs)
+
+        monkeypatch.setattr(Minio, 'get_object', get_object)
+        output = submission.open_output(0, 0, 'stdout')
+        assert output.size == 10**6 + 4
+        assert b''.join(output.iter_bytes(10**6, 10**6 + 4)) == b'tail'
+        output.close()
+        # the central directory, a local header and the range itself
+        assert all(0 < n <= CaseOutputStream.CHUNK_SIZE for n in lengths)
+
+    def test_compressed_member(self):
+        buf = io.BytesIO()
+        with ZipFile(buf, 'w', compression=ZIP_DEFLATED) as zf:
+            zf.writestr('stdout', 'hello world' * 100)
+            zf.writestr('stderr', '')
+        output = CaseOutputStream(buf, 'stdout')
+        assert output.size == 1100
+        assert b''.join(output.iter_bytes(6, 11)) == b'world'
+        assert b''.join(output.iter_bytes()) == b'hello world' * 100
@@ -70,9 +70,9 @@ def test_penalty(client, app):
         score=100,
     )
     submission.finish_judging()
-    assert Homework.get_by_name('Test',
-                                'test').student_status[student.username][str(
-                                    problem.id)]['score'] == 80
+    assert Homework(Homework.get_by_name(
+        'Test', 'test')).student_status[student.username][str(
+            problem.id)]['score'] == 80
 
 
 def test_penalty2(client, app):
@@ -111,11 +111,12 @@ def test_penalty2(client, app):
         score=100,
     )
     submission.finish_judging()
-    assert Homework.get_by_name(
-        'Test', 'test').student_status[student.username][str(
-            problem.id)]['score'] == 85 and Homework.get_by_name(
-                'Test', 'test').student_status[student.username][str(
-                    problem.id)]['rawScore'] == 100
+    assert Homework(Homework.get_by_name(
+        'Test', 'test')).student_status[student.username][str(
+            problem.id)]['score'] == 85 and Homework(
+                Homework.get_by_name(
+                    'Test', 'test')).student_status[student.username][str(
+                        problem.id)]['rawScore'] == 100
 
 
 def test_no_penalty(client, app):
@@ -146,9 +147,9 @@ def test_no_penalty(client, app):
         score=100,
     )
     submission.finish_judging()
-    assert Homework.get_by_name('Test',
-                                'test').student_status[student.username][str(
-                                    problem.id)]['score'] == 0
+    assert Homework(Homework.get_by_name(
+        'Test', 'test')).student_status[student.username][str(
+            problem.id)]['score'] == 0
 
 
 def test_penalty_in_time(client, app):
@@ -179,6 +180,6 @@ def test_penalty_in_time(client, app):
         score=100,
     )
     submission.finish_judging()
-    assert Homework.get_by_name('Test',
-                                'test').student_status[student.username][str(
-                                    problem.id)]['score'] == 100
+    assert Homework(Homework.get_by_name(
+        'Test', 'test')).student_status[student.username][str(
+            problem.id)]['score'] == 100
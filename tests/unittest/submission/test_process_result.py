@@ -0,0 +1,154 @@
+import io
+import pytest
+from zipfile import ZipFile
+from minio import Minio
+from tests import utils
+from config import settings
+from mongo.submission import OUTPUT_CODECS
+from mongo.utils import MinioClient
+
+
+def setup_function(_):
+    utils.drop_db()
+
+
+def teardown_function(_):
+    utils.drop_db()
+
+
+def _submission(task_len=2, case_count=3):
+    problem = utils.problem.create_problem(
+        test_case_info=utils.problem.create_test_case_info(
+            language=0,
+            task_len=task_len,
+            case_count_range=(case_count, case_count),
+        ))
+    return utils.submission.create_submission(
+        user=utils.user.create_user(),
+        problem=problem,
+        status=0,
+    )
+
+
+def _result(submission, outputs):
+    return [[{
+        'exitCode': 0,
+        'status': 'AC',
+        'stdout': outputs[i][j],
+        'stderr': f'err{i}{j}',
+        'execTime': 10,
+        'memoryUsage': 1024,
+    } for j in range(len(outputs[i]))] for i in range(len(outputs))]
+
+
+class TestSubmissionProcessResult:
+
+    def test_outputs_are_uploaded_as_one_archive(self, app, monkeypatch):
+        submission = _submission()
+        puts = []
+        orig_put = Minio.put_object
+
+        def put_object(self, *args, **kwargs):
+            puts.append(args[1])
+            return orig_put(self, *args, **kwargs)
+
+        monkeypatch.setattr(Minio, 'put_object', put_object)
+        utils.submission.add_fake_output(submission)
+        assert len(puts) == 1
+        cases = [c for t in submission.tasks for c in t.cases]
+        assert {c.output_minio_path for c in cases} == {puts[0]}
+        # the cases are laid out back to back
+        offset = 0
+        for case in cases:
+            assert case.output_offset == offset
+            offset += case.output_size
+
+    def test_case_is_read_by_range(self, app, monkeypatch):
+        submission = _submission()
+        outputs = [[f'out{i}{j}' * (i + j + 1) for j in range(3)]
+                   for i in range(2)]
+        submission.process_result(_result(submission, outputs))
+        submission.reload()
+        gets = []
+        orig_get = Minio.get_object
+
+        def get_object(self, *args, **kwargs):
+            gets.append(kwargs)
+            return orig_get(self, *args, **kwargs)
+
+        monkeypatch.setattr(Minio, 'get_object', get_object)
+        for i in range(2):
+            for j in range(3):
+                assert submission.get_single_output(i, j) == {
+                    'stdout': outputs[i][j],
+                    'stderr': f'err{i}{j}',
+                }
+        case = submission.tasks[1].cases[2]
+        assert gets[-1] == {
+            'offset': case.output_offset,
+            'length': case.output_size,
+        }
+
+    def test_single_case_object_is_read_whole(self, app):
+        submission = _submission(task_len=1, case_count=1)
+        utils.submission.add_fake_output(submission)
+        case = submission.tasks[0].cases[0]
+        # outputs migrated from gridfs are one object per case
+        data = submission._get_output_raw(case).getvalue()
+        path = submission._generate_output_minio_path(0, 0)
+        minio_client = MinioClient()
+        minio_client.client.put_object(
+            minio_client.bucket,
+            path,
+            io.BytesIO(data),
+            len(data),
+        )
+        submission.update(
+            set__tasks__0__cases__0__output_minio_path=path,
+            unset__tasks__0__cases__0__output_offset=True,
+            unset__tasks__0__cases__0__output_size=True,
+        )
+        submission.reload()
+        assert submission.tasks[0].cases[0].output_size is None
+        assert submission.get_single_output(0, 0) == {
+            'stdout': 'out',
+            'stderr': 'err',
+        }
+
+    def test_failed_upload_is_raised(self, app, monkeypatch):
+        submission = _submission()
+
+        def put_object(self, *args, **kwargs):
+            raise ConnectionError('minio is down')
+
+        monkeypatch.setattr(Minio, 'put_object', put_object)
+        with pytest.raises(ConnectionError):
+            utils.submission.add_fake_output(submission)
+        # nothing is recorded without the outputs
+        assert submission.reload().tasks == []
+
+    @pytest.mark.parametrize('codec', ['stored', 'deflate', 'bzip2', 'lzma'])
+    def test_output_codec(self, app, monkeypatch, codec):
+        monkeypatch.setattr(settings, 'OUTPUT_CODEC', codec)
+        submission = _submission(task_len=1, case_count=1)
+        outputs = [['out' * 1000]]
+        submission.process_result(_result(submission, outputs))
+        submission.reload()
+        case = submission.tasks[0].cases[0]
+        with ZipFile(submission._get_output_raw(case)) as zf:
+            assert zf.getinfo('stdout').compress_type == OUTPUT_CODECS[codec]
+        assert submission.get_single_output(0, 0)['stdout'] == 'out' * 1000
+
+    def test_codecs_can_be_mixed(self, app, monkeypatch):
+        submission = _submission(task_len=1, case_count=1)
+        monkeypatch.setattr(settings, 'OUTPUT_CODEC', 'stored')
+        utils.submission.add_fake_output(submission)
+        # the codec is recorded in each zip, so switching it keeps older
+        # outputs readable
+        monkeypatch.setattr(settings, 'OUTPUT_CODEC', 'lzma')
+        assert submission.get_single_output(0, 0) == {
+            'stdout': 'out',
+            'stderr': 'err',
+        }
+        assert b''.join(submission.open_output(
+            0, 0, 'stdout').iter_bytes()) == b'out'
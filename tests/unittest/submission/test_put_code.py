@@ -0,0 +1,210 @@
+import io
+import tempfile
+import time
+import pytest
+from datetime import timedelta
+from hashlib import sha256
+from zipfile import ZipFile
+from minio.error import S3Error
+from tests import utils
+from mongo import Submission, engine
+from mongo.utils import MinioClient
+
+
+def setup_function(_):
+    utils.drop_db()
+
+
+def teardown_function(_):
+    utils.drop_db()
+
+
+def _zip(source: str) -> bytes:
+    code = io.BytesIO()
+    with ZipFile(code, 'x') as zf:
+        zf.writestr('main.c', source)
+    return code.getvalue()
+
+
+class TestSubmissionPutCode:
+
+    def test_put_code_records_checksum(self, app):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        submission = utils.submission.create_submission(
+            user=user,
+            problem=problem,
+        )
+        code = _zip('int main() { return 0; }\n')
+        # a spooled file rolled over to disk, like a large upload
+        with tempfile.SpooledTemporaryFile(max_size=16) as f:
+            f.write(code)
+            f.seek(0)
+            assert submission.submit(f)
+        submission.reload()
+        assert submission.code_checksum == sha256(code).hexdigest()
+        assert b''.join(submission._get_code_raw()) == code
+
+    def test_has_code_does_not_download(self, app, monkeypatch):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        submission = utils.submission.create_submission(
+            user=user,
+            problem=problem,
+        )
+
+        def fail(*args, **kwargs):
+            raise AssertionError('code should not be downloaded')
+
+        monkeypatch.setattr(Submission, '_get_code_raw', fail)
+        assert submission.has_code()
+
+    def test_has_no_code(self, app):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        submission = Submission.add(
+            problem_id=problem.problem_id,
+            username=user.username,
+            lang=0,
+        )
+        assert not submission.has_code()
+
+    def test_migrate_gridfs_code(self, app):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        submission = Submission.add(
+            problem_id=problem.problem_id,
+            username=user.username,
+            lang=0,
+        )
+        code = _zip('int main() { return 1; }\n')
+        submission.obj.code.put(io.BytesIO(code))
+        submission.obj.save()
+        submission.reload()
+        submission.migrate_code_to_minio()
+        submission.reload()
+        assert submission.code_checksum == sha256(code).hexdigest()
+        assert submission.code.grid_id is None
+        assert b''.join(submission._get_code_raw()) == code
+
+
+class TestSubmissionCodeDedup:
+
+    def _submit(self, user, problem, code: bytes):
+        submission = Submission.add(
+            problem_id=problem.problem_id,
+            username=user.username,
+            lang=0,
+        )
+        assert submission.submit(io.BytesIO(code))
+        return submission.reload()
+
+    def test_identical_code_is_stored_once(self, app, monkeypatch):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        code = _zip('int main() { return 2; }\n')
+        first = self._submit(user, problem, code)
+        puts = []
+        minio_client = MinioClient()
+        orig_put = minio_client.client.__class__.put_object
+
+        def put_object(self, *args, **kwargs):
+            puts.append(args[1])
+            return orig_put(self, *args, **kwargs)
+
+        monkeypatch.setattr(minio_client.client.__class__, 'put_object',
+                            put_object)
+        second = self._submit(user, problem, code)
+        assert puts == []
+        assert first.code_minio_path == second.code_minio_path
+        assert engine.CodeObject.objects.get(
+            pk=first.code_checksum).ref_count == 2
+        assert second.get_main_code() == 'int main() { return 2; }\n'
+
+    def test_object_is_pruned_after_last_release(self, app):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        code = _zip('int main() { return 3; }\n')
+        first = self._submit(user, problem, code)
+        second = self._submit(user, problem, code)
+        checksum = first.code_checksum
+        first.delete()
+        assert Submission.prune_code_objects(grace=timedelta(0)) == 0
+        second.delete()
+        # still within the grace period
+        assert Submission.prune_code_objects() == 0
+        assert Submission.prune_code_objects(grace=timedelta(0)) == 1
+        assert not engine.CodeObject.objects(pk=checksum)
+        minio_client = MinioClient()
+        with pytest.raises(S3Error):
+            minio_client.client.stat_object(
+                minio_client.bucket,
+                Submission._generate_code_minio_path(checksum),
+            )
+
+    def test_upload_takes_back_released_object(self, app):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        code = _zip('int main() { return 4; }\n')
+        first = self._submit(user, problem, code)
+        first.delete()
+        second = self._submit(user, problem, code)
+        assert Submission.prune_code_objects(grace=timedelta(0)) == 0
+        assert second.get_main_code() == 'int main() { return 4; }\n'
+
+    def test_failed_upload_drops_reference(self, app, monkeypatch):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        code = _zip('int main() { return 6; }\n')
+        minio_client = MinioClient()
+        orig_put = minio_client.client.__class__.put_object
+
+        def put_object(self, *args, **kwargs):
+            raise ConnectionError('minio is down')
+
+        monkeypatch.setattr(minio_client.client.__class__, 'put_object',
+                            put_object)
+        submission = Submission.add(
+            problem_id=problem.problem_id,
+            username=user.username,
+            lang=0,
+        )
+        with pytest.raises(ConnectionError):
+            submission.submit(io.BytesIO(code))
+        checksum = sha256(code).hexdigest()
+        code_object = engine.CodeObject.objects.get(pk=checksum)
+        assert code_object.ref_count == 0
+        assert not code_object.stored
+        # released_at is stored in milliseconds
+        time.sleep(0.01)
+        assert Submission.prune_code_objects(grace=timedelta(0)) == 1
+        # a later upload stores it again
+        monkeypatch.setattr(minio_client.client.__class__, 'put_object',
+                            orig_put)
+        assert submission.submit(io.BytesIO(code))
+        assert submission.reload().get_main_code() == \
+            'int main() { return 6; }\n'
+
+    def test_consistency_is_hash_comparison(self, app, monkeypatch):
+        user = utils.user.create_user()
+        problem = utils.problem.create_problem()
+        submission = Submission.add(
+            problem_id=problem.problem_id,
+            username=user.username,
+            lang=0,
+        )
+        code = _zip('int main() { return 5; }\n')
+        submission.obj.code.put(io.BytesIO(code))
+        submission.obj.save()
+        submission.reload()
+        submission.update(
+            code_minio_path=submission._put_code(submission.code)[0],
+            code_checksum=sha256(code).hexdigest(),
+        )
+        submission.reload()
+
+        def fail(*args, **kwargs):
+            raise AssertionError('code should not be downloaded')
+
+        monkeypatch.setattr(Submission, '_get_code_raw', fail)
+        assert submission._check_code_consistency()
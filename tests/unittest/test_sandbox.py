@@ -0,0 +1,48 @@
+import asyncio
+import time
+import httpx
+from mongo import engine
+from mongo import sandbox
+
+
+def test_probe_all_is_bounded_by_deadline():
+    sandboxes = [
+        engine.Sandbox(name=f'sb{i}', url=f'http://sb{i}:6666', token='tok')
+        for i in range(5)
+    ]
+
+    async def handler(request):
+        if 'sb0' in str(request.url):
+            await asyncio.sleep(10)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={'load': 0})
+
+    start = time.monotonic()
+    resps = sandbox.probe_all(
+        sandboxes,
+        deadline=0.5,
+        transport=httpx.MockTransport(handler),
+    )
+    # probes run concurrently, and the hanging one is cut at the deadline
+    assert time.monotonic() - start < 1.5
+    assert isinstance(resps[0], httpx.TimeoutException)
+    assert all(r.status_code == 200 for r in resps[1:])
+
+
+def test_probe_all_reports_errors():
+    sandboxes = [
+        engine.Sandbox(name=f'sb{i}', url=f'http://sb{i}:6666', token='tok')
+        for i in range(2)
+    ]
+
+    def handler(request):
+        if 'sb0' in str(request.url):
+            raise httpx.ConnectError('refused', request=request)
+        return httpx.Response(503, text='down')
+
+    resps = sandbox.probe_all(
+        sandboxes,
+        transport=httpx.MockTransport(handler),
+    )
+    assert isinstance(resps[0], httpx.ConnectError)
+    assert resps[1].status_code == 503
@@ -1,9 +1,17 @@
 import secrets
-from typing import Optional, Union, List, Dict, Any
+import time
+from typing import Optional, Union, List, Dict, Any, NamedTuple
 from mongo import *
 from tests import utils
+from . import course as course_lib
+from . import problem as problem_lib
+from . import user as user_lib
 
-__all__ = ('add_homework', )
+__all__ = (
+    'add_homework',
+    'create_course_problem',
+    'get_problem_status',
+)
 
 
 def add_homework(
@@ -34,3 +42,66 @@ def add_homework(
         problem_ids=problem_ids,
         scoreboard_status=scoreboard_status,
     )
+
+
+class CourseProblem(NamedTuple):
+    teacher: User
+    students: List[User]
+    course: Course
+    problem: Problem
+    homeworks: List[Homework]
+
+
+def create_course_problem(
+    *,
+    student_count: int = 1,
+    hw_count: int = 0,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    penalty: Optional[str] = None,
+) -> CourseProblem:
+    '''
+    A course with a teacher and students, a problem of one task in it, and
+    `hw_count` homeworks containing the problem. Homeworks are open from an
+    hour ago to an hour later by default.
+    '''
+    teacher = user_lib.create_user(role=1)
+    students = [user_lib.create_user(role=2) for _ in range(student_count)]
+    course = course_lib.create_course(teacher=teacher, students=students)
+    problem = problem_lib.create_problem(
+        course=course,
+        owner=teacher,
+        test_case_info=problem_lib.create_test_case_info(
+            language=0,
+            task_len=1,
+        ),
+    )
+    now = time.time()
+    homeworks = [
+        Homework(
+            add_homework(
+                user=teacher,
+                course=course.course_name,
+                hw_name=f'hw{i}',
+                problem_ids=[problem.problem_id],
+                markdown='',
+                scoreboard_status=0,
+                start=now - 3600 if start is None else start,
+                end=now + 3600 if end is None else end,
+                penalty=penalty,
+            ).id) for i in range(hw_count)
+    ]
+    return CourseProblem(teacher, students, course, problem, homeworks)
+
+
+def get_problem_status(
+    homework: Homework,
+    user: User,
+    problem: Problem,
+) -> Dict[str, Any]:
+    '''
+    the student's status of a problem in the homework, read again from the
+    database
+    '''
+    return Homework(homework.id).get_student_status(user.username)[str(
+        problem.problem_id)]
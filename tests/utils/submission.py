@@ -6,9 +6,13 @@ from datetime import datetime
 from random import randint, choice
 from typing import Optional, Union
 from mongo import *
+from mongo import counter
 from mongo.utils import drop_none
 
-__all__ = ('create_submission', )
+__all__ = (
+    'create_submission',
+    'create_judged_submission',
+)
 
 
 def create_submission(
@@ -66,6 +70,8 @@ def create_submission(
             arc.writestr(f'main.{ext_name[lang]}', code)
             tmp.seek(0)
         submission.submit(code_file=tmp)
+    # the judge result is forged, count it as a judge would
+    counter.move(problem.id, user.username, -1, status)
     submission.update(**drop_none({
         'status': status,
         'score': score,
@@ -93,3 +99,23 @@ def add_fake_output(submission: Submission):
               for t in submission.problem.test_case.tasks]
     submission.process_result(result)
     submission.reload()
+
+
+def create_judged_submission(
+    *,
+    user: Union[User, str],
+    problem: Union[Problem, int],
+    status: int = 0,
+    **ks,
+) -> Submission:
+    '''
+    `create_submission` with the outputs of its result stored as well
+    '''
+    submission = create_submission(
+        user=user,
+        problem=problem,
+        status=status,
+        **ks,
+    )
+    add_fake_output(submission)
+    return submission